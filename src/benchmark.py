@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from simulation.BaseSimulation import *
+from simulation.PSimulation import *
+from simulation.VectorSimulation import VectorSimulation
+from simulation.KernelSimulation import KernelSimulation
+from simulation.TiledSimulation import TiledSimulation
+from simulation.Profiler import PROFILE_SCHEMA
+from results_sink import ResultsSink
+
+# benchmark matrix, every combination is run for every simulation class
+SIM_CLASSES = [DummySim, ProbabilisticSimulation, VectorSimulation, KernelSimulation, TiledSimulation]
+FIELD_SIZES = [(100, 100), (500, 500), (1000, 1000)]
+N_BOTS = [10, 100, 1000]
+P_RESOURCES = [0.01, 0.05]
+TRAIL_PARAMS = [(0.2, 0.1), (1.0, 1.0)]
+
+# small matrix for a quick check before a sweep
+QUICK_MATRIX = {
+    'sim_classes': [DummySim, ProbabilisticSimulation, VectorSimulation, KernelSimulation, TiledSimulation],
+    'field_sizes': [(100, 100), (500, 500)],
+    'n_bots': [10, 500],
+    'p_resources': [0.05],
+    'trail_params': [(0.2, 0.1)],
+}
+
+SETUP_PHASES = ('init_resources', 'patch_resources', 'init_bots')
+
+
+def cases(sim_classes: List[type] = SIM_CLASSES, field_sizes: List = FIELD_SIZES, n_bots: List[int] = N_BOTS,
+    p_resources: List[float] = P_RESOURCES, trail_params: List = TRAIL_PARAMS) -> Iterator[Dict]:
+    """
+    Constructor arguments of every benchmark case, DummySim ignores the trail parameters
+    """
+    for sim_class, field_size, bots, p_resource in itertools.product(sim_classes, field_sizes, n_bots, p_resources):
+        for p_leave_trail, p_follow_trail in trail_params if sim_class is not DummySim else [(None, None)]:
+            case = {'sim_class': sim_class, 'field_size': field_size, 'n_bots': bots, 'p_resource': p_resource,
+                'resource_dist': (10, 2)}
+            if p_leave_trail is not None:
+                case.update(p_leave_trail = p_leave_trail, p_follow_trail = p_follow_trail)
+            yield case
+
+
+def case_name(case: Dict) -> str:
+    name = (f'{case["sim_class"].__name__}/field={case["field_size"][0]}x{case["field_size"][1]}'
+        f'/bots={case["n_bots"]}/p_resource={case["p_resource"]}')
+    if 'p_leave_trail' in case:
+        name += f'/p_leave={case["p_leave_trail"]}/p_follow={case["p_follow_trail"]}'
+    return name
+
+
+def run_case(case: Dict, steps: int, repeat: int = 3, seed: int = 0) -> Dict[str, float]:
+    """
+    Time the setup phases and the steps of one simulation
+    the steps are timed in repeat blocks of steps steps and the fastest block counts
+    """
+    kwargs = {key: value for key, value in case.items() if key != 'sim_class'}
+    sim = case['sim_class'](seed = seed, **kwargs)
+
+    timings = {}
+    for phase in SETUP_PHASES:
+        start = time.perf_counter()
+        getattr(sim, phase)()
+        timings[phase + '_s'] = time.perf_counter() - start
+
+    # a few warm up steps before timing
+    for _ in range(min(10, steps)):
+        sim.simulate_step()
+
+    elapsed = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(steps):
+            sim.simulate_step()
+        elapsed = min(elapsed, time.perf_counter() - start)
+
+    timings['steps'] = steps
+    timings['step_s'] = elapsed / steps
+    timings['steps_per_second'] = steps / elapsed
+    timings['bot_steps_per_second'] = steps * case['n_bots'] / elapsed
+    return timings
+
+
+def peak_memory(case: Dict, steps: int, seed: int = 0) -> int:
+    """
+    Peak bytes allocated while setting up and stepping one simulation
+    measured in a separate run, tracing slows everything down
+    """
+    tracemalloc.start()
+    try:
+        kwargs = {key: value for key, value in case.items() if key != 'sim_class'}
+        sim = case['sim_class'](seed = seed, **kwargs)
+        for phase in SETUP_PHASES:
+            getattr(sim, phase)()
+        for _ in range(steps):
+            sim.simulate_step()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def profile_case(case: Dict, steps: int, sink: ResultsSink, seed: int = 0) -> None:
+    """
+    Run one simulation with profiling and dump its phases and counters to sink
+    """
+    kwargs = {key: value for key, value in case.items() if key != 'sim_class'}
+    sim = case['sim_class'](seed = seed, **kwargs)
+    for phase in SETUP_PHASES:
+        getattr(sim, phase)()
+
+    profiler = sim.enable_profiling()
+    for _ in range(steps):
+        sim.simulate_step()
+    profiler.dump(sink, sim_class = case_name(case))
+
+
+def machine_info() -> Dict[str, str]:
+    return {
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(results: List[Dict], baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Cases whose steps per second dropped more than tolerance below the baseline
+    """
+    baseline_speed = {result['case']: result['steps_per_second'] for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = baseline_speed.get(result['case'])
+        if before and result['steps_per_second'] < (1 - tolerance) * before:
+            regressions.append(f'{result["case"]}: {result["steps_per_second"]:.1f} steps/s, '
+                f'baseline {before:.1f} steps/s ({result["steps_per_second"] / before - 1:+.0%})')
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description = 'Throughput and memory benchmarks of the simulations')
+    parser.add_argument('--steps', type = int, default = 200, help = 'timed steps per case')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'timed blocks per case, the fastest counts')
+    parser.add_argument('--memory-steps', type = int, default = 20, help = 'steps of the memory run, 0 skips it')
+    parser.add_argument('--profile', type = Path, help = 'also dump per phase profiles of every case to this sink')
+    parser.add_argument('--quick', action = 'store_true', help = 'run the small matrix')
+    parser.add_argument('--output', type = Path,
+        default = Path.cwd().parent.joinpath('results').joinpath('benchmark.json'))
+    parser.add_argument('--baseline', type = Path, help = 'earlier output to check for regressions')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'allowed relative slowdown')
+    args = parser.parse_args(argv)
+
+    profile_sink = ResultsSink(args.profile, schema = PROFILE_SCHEMA) if args.profile else None
+
+    results = []
+    for case in cases(**QUICK_MATRIX) if args.quick else cases():
+        result = {'case': case_name(case), 'sim_class': case['sim_class'].__name__,
+            **{key: value for key, value in case.items() if key != 'sim_class'}}
+        result.update(run_case(case, args.steps, args.repeat))
+        if args.memory_steps:
+            result['peak_memory_bytes'] = peak_memory(case, args.memory_steps)
+        if profile_sink is not None:
+            profile_case(case, args.steps, profile_sink)
+        results.append(result)
+        print(f'{result["case"]}: {result["steps_per_second"]:.1f} steps/s, '
+            f'setup {sum(result[phase + "_s"] for phase in SETUP_PHASES):.3f} s', flush = True)
+
+    if profile_sink is not None:
+        profile_sink.close()
+
+    args.output.parent.mkdir(parents = True, exist_ok = True)
+    with open(args.output, 'w') as file:
+        json.dump({'machine': machine_info(), 'results': results}, file, indent = 1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f'regression {regression}')
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
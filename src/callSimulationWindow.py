@@ -2,43 +2,276 @@
 
 import sys
 import time
+import threading
+import numpy as np
 from PyQt5.QtWidgets import QDialog, QApplication
-from PyQt5.QtCore import Qt, QRect
-from PyQt5.QtGui import QPainter, QBrush, QPen
+from PyQt5.QtCore import Qt, QRect, QThread, QTimer
+from PyQt5.QtGui import QPainter, QPen, QImage
 from simulation.BaseSimulation import *
 from simulation.PSimulation import *
+from simulation.TiledSimulation import TiledDummySim
 from gui.SimulationWindow import *
+from trajectory import TrajectoryReader, bot_state, FLAG_HAS_FOOD
+from heatmap import CellRecorder, DensityPyramid
+from simulation.LayoutCache import LayoutCache
 
 # base variables
 field_x = 100
 field_y = 100
 
-field_constant = 100 / field_x
+# simulation engine, VectorSimulation from simulation.VectorSimulation scales to many bots and large fields
+sim_class = ProbabilisticSimulation
+
+# draw a zoomable level of detail heatmap instead of every cell, for large fields
+# and for tiled fields, which have no full grids to draw
+heatmap_view = field_x > 500 or issubclass(sim_class, TiledDummySim)
+
+# repaints per second, the simulation runs independently in its own thread
+fps = 30
+
+# print every bot on each drawn frame
+debug = False
+
+# colors of the field image
+BACKGROUND_COLOR = (255, 255, 255)
+TRAIL_COLOR = (255, 255, 0)
+RESOURCE_COLOR = (0, 0, 255)
+STORAGE_COLOR = (0, 0, 0)
+BOT_COLOR = (255, 0, 0)
+CARRYING_BOT_COLOR = (255, 255, 0)
+
+# with a seed the clustered resource layout is reused from the layout cache on the next start
+seed = None
+layout_cache = LayoutCache(Path.cwd().parent.joinpath('results').joinpath('layouts'))
+
+# replay a trajectory recorded with trajectory.record instead of simulating, None runs live
+replay_path = None
+
+def field_image(sim) -> np.ndarray:
+    """
+    RGB image of the field with one pixel per cell, rows are x and columns y
+    """
+    image = np.empty((sim.field_size_x, sim.field_size_y, 3), dtype = np.uint8)
+    image[:] = BACKGROUND_COLOR
+
+    if hasattr(sim, 'trail_grid'):
+        image[sim.trail_grid > 0] = TRAIL_COLOR
+    image[sim.resource_grid > 0] = RESOURCE_COLOR
+    image[sim.field_size_x // 2, sim.field_size_y // 2] = STORAGE_COLOR
+
+    pos_x, pos_y, flags = bot_state(sim)
+    carrying = (flags & FLAG_HAS_FOOD) != 0
+    image[pos_x[~carrying], pos_y[~carrying]] = BOT_COLOR
+    image[pos_x[carrying], pos_y[carrying]] = CARRYING_BOT_COLOR
+
+    return image
+
+
+class SimulationThread(QThread):
+    """
+    Runs simulate_step in the background, steps_per_second limits the pace
+    and 0 runs as fast as possible. The GUI reads the simulation under lock.
+    """
+
+    def __init__(self, sim, parent = None):
+        super().__init__(parent)
+        self.sim = sim
+        self.lock = threading.Lock()
+        self.steps_per_second = 0
+        self.steps_done = 0
+
+        self.playing = False
+        self.pending_steps = 0
+        self._stopped = False
+        self._wake = threading.Event()
+
+    def run(self):
+        next_step = time.perf_counter()
+        while not self._stopped:
+            if not self.playing and self.pending_steps == 0:
+                self._wake.wait()
+                self._wake.clear()
+                next_step = time.perf_counter()
+                continue
+
+            with self.lock:
+                self.sim.simulate_step()
+                self.steps_done += 1
+                # single steps are queued from the GUI thread
+                if self.pending_steps:
+                    self.pending_steps -= 1
+
+            if self.steps_per_second and self.playing:
+                next_step += 1 / self.steps_per_second
+                delay = next_step - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # behind the target pace, do not catch up in a burst
+                    next_step = time.perf_counter()
+
+    def play(self):
+        self.playing = True
+        self._wake.set()
+
+    def pause(self):
+        self.playing = False
+
+    def step(self):
+        self.playing = False
+        with self.lock:
+            self.pending_steps += 1
+        self._wake.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        self.wait()
+
 
 class MyForm(QDialog):
     def __init__(self):
         super().__init__()
         
-        self.my_sim = ProbabilisticSimulation(field_size = (field_x, field_y), 
-            n_bots=10, p_resource=0.1, resource_dist = (1, 0), p_leave_trail=1, p_follow_trail=1)
-        self.my_sim.init_resources()
-        self.my_sim.patch_resources()
-        self.my_sim.init_bots()
+        if replay_path is None:
+            self.my_sim = sim_class(field_size = (field_x, field_y), 
+                n_bots=10, p_resource=0.1, resource_dist = (1, 0), p_leave_trail=1, p_follow_trail=1, seed = seed)
+            self.my_sim.init_resources()
+            # an unseeded layout is never clustered again, caching it would only fill the cache
+            self.my_sim.patch_resources(cache = layout_cache if seed is not None else None)
+            self.my_sim.init_bots()
+        else:
+            self.my_sim = TrajectoryReader(replay_path)
 
         self.frame_x = 150
         self.frame_y = 150
         
+        # visible square of cells, zoom with the mouse wheel and pan by dragging
+        self.view_x, self.view_y = 0, 0
+        self.view_size = max(self.my_sim.field_size_x, self.my_sim.field_size_y)
+        self.drag_start = None
+        if heatmap_view:
+            self.pyramid = DensityPyramid(self.my_sim.field_size_x, self.my_sim.field_size_y)
+            # the pyramid only reads the cells changed since the last poll
+            self.recorder = CellRecorder(self.my_sim)
+
+        self.image = self.render()
+        self.sim_thread = SimulationThread(self.my_sim, self)
+        self.last_poll = time.perf_counter()
+        self.last_steps_done = 0
+
         self.ui = Ui_ForagingAntsSimulation()
         self.ui.setupUi(self)
         self.ui.startButton.clicked.connect(self.startAnimation)
+        self.ui.stopButton.clicked.connect(self.sim_thread.pause)
+        self.ui.stepButton.clicked.connect(self.sim_thread.step)
+        self.ui.speedSpinBox.valueChanged.connect(self.setSpeed)
+        if replay_path is not None:
+            self.ui.stepSlider.setEnabled(True)
+            self.ui.stepSlider.setMaximum(self.my_sim.n_frames - 1)
+            self.ui.stepSlider.valueChanged.connect(self.seek)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.poll)
+        self.timer.start(1000 // fps)
+        self.sim_thread.start()
         self.show()
 
     def startAnimation(self):
-        
-        self.my_sim.simulate_step()
-        print(self.my_sim.bot_coordinates)
+
+        self.sim_thread.play()
+
+    def setSpeed(self, steps_per_second):
+
+        self.sim_thread.steps_per_second = steps_per_second
+
+    def seek(self, frame):
+
+        with self.sim_thread.lock:
+            self.my_sim.seek(frame)
+        self.poll()
+
+    def render(self):
+        """
+        Image of the field or of the heatmap view, called under the simulation lock
+        """
+        if not heatmap_view:
+            return field_image(self.my_sim)
+
+        self.pyramid.update(self.my_sim, self.recorder)
+        return self.pyramid.render(self.view_x, self.view_y, self.view_size, 500)
+
+    def setView(self, view_x, view_y, view_size):
+
+        field_size = max(self.my_sim.field_size_x, self.my_sim.field_size_y)
+        self.view_size = int(np.clip(view_size, 16, field_size))
+        self.view_x = int(np.clip(view_x, 0, field_size - self.view_size))
+        self.view_y = int(np.clip(view_y, 0, field_size - self.view_size))
+        self.poll()
+
+    def wheelEvent(self, event):
+
+        if not heatmap_view:
+            return
+        # zoom around the cell under the cursor
+        cell_x = self.view_x + (event.y() - self.frame_y) * self.view_size / 500
+        cell_y = self.view_y + (event.x() - self.frame_x) * self.view_size / 500
+        factor = 0.5 if event.angleDelta().y() > 0 else 2
+        self.setView(cell_x - (cell_x - self.view_x) * factor, cell_y - (cell_y - self.view_y) * factor,
+            self.view_size * factor)
+
+    def mousePressEvent(self, event):
+
+        self.drag_start = (event.x(), event.y(), self.view_x, self.view_y)
+
+    def mouseMoveEvent(self, event):
+
+        if not heatmap_view or self.drag_start is None:
+            return
+        start_x, start_y, view_x, view_y = self.drag_start
+        cells_per_pixel = self.view_size / 500
+        self.setView(view_x - (event.y() - start_y) * cells_per_pixel, view_y - (event.x() - start_x) * cells_per_pixel,
+            self.view_size)
+
+    def mouseReleaseEvent(self, event):
+
+        self.drag_start = None
+
+    def poll(self):
+        """
+        Take the latest simulation state, the steps in between are never drawn
+        """
+        with self.sim_thread.lock:
+            self.image = self.render()
+            stored_food = self.my_sim.stored_food
+            if debug:
+                for bot in self.my_sim.bots:
+                    print('\nBot\n')
+                    bot.print_bot()
+            if replay_path is not None:
+                frame = self.my_sim.frame
+                if frame == self.my_sim.n_frames - 1:
+                    self.sim_thread.pause()
+
+        now = time.perf_counter()
+        steps_done = self.sim_thread.steps_done
+        steps_per_second = (steps_done - self.last_steps_done) / (now - self.last_poll)
+        self.last_poll, self.last_steps_done = now, steps_done
+
+        self.ui.storedFoodLabel.setText(f'food: {stored_food}')
+        self.ui.throughputLabel.setText(f'{steps_per_second:,.0f} steps/s')
+        if replay_path is not None:
+            self.ui.stepSlider.blockSignals(True)
+            self.ui.stepSlider.setValue(frame)
+            self.ui.stepSlider.blockSignals(False)
         self.update()
 
+    def closeEvent(self, event):
+
+        self.timer.stop()
+        self.sim_thread.stop()
+        super().closeEvent(event)
+
     def paintEvent(self, event):
 
         qp = QPainter()
@@ -52,39 +285,10 @@ class MyForm(QDialog):
         qp.drawLine(self.frame_x, self.frame_y, self.frame_x, self.frame_y + 500)
         qp.drawLine(self.frame_x + 500, self.frame_y, self.frame_x + 500, self.frame_y + 500)
 
-        # draw pheromone trails
-        if self.my_sim.trails:
-            qp.setBrush(QBrush(Qt.yellow, Qt.SolidPattern))
-            for trail in self.my_sim.trails.keys():
-                qp.drawEllipse(self.frame_x + trail[1] * 5 * field_constant, 
-                    self.frame_y + trail[0] * 5 * field_constant, 2 * field_constant, 2 * field_constant)
-        
-        # draw storage
-        #qp.setBrush(QBrush(Qt.black, Qt.SolidPattern))
-        
-        for bot in self.my_sim.bot_coordinates:
-            qp.drawEllipse(self.frame_x + self.my_sim.field_size_y // 2 * 5 * field_constant, 
-                self.frame_y + self.my_sim.field_size_x // 2 * 5 * field_constant, 5 * field_constant, 5 * field_constant)
-
-        # draw resources
-        qp.setBrush(QBrush(Qt.blue, Qt.SolidPattern))
-        for resource in self.my_sim.resource_dict:
-            qp.drawRect(self.frame_x + resource[1] * 5 * field_constant, 
-                self.frame_y + resource[0] * 5 * field_constant, 3 * field_constant, 3 * field_constant)
-        
-        # draw bots
-        
-        for bot in self.my_sim.bots:
-            print(f'\nBot\n')
-            bot.print_bot()
-            if bot.has_food:
-                qp.setBrush(QBrush(Qt.yellow, Qt.SolidPattern))
-            else:
-                qp.setBrush(QBrush(Qt.red, Qt.SolidPattern))
-            
-            qp.drawEllipse(self.frame_x + bot.pos_y * 5 * field_constant,
-                self.frame_y + bot.pos_x * 5 * field_constant, 3 * field_constant, 3 * field_constant)
-        
+        # draw the latest field image scaled to the frame
+        height, width, _ = self.image.shape
+        qimage = QImage(self.image.data, width, height, 3 * width, QImage.Format_RGB888)
+        qp.drawImage(QRect(self.frame_x, self.frame_y, 500, 500), qimage)
 
         qp.end()
 
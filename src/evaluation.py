@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import inspect
+import os
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import List, Optional, Union
+
+from simulation.BaseSimulation import *
+from simulation.PSimulation import *
+from simulation.LayoutCache import LayoutCache
+from fitness_cache import FitnessCache
+
+
+def run_simulation(x: np.ndarray, seed: int, *, sim_class: type = ProbabilisticSimulation,
+    steps: int = 5_000, patch: bool = False, layout_cache: Optional[Union[str, Path]] = None, **sim_kwargs) -> int:
+    """
+    Run one simulation with p_leave_trail = x[0], p_follow_trail = x[1]
+    and return the stored food, seed decides every random draw of the run
+    with patch the resources are clustered, reusing layouts stored in layout_cache
+    """
+    my_sim = sim_class(p_leave_trail = x[0], p_follow_trail = x[1], seed = seed, **sim_kwargs)
+    my_sim.init_resources()
+    if patch:
+        my_sim.patch_resources(cache = LayoutCache(layout_cache) if layout_cache is not None else None)
+    my_sim.init_bots()
+
+    return my_sim.run(steps)
+
+
+# defaults of run_simulation that decide its result, completing the configs of cached results
+RUN_DEFAULTS = {name: parameter.default for name, parameter in inspect.signature(run_simulation).parameters.items()
+    if parameter.kind is parameter.KEYWORD_ONLY and name != 'layout_cache'}
+
+
+class ParallelEvaluator:
+    """
+    Evaluates batches of parameter vectors on a process pool
+    every simulation gets its own seed spawned from the evaluator seed
+
+    With common_random_numbers every candidate of every batch is scored on the
+    same n_replications seeds, i.e. on the same resource layouts, bot placements
+    and random streams, so fitness differences come from the parameters.
+
+    With a cache, simulations already run with the same config and seed are
+    looked up instead of simulated again. Patched runs with common random
+    numbers share the clustered resource layouts in the layout_cache directory,
+    without them every seed is new and no layout is cached.
+    """
+
+    def __init__(self, n_workers: Optional[int] = None, seed: Optional[int] = None, *,
+        common_random_numbers: bool = False, n_replications: int = 1, cache: Optional[FitnessCache] = None,
+        layout_cache: Optional[Union[str, Path]] = None):
+        self.n_workers = n_workers or os.cpu_count()
+        self.cache = cache
+        self.layout_cache = layout_cache
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.common_random_numbers = common_random_numbers
+        self.n_replications = n_replications
+        self.common_seeds = self._spawn_seeds(n_replications)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+
+    def _spawn_seeds(self, n: int) -> List[int]:
+        return [int(child.generate_state(1)[0]) for child in self.seed_sequence.spawn(n)]
+
+
+    def evaluate(self, x: np.ndarray, **sim_kwargs) -> np.ndarray:
+        """
+        Simulate every row of x n_replications times and return the
+        mean stored food per row, sim_kwargs are passed on to run_simulation
+        """
+        rows = np.repeat(x, self.n_replications, axis = 0)
+        if self.common_random_numbers:
+            seeds = self.common_seeds * len(x)
+        else:
+            seeds = self._spawn_seeds(len(rows))
+        configs = [{**RUN_DEFAULTS, **sim_kwargs, 'x': row, 'seed': seed} for row, seed in zip(rows, seeds)]
+
+        stored_food = np.zeros(len(rows), dtype = np.int64)
+        todo = list(range(len(rows)))
+        if self.cache is not None:
+            cached = [self.cache.get(config) for config in configs]
+            todo = [i for i, value in enumerate(cached) if value is None]
+            stored_food[:] = [value or 0 for value in cached]
+
+        layout_cache = self.layout_cache if self.common_random_numbers else None
+        task = partial(run_simulation, layout_cache = layout_cache, **sim_kwargs)
+        if self.n_workers == 1 or len(todo) <= 1:
+            results = [task(rows[i], seeds[i]) for i in todo]
+        else:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers = self.n_workers)
+
+            chunksize = max(1, len(todo) // (4 * self.n_workers))
+            results = list(self._pool.map(task, rows[todo], [seeds[i] for i in todo], chunksize = chunksize))
+
+        for i, result in zip(todo, results):
+            stored_food[i] = result
+            if self.cache is not None:
+                self.cache.put(configs[i], result)
+
+        stored_food = stored_food.reshape(len(x), self.n_replications)
+        if self.n_replications == 1:
+            return stored_food[:, 0]
+        return stored_food.mean(axis = 1)
+
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self) -> 'ParallelEvaluator':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import sqlite3
+
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+# part of every key, bump it whenever a seeded simulation gives different results
+KEY_VERSION = 3
+
+
+def config_key(config: Dict) -> str:
+    """
+    Canonical hash of a simulation config, the seed is part of the config
+    """
+    def to_builtin(value):
+        # numpy scalars and arrays, classes by name
+        if hasattr(value, 'tolist'):
+            return value.tolist()
+        if isinstance(value, type):
+            return value.__name__
+        raise TypeError(f'can not hash {value!r} of type {type(value).__name__}')
+
+    canonical = json.dumps({'version': KEY_VERSION, 'config': config}, sort_keys = True, separators = (',', ':'), default = to_builtin)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class FitnessCache:
+    """
+    On-disk memo of simulation results keyed on config_key
+    keeps at most max_entries results and evicts the least recently used
+    """
+
+    def __init__(self, path: Union[str, Path], max_entries: int = 1_000_000):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents = True, exist_ok = True)
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS fitness (key TEXT PRIMARY KEY, value REAL NOT NULL, last_used INTEGER NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS fitness_last_used ON fitness (last_used)')
+        self._clock = self.connection.execute('SELECT COALESCE(MAX(last_used), 0) FROM fitness').fetchone()[0]
+
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM fitness').fetchone()[0]
+
+
+    def get(self, config: Dict) -> Optional[float]:
+        """
+        Cached result of the config or None
+        """
+        key = config_key(config)
+        row = self.connection.execute('SELECT value FROM fitness WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._clock += 1
+        with self.connection:
+            self.connection.execute('UPDATE fitness SET last_used = ? WHERE key = ?', (self._clock, key))
+        return row[0]
+
+
+    def put(self, config: Dict, value: float) -> None:
+        """
+        Store the result of the config, evicting least recently used results over max_entries
+        """
+        self._clock += 1
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO fitness VALUES (?, ?, ?)',
+                (config_key(config), float(value), self._clock))
+
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                self.connection.execute(
+                    'DELETE FROM fitness WHERE key IN (SELECT key FROM fitness ORDER BY last_used LIMIT ?)', (excess,))
+
+
+    def close(self) -> None:
+        self.connection.close()
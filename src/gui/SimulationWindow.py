@@ -24,6 +24,25 @@ class Ui_ForagingAntsSimulation(object):
         self.storedFoodLabel.setGeometry(QtCore.QRect(230, 10, 91, 21))
         self.storedFoodLabel.setText("")
         self.storedFoodLabel.setObjectName("storedFoodLabel")
+        self.stepSlider = QtWidgets.QSlider(ForagingAntsSimulation)
+        self.stepSlider.setEnabled(False)
+        self.stepSlider.setGeometry(QtCore.QRect(340, 10, 440, 25))
+        self.stepSlider.setOrientation(QtCore.Qt.Horizontal)
+        self.stepSlider.setObjectName("stepSlider")
+        self.stepButton = QtWidgets.QPushButton(ForagingAntsSimulation)
+        self.stepButton.setGeometry(QtCore.QRect(20, 40, 81, 25))
+        self.stepButton.setObjectName("stepButton")
+        self.speedLabel = QtWidgets.QLabel(ForagingAntsSimulation)
+        self.speedLabel.setGeometry(QtCore.QRect(110, 40, 61, 25))
+        self.speedLabel.setObjectName("speedLabel")
+        self.speedSpinBox = QtWidgets.QSpinBox(ForagingAntsSimulation)
+        self.speedSpinBox.setGeometry(QtCore.QRect(170, 40, 91, 25))
+        self.speedSpinBox.setMaximum(1000000)
+        self.speedSpinBox.setObjectName("speedSpinBox")
+        self.throughputLabel = QtWidgets.QLabel(ForagingAntsSimulation)
+        self.throughputLabel.setGeometry(QtCore.QRect(280, 40, 200, 21))
+        self.throughputLabel.setText("")
+        self.throughputLabel.setObjectName("throughputLabel")
 
         self.retranslateUi(ForagingAntsSimulation)
         QtCore.QMetaObject.connectSlotsByName(ForagingAntsSimulation)
@@ -32,4 +51,8 @@ class Ui_ForagingAntsSimulation(object):
         _translate = QtCore.QCoreApplication.translate
         ForagingAntsSimulation.setWindowTitle(_translate("ForagingAntsSimulation", "Dialog"))
         self.startButton.setText(_translate("ForagingAntsSimulation", "start"))
-        self.stopButton.setText(_translate("ForagingAntsSimulation", "stop"))
+        self.stopButton.setText(_translate("ForagingAntsSimulation", "pause"))
+        self.stepButton.setText(_translate("ForagingAntsSimulation", "step"))
+        self.speedLabel.setText(_translate("ForagingAntsSimulation", "steps/s"))
+        self.speedSpinBox.setToolTip(_translate("ForagingAntsSimulation", "target steps per second, 0 runs as fast as possible"))
+        self.speedSpinBox.setSpecialValueText(_translate("ForagingAntsSimulation", "max"))
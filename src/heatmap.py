@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from typing import Callable, List, Optional, Tuple
+
+from simulation.BaseSimulation import GRID_PAD
+from simulation.KernelSimulation import KernelDummySim
+from simulation.Profiler import MethodHooks
+from simulation.VectorSimulation import EnsembleSimulation
+from trajectory import TrajectoryReader, bot_state
+
+
+def downsample(grid: np.ndarray, reduce: Callable) -> np.ndarray:
+    """
+    Reduce every 2x2 block of grid, odd edges are padded with zeros
+    """
+    x, y = grid.shape
+    padded = np.zeros((x + x % 2, y + y % 2), dtype = grid.dtype)
+    padded[:x, :y] = grid
+    return reduce(reduce(padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2), axis = 3), axis = 1)
+
+
+def has_grid(sim, name: str) -> bool:
+    """
+    Whether sim has the field grid name, as one array or in its tiles
+    """
+    return hasattr(sim, name) or name in getattr(sim, 'tile_grids', ())
+
+
+class CellRecorder:
+    """
+    Flat indices of the cells whose resources or trails a simulation changed
+
+    Like the StepProfiler the recorder hooks the methods of the simulation
+    instance that write the grids, through MethodHooks: take_food and
+    leave_trails of the bot engines, the pick up and trail writes of the
+    vectorized engine, the pick ups of the kernel, read from the bots that got
+    food in a step, and the deltas of a replay. A replay loading a keyframe changes any cell,
+    the next drain then asks for a full comparison.
+    """
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.field_size_y = sim.field_size_y
+        self._resource_cells: List[np.ndarray] = []
+        self._trail_cells: List[np.ndarray] = []
+        self._rebuild = False
+        self._hooks = MethodHooks()
+
+        if isinstance(sim, TrajectoryReader):
+            self._wrap('_apply', self._applied)
+            self._wrap('_load_keyframe', self._keyframe_loaded)
+        elif isinstance(sim, EnsembleSimulation):
+            self._wrap('_pick_up_food', self._picked_up)
+            self._wrap('leave_trails', self._trails_left_flat)
+        else:
+            if isinstance(sim, KernelDummySim):
+                self._wrap('simulate_step', self._kernel_step)
+            else:
+                self._wrap('take_food', self._food_taken)
+            self._wrap('leave_trails', self._trails_left)
+
+
+    def _wrap(self, name: str, record: Callable) -> None:
+        """
+        Replace the method name of the simulation, record sees the method, its arguments and returns the result
+        """
+        self._hooks.install(self.sim, name, lambda method: lambda *args: record(method, *args))
+
+
+    def _flat(self, xs, ys) -> np.ndarray:
+        return np.asarray(xs, dtype = np.int64) * self.field_size_y + np.asarray(ys, dtype = np.int64)
+
+
+    def _food_taken(self, take_food: Callable, x: int, y: int) -> None:
+        take_food(x, y)
+        self._resource_cells.append(self._flat([x], [y]))
+
+
+    def _trails_left(self, leave_trails: Callable, xs, ys) -> None:
+        leave_trails(xs, ys)
+        self._trail_cells.append(self._flat(xs, ys))
+
+
+    def _kernel_step(self, simulate_step: Callable) -> None:
+        sim = self.sim
+        # a bot picks up food on the cell it starts the step on
+        searching = ~sim.has_food
+        xs, ys = sim.pos_x[searching], sim.pos_y[searching]
+        simulate_step()
+        picked = sim.has_food[searching]
+        self._resource_cells.append(self._flat(xs[picked], ys[picked]))
+
+
+    def _unpadded(self, cells: np.ndarray) -> np.ndarray:
+        """
+        Field cells of flat cells of the first padded grid of an ensemble
+        """
+        xs, ys = np.divmod(cells % self.sim._world_cells, self.sim._width)
+        return self._flat(xs - GRID_PAD, ys - GRID_PAD)
+
+
+    def _picked_up(self, pick_up_food: Callable, candidates: np.ndarray, cells: np.ndarray,
+        resources: np.ndarray) -> np.ndarray:
+        picked = pick_up_food(candidates, cells, resources)
+        self._resource_cells.append(self._unpadded(cells[picked]))
+        return picked
+
+
+    def _trails_left_flat(self, leave_trails: Callable, cells: np.ndarray) -> None:
+        leave_trails(cells)
+        self._trail_cells.append(self._unpadded(cells))
+
+
+    def _applied(self, apply: Callable, frame: int) -> Tuple[np.ndarray, np.ndarray]:
+        res_cells, trail_cells = apply(frame)
+        self._resource_cells.append(res_cells.astype(np.int64))
+        self._trail_cells.append(trail_cells.astype(np.int64))
+        return res_cells, trail_cells
+
+
+    def _keyframe_loaded(self, load_keyframe: Callable, keyframe: int) -> None:
+        load_keyframe(keyframe)
+        self._rebuild = True
+
+
+    def drain(self) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        Distinct resource and trail cells changed since the last drain
+        both are None when the grids have to be compared in full
+        """
+        resource_cells, trail_cells = (np.unique(np.concatenate(cells)) if cells else np.zeros(0, dtype = np.int64)
+            for cells in (self._resource_cells, self._trail_cells))
+        rebuild = self._rebuild
+        self._resource_cells, self._trail_cells, self._rebuild = [], [], False
+        return (None, None) if rebuild else (resource_cells, trail_cells)
+
+
+    def remove(self) -> None:
+        """
+        Restore the plain methods of the simulation
+        """
+        self._hooks.remove()
+
+
+class DensityPyramid:
+    """
+    Bot density, resource density and trail intensity of a field at every
+    power of two resolution, level k holds one value per 2^k x 2^k block
+
+    update only propagates the changed cells and the moved bots up the levels,
+    the cells come from a CellRecorder of the simulation, without one the grids
+    are compared with the state seen last time. The grids of a tiled simulation
+    are read from its tiles. Trails are
+    kept as the latest expiry step of each block, which only grows while the
+    simulation runs, the intensity is derived from it for the current step.
+    """
+
+    def __init__(self, field_size_x: int, field_size_y: int):
+        self.field_size_x = field_size_x
+        self.field_size_y = field_size_y
+
+        self.n_levels = int(np.ceil(np.log2(max(field_size_x, field_size_y, 2)))) + 1
+        self.shapes = [(-(-field_size_x >> k), -(-field_size_y >> k)) for k in range(self.n_levels)]
+
+        self.bots = [np.zeros(shape, dtype = np.int32) for shape in self.shapes]
+        self.resources = [np.zeros(shape, dtype = np.int64) for shape in self.shapes]
+        self.trails = [np.zeros(shape, dtype = np.int32) for shape in self.shapes]
+        self.steps = 0
+
+        # state of the last update
+        self._pos_x: Optional[np.ndarray] = None
+        self._pos_y: Optional[np.ndarray] = None
+
+
+    def _build(self, levels: List[np.ndarray], grid: np.ndarray, reduce: Callable) -> None:
+        levels[0][:] = grid
+        for k in range(1, self.n_levels):
+            levels[k][:] = downsample(levels[k - 1], reduce)
+
+
+    def _changed(self, level: np.ndarray, grid: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return np.nonzero(level != grid)
+
+
+    def _grid(self, sim, name: str) -> np.ndarray:
+        """
+        Field grid name of sim, assembled from the nonzero cells of a tiled simulation
+        """
+        if hasattr(sim, name):
+            return np.asarray(getattr(sim, name))
+        grid = np.zeros(self.shapes[0], dtype = np.int64)
+        xs, ys, values = sim._grid_cells(name)
+        grid[xs, ys] = values
+        return grid
+
+
+    def _values(self, sim, name: str, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        Values of grid name of sim at the cells xs, ys
+        """
+        if hasattr(sim, name):
+            return np.asarray(getattr(sim, name))[xs, ys]
+        return sim.cell_values(name, xs, ys)
+
+
+    def _cells(self, sim, name: str, cells: Optional[np.ndarray], level: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Changed cells of grid name, compared with level 0 if they were not recorded
+        """
+        if cells is None:
+            return self._changed(level, self._grid(sim, name))
+        return np.divmod(cells, self.field_size_y)
+
+
+    def update(self, sim, recorder: Optional[CellRecorder] = None) -> None:
+        """
+        Bring the pyramid to the current state of sim
+        with the recorder of sim only the recorded cells are read
+        """
+        self.steps = sim.steps
+        first = self._pos_x is None
+        resource_cells, trail_cells = recorder.drain() if recorder is not None else (None, None)
+
+        if first:
+            self._build(self.resources, self._grid(sim, 'resource_grid'), np.sum)
+        else:
+            xs, ys = self._cells(sim, 'resource_grid', resource_cells, self.resources[0])
+            delta = self._values(sim, 'resource_grid', xs, ys) - self.resources[0][xs, ys]
+            for k, level in enumerate(self.resources):
+                np.add.at(level, (xs >> k, ys >> k), delta)
+
+        if has_grid(sim, 'trail_expiry'):
+            if not first:
+                xs, ys = self._cells(sim, 'trail_expiry', trail_cells, self.trails[0])
+                expiry = self._values(sim, 'trail_expiry', xs, ys)
+            # expiry steps only decrease when a replay seeks backwards
+            if first or np.any(expiry < self.trails[0][xs, ys]):
+                self._build(self.trails, self._grid(sim, 'trail_expiry'), np.max)
+            else:
+                for k, level in enumerate(self.trails):
+                    np.maximum.at(level, (xs >> k, ys >> k), expiry)
+
+        pos_x, pos_y, _ = bot_state(sim)
+        pos_x, pos_y = np.array(pos_x), np.array(pos_y)
+        for k, level in enumerate(self.bots):
+            if first:
+                np.add.at(level, (pos_x >> k, pos_y >> k), 1)
+                continue
+            # on coarse levels most moves stay inside their block
+            moved = ((self._pos_x >> k) != (pos_x >> k)) | ((self._pos_y >> k) != (pos_y >> k))
+            np.subtract.at(level, (self._pos_x[moved] >> k, self._pos_y[moved] >> k), 1)
+            np.add.at(level, (pos_x[moved] >> k, pos_y[moved] >> k), 1)
+        self._pos_x, self._pos_y = pos_x, pos_y
+
+
+    def level_for(self, view_size: int, pixels: int) -> int:
+        """
+        Coarsest level that still has at least one block per pixel of the view
+        """
+        k = 0
+        while k + 1 < self.n_levels and view_size >> (k + 1) >= pixels:
+            k += 1
+        return k
+
+
+    def render(self, x0: int, y0: int, view_size: int, pixels: int) -> np.ndarray:
+        """
+        RGB heatmap of the view_size x view_size cells from (x0, y0) at the level for pixels
+        bots are red, trails yellow and resources blue, each scaled to its maximum in the view
+        """
+        k = self.level_for(view_size, pixels)
+        window = (slice(x0 >> k, -(-(x0 + view_size) >> k)), slice(y0 >> k, -(-(y0 + view_size) >> k)))
+
+        bots = self.bots[k][window].astype(float)
+        resources = self.resources[k][window].astype(float)
+        trails = np.maximum(self.trails[k][window] - self.steps, 0).astype(float)
+
+        def scaled(values: np.ndarray) -> np.ndarray:
+            return values / max(values.max(initial = 0), 1)
+
+        bots, resources, trails = scaled(bots), scaled(resources), scaled(trails)
+        image = np.stack((np.maximum(bots, trails), trails * (1 - bots), resources * (1 - np.maximum(bots, trails))),
+            axis = 2)
+        return np.ascontiguousarray((255 * image).astype(np.uint8))
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+import csv
+import os
+import time
+import uuid
+import numpy as np
+
+from pathlib import Path
+from typing import Dict, List, Union
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# column name and type of every results row, None marks a missing value
+RESULTS_SCHEMA: Dict[str, type] = {
+    'optim_alg': str,
+    'run': int,
+    'pso_steps': int,
+    'pso_n_particles': int,
+    'pso_iter_n': int,
+    'gen_pop_size': int,
+    'gen_mutation_rate': float,
+    'gen_selection_rate': float,
+    'gen_selection_strategy': str,
+    'field_x': int,
+    'field_y': int,
+    'n_bots': int,
+    'trail_decay': int,
+    'p_resource': float,
+    'resource_dist_mean': float,
+    'resource_dist_std': float,
+    'p_leave': float,
+    'p_follow': float,
+    'cost': float,
+    'is_selected': str,
+}
+
+FORMAT_SUFFIXES = {'parquet': '.parquet', 'arrow': '.arrow', 'csv': '.csv'}
+
+
+def arrow_schema(schema: Dict[str, type]) -> 'pa.Schema':
+    arrow_types = {int: pa.int64(), float: pa.float64(), str: pa.string()}
+    return pa.schema([(name, arrow_types[kind]) for name, kind in schema.items()])
+
+
+class ResultsSink:
+    """
+    Buffers results rows in memory and appends them in batches
+
+    parquet and arrow write one part file per flush into the directory
+    path + suffix, so any number of processes can append to the same results.
+    Without pyarrow, or with format csv, rows are appended to path.csv under
+    a file lock. Columns not given for a row are taken from the context.
+    """
+
+    def __init__(self, path: Union[str, Path], format: str = 'parquet', buffer_size: int = 10_000,
+        schema: Dict[str, type] = RESULTS_SCHEMA):
+        if format not in FORMAT_SUFFIXES:
+            raise ValueError(f'unknown results format {format}, use one of {list(FORMAT_SUFFIXES)}')
+        if pa is None:
+            format = 'csv'
+
+        self.format = format
+        self.path = Path(path).with_suffix(FORMAT_SUFFIXES[format])
+        self.buffer_size = buffer_size
+        self.schema = schema
+
+        self.context: Dict = {name: None for name in schema}
+        self._rows: List[Dict] = []
+
+
+    def _check_columns(self, columns: Dict) -> None:
+        unknown = set(columns) - set(self.schema)
+        if unknown:
+            raise KeyError(f'columns {sorted(unknown)} are not in the results schema')
+
+
+    def set_context(self, **columns) -> None:
+        """
+        Set column values shared by the following rows
+        """
+        self._check_columns(columns)
+        self.context.update(columns)
+
+
+    def write(self, **columns) -> None:
+        """
+        Buffer one row, flushes once buffer_size rows are buffered
+        """
+        self._check_columns(columns)
+        self._rows.append({**self.context, **columns})
+        if len(self._rows) >= self.buffer_size:
+            self.flush()
+
+
+    def _typed_columns(self) -> Dict[str, List]:
+        return {name: [None if row[name] is None else kind(row[name]) for row in self._rows]
+            for name, kind in self.schema.items()}
+
+
+    def flush(self) -> None:
+        """
+        Append all buffered rows
+        """
+        if not self._rows:
+            return
+
+        columns = self._typed_columns()
+        if self.format == 'csv':
+            self._append_csv(columns)
+        else:
+            self._write_part(columns)
+        self._rows = []
+
+
+    def _write_part(self, columns: Dict[str, List]) -> None:
+        self.path.mkdir(parents = True, exist_ok = True)
+        table = pa.table(columns, schema = arrow_schema(self.schema))
+
+        # written under a temporary name so readers never see a partial part
+        # names sort in write order
+        name = f'part-{time.time_ns()}-{os.getpid()}-{uuid.uuid4().hex[:8]}{FORMAT_SUFFIXES[self.format]}'
+        tmp_path = self.path.joinpath('.' + name)
+        if self.format == 'parquet':
+            pq.write_table(table, tmp_path)
+        else:
+            with pa.OSFile(str(tmp_path), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, self.path.joinpath(name))
+
+
+    def _append_csv(self, columns: Dict[str, List]) -> None:
+        self.path.parent.mkdir(parents = True, exist_ok = True)
+        with open(self.path, 'a', newline = '') as file:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_EX)
+            writer = csv.writer(file)
+            if file.tell() == 0:
+                writer.writerow(self.schema)
+            writer.writerows(zip(*(['' if v is None else v for v in columns[name]] for name in self.schema)))
+            file.flush()
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> 'ResultsSink':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_results(path: Union[str, Path], schema: Dict[str, type] = RESULTS_SCHEMA) -> Dict[str, np.ndarray]:
+    """
+    Load results written by ResultsSink as numpy columns
+    numeric columns are float with nan for missing values
+    """
+    path = Path(path)
+
+    if path.suffix == '.csv':
+        with open(path, newline = '') as file:
+            rows = list(csv.reader(file))
+        # a run that failed before its first flush leaves an empty file
+        header, rows = (rows[0], rows[1:]) if rows else (list(schema), [])
+        values = dict(zip(header, zip(*rows))) if rows else {name: () for name in header}
+        return {name: np.array([float(v) if v != '' else np.nan for v in values[name]]) if kind is not str
+            else np.array(values[name], dtype = object)
+            for name, kind in schema.items() if name in values}
+
+    if pa is None:
+        raise ImportError('reading parquet or arrow results needs pyarrow')
+
+    parts = sorted(path.glob('part-*'))
+    if path.suffix == '.parquet':
+        tables = [pq.read_table(part) for part in parts]
+    else:
+        tables = [pa.ipc.open_file(pa.memory_map(str(part))).read_all() for part in parts]
+    if not tables:
+        return {name: np.array([]) for name in schema}
+
+    table = pa.concat_tables(tables)
+    return {name: table.column(name).to_numpy(zero_copy_only = False) for name in table.column_names}
@@ -2,140 +2,127 @@
 
 import os
 import numpy as np
-import pyswarms as ps
+import pyswarms.backend as P
 
 from pathlib import Path
+from typing import Optional, Tuple, Union
+
+from pyswarms.backend.handlers import BoundaryHandler, VelocityHandler
+from pyswarms.backend.topology import Star
 
 from geneal.genetic_algorithms import ContinuousGenAlgSolver
 
 from simulation.BaseSimulation import *
 from simulation.PSimulation import *
+from simulation.VectorSimulation import EnsembleSimulation
+from simulation.LayoutCache import LayoutCache
+from evaluation import ParallelEvaluator
+from fitness_cache import FitnessCache
+from results_sink import ResultsSink
 
-genealg_counter = 0
+# simulation engine, VectorSimulation scales to many bots and large fields
+sim_class = ProbabilisticSimulation
 
-class Logline:
-    def __init__(self):
-        self.optim_alg: str = ""
-        self.run: str = ""
+# worker processes for fitness evaluation, None uses every core
+n_workers = None
 
-        self.pso_steps: str = ""
-        self.pso_n_particles: str = ""
-        self.pso_iters: str = ""
+# steps a pheromone trail can be sensed for
+trail_lifetime = 100
 
-        self.gen_pop_size: str = ""
-        self.gen_mutation_rate: str = ""
-        self.gen_selection_rate: str = ""
-        self.gen_selection_strategy: str = ""
+# common random numbers: every candidate is scored on the same seeded worlds
+common_random_numbers = True
+n_replications = 1
+base_seed = 42
 
-        self.field_x: str = ""
-        self.field_y: str = ""
-        self.n_bots: str = ""
-        self.trail_decay: str = ""
-        self.p_resource: str = ""
-        self.resource_dist_mean: str = ""
-        self.resource_dist_std: str = ""
+# results of simulations already run with the same config and seed
+fitness_cache = FitnessCache(Path.cwd().parent.joinpath('results').joinpath('fitness_cache.sqlite'))
 
-        self.p_leave: str = ""
-        self.p_follow: str = ""
-        self.cost: str = ""
-        self.is_selected: str = ""
+# cluster the resources of every evaluated world, layouts are reused from the layout cache
+patch_resources = False
+layout_cache = Path.cwd().parent.joinpath('results').joinpath('layouts')
 
-        self.file_path = Path.cwd().parent.joinpath('results').joinpath('all_results.csv')
-        self.file = open(self.file_path, 'a')
+logger = ResultsSink(Path.cwd().parent.joinpath('results').joinpath('all_results'), format = 'parquet')
 
-    def write_log_line(self):
-        self.file.write(','.join([self.optim_alg, self.run, self.pso_steps, self.pso_n_particles, 
-            self.pso_iters, self.gen_pop_size, self.gen_mutation_rate, self.gen_mutation_rate,
-            self.gen_selection_strategy, self.field_x, self.field_y, self.n_bots, self.trail_decay,
-            self.p_resource, self.resource_dist_mean, self.resource_dist_std,
-            self.p_leave, self.p_follow, self.cost, self.is_selected
-            ]) + os.linesep)
+# set this one
+logger.set_context(run = 11)
 
-    def close_io(self):
-        self.file.close()
-        
 
-logger = Logline()
+def log_evaluations(x, stored_food):
+    """
+    Write one log line per evaluated parameter vector
+    the batch is flushed right away, a crashed run keeps every finished generation
+    """
+    for params, food in zip(x, stored_food):
+        logger.write(p_leave = params[0], p_follow = params[1], cost = food)
+    logger.flush()
 
-# set this one
-logger.run = "11"
 
+class ParallelGenAlgSolver(ContinuousGenAlgSolver):
+    """
+    ContinuousGenAlgSolver evaluating the whole population in one batch
+    """
 
-def genal_fitness(p):
+    def __init__(self, *args, batch_fitness_function, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_fitness_function = batch_fitness_function
 
-    global genealg_counter
-    genealg_counter += 1
-    print(genealg_counter)
-    if genealg_counter >= 5:
-        return None
+    def calculate_fitness(self, population):
+        return self.batch_fitness_function(population)
 
-    return lambda chromosome: genal_call_psim(chromosome, p)
 
-
-def genal_call_psim(x, p, steps = 5_000):
+def genal_call_psim(x, p, evaluator, steps = 5_000):
     
-    global logger
-    global genealg_counter
-    genealg_counter += 1
-    print(steps)
-    print(f"sim: {genealg_counter}")
-
-    my_sim = ProbabilisticSimulation(
+    stored_food = evaluator.evaluate(
+        x,
+        sim_class = sim_class,
+        steps = steps,
         field_size = (100, 100), 
         n_bots=10,
         p_resource = p,
         resource_dist = (1, 0),
-        p_leave_trail = x[0],
-        p_follow_trail = x[1]
+        trail_lifetime = trail_lifetime,
+        patch = patch_resources,
         )
-    my_sim.init_resources()
-    #my_sim.patch_resources()
-    #print(my_sim.resource_dict)
-    my_sim.init_bots()
-    for _ in range(steps):
-        my_sim.simulate_step()
 
-    logger.p_leave = str(x[0])
-    logger.p_follow = str(x[1])
+    log_evaluations(x, stored_food)
+    print(np.mean(x, axis = 0))
+    print(np.mean(stored_food))
+    return stored_food
 
-    logger.cost = str(my_sim.stored_food)
 
-    logger.write_log_line()
-    print(str(x[0]), str(x[1]))
-    print(my_sim.stored_food)
-    return my_sim.stored_food
+def genal_optim(p):
+    logger.set_context(
+        optim_alg = 'gen',
+        run = logger.context['run'] + 1,
 
+        pso_steps = None,
+        pso_n_particles = None,
+        pso_iter_n = None,
 
-def genal_optim(p):
-    global logger
+        gen_pop_size = 25,
+        gen_mutation_rate = 0.1,
+        gen_selection_rate = 0.6,
+        gen_selection_strategy = "roulette_wheel",
 
-    logger.optim_alg = 'gen'
-    logger.run = str(int(logger.run) + 1)
-    
-    logger.pso_steps = ""
-    logger.pso_n_particles = ""
-    logger.pso_iters = ""
-
-    logger.gen_pop_size = "25"
-    logger.gen_mutation_rate = "0.1"
-    logger.gen_selection_rate = "0.6"
-    logger.gen_selection_strategy = "roulette_wheel"
-
-    logger.field_x = "100"
-    logger.field_y = "100"
-    logger.n_bots = "10"
-    logger.trail_decay = "100"
-
-    logger.p_resource = str(p)
-    logger.resource_dist_mean = "1"
-    logger.resource_dist_std = "0"
-
-    # for patching 
-    logger.is_selected = ''
+        field_x = 100,
+        field_y = 100,
+        n_bots = 10,
+        trail_decay = trail_lifetime,
+
+        p_resource = p,
+        resource_dist_mean = 1,
+        resource_dist_std = 0,
+
+        # for patching 
+        is_selected = None,
+        )
     
-    solver = ContinuousGenAlgSolver(
+    evaluator = ParallelEvaluator(n_workers = n_workers, seed = base_seed,
+        common_random_numbers = common_random_numbers, n_replications = n_replications, cache = fitness_cache,
+        layout_cache = layout_cache)
+    solver = ParallelGenAlgSolver(
+        batch_fitness_function = lambda population: genal_call_psim(population, p, evaluator),
         n_genes = 2,
-        fitness_function = genal_fitness(p),
         pop_size = 25,
         mutation_rate = 0.1,
         selection_rate = 0.6,
@@ -147,92 +134,188 @@ def genal_optim(p):
         plot_results = True
     )
     solver.solve()
+    evaluator.close()
 
 
-def call_psim(x, p, steps = 5_000):
+def call_psim(x, p, evaluator, steps = 5_000):
 
-    global logger
-    
-    print(type(x))
     print(p)
     
-    result = np.zeros(x.shape[0])
+    stored_food = evaluator.evaluate(
+        x,
+        sim_class = sim_class,
+        steps = steps,
+        field_size = (100, 100), 
+        n_bots=10,
+        p_resource = p,
+        resource_dist = (10, 3),
+        trail_lifetime = trail_lifetime,
+        patch = patch_resources,
+        )
+    result = -stored_food.astype(float)
+
+    log_evaluations(x, stored_food)
+    
+    print(x)
+    print(np.mean(x, axis = 0))
+    print(result)
+    print(np.mean(result))
 
-    for i in range(x.shape[0]):
-        my_sim = ProbabilisticSimulation(
-            field_size = (100, 100), 
-            n_bots=10,
-            p_resource = p,
-            resource_dist = (10, 3),
-            p_leave_trail = x[i][0],
-            p_follow_trail = x[i][1]
-            )
-        my_sim.init_resources()
-        my_sim.init_bots()
-        for _ in range(steps):
-            my_sim.simulate_step()
+    return result
 
-        result[i] = -my_sim.stored_food
 
-        # logging setup
-        logger.p_leave = str(x[i][0])
-        logger.p_follow = str(x[i][1])
+def call_psim_ensemble(x, p, steps = 5_000):
+    """
+    Batched version of call_psim, all particles are simulated in one ensemble
+    in this process, n_replications worlds per particle
 
-        logger.cost = str(my_sim.stored_food)
+    The ensemble is its own engine, sim_class does not apply. Its worlds share
+    one random stream, a world's result depends on the whole batch and is not
+    looked up in or stored to the fitness cache.
+    """
+    my_sims = EnsembleSimulation(
+        field_size = (100, 100),
+        n_bots = 10,
+        p_resource = p,
+        resource_dist = (10, 3),
+        params = np.repeat(x, n_replications, axis = 0),
+        trail_lifetime = trail_lifetime,
+        seed = base_seed if common_random_numbers else None,
+        common_layout = common_random_numbers
+        )
+    my_sims.init_resources()
+    if patch_resources:
+        # only seeded layouts are clustered again
+        my_sims.patch_resources(cache = LayoutCache(layout_cache) if common_random_numbers else None)
+    my_sims.init_bots()
+    my_sims.run(steps)
 
-        logger.write_log_line()
+    stored_food = my_sims.stored_food.reshape(len(x), n_replications).mean(axis = 1)
+    result = -stored_food
+
+    log_evaluations(x, stored_food)
 
-    
-    print(x)
     print(np.mean(x, axis = 0))
-    print(result)
     print(np.mean(result))
 
     return result
 
 
-def pso_optim(p, steps = 5_000) -> None:
+# swarm attributes saved in checkpoints
+SWARM_FIELDS = ('position', 'velocity', 'pbest_pos', 'pbest_cost', 'best_pos', 'best_cost')
+
+
+def save_swarm(swarm, iteration: int, path: Union[str, Path]) -> None:
+    """
+    Checkpoint the swarm after iteration, together with the numpy random state
+    the file is replaced atomically so an interrupted save keeps the last checkpoint
+    """
+    _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    tmp_path = Path(str(path) + '.tmp')
+    with open(tmp_path, 'wb') as file:
+        np.savez(file, iteration = iteration, random_keys = keys,
+            random_state = np.array([pos, has_gauss, cached_gaussian]),
+            **{field: getattr(swarm, field) for field in SWARM_FIELDS})
+    os.replace(tmp_path, path)
+
+
+def load_swarm(swarm, path: Union[str, Path]) -> int:
+    """
+    Restore a swarm saved with save_swarm and return the next iteration
+    """
+    with np.load(path) as state:
+        for field in SWARM_FIELDS:
+            setattr(swarm, field, state[field].copy())
+        swarm.best_cost = float(swarm.best_cost)
+        pos, has_gauss, cached_gaussian = state['random_state']
+        np.random.set_state(('MT19937', state['random_keys'], int(pos), int(has_gauss), cached_gaussian))
+        return int(state['iteration']) + 1
+
+
+def global_best_pso(objective, n_particles: int, iters: int, options: dict, bounds: Tuple[np.ndarray, np.ndarray],
+    checkpoint_path: Optional[Union[str, Path]] = None, **kwargs) -> Tuple[float, np.ndarray]:
+    """
+    The GlobalBestPSO optimize loop on the pyswarms backend
+    with a checkpoint_path the swarm is saved after every iteration and a
+    run resumes from the checkpoint if it exists
+    """
+    topology = Star()
+    swarm = P.create_swarm(n_particles = n_particles, dimensions = len(bounds[0]), options = options, bounds = bounds)
+    swarm.pbest_cost = np.full(n_particles, np.inf)
+
+    start = 0
+    if checkpoint_path is not None and Path(checkpoint_path).exists():
+        start = load_swarm(swarm, checkpoint_path)
+
+    for i in range(start, iters):
+        swarm.current_cost = objective(swarm.position, **kwargs)
+        swarm.pbest_pos, swarm.pbest_cost = P.compute_pbest(swarm)
+        swarm.best_pos, swarm.best_cost = topology.compute_gbest(swarm)
+
+        swarm.velocity = topology.compute_velocity(swarm, vh = VelocityHandler(strategy = 'unmodified'), bounds = bounds)
+        swarm.position = topology.compute_position(swarm, bounds = bounds, bh = BoundaryHandler(strategy = 'periodic'))
+
+        if checkpoint_path is not None:
+            # a resumed run starts after this iteration, its rows have to be written first
+            logger.flush()
+            save_swarm(swarm, i, checkpoint_path)
+
+    return swarm.best_cost, swarm.best_pos
+
+
+def pso_optim(p, steps = 5_000, ensemble = False, checkpoint_path: Optional[Union[str, Path]] = None) -> None:
+    """
+    PSO over (p_leave_trail, p_follow_trail), every particle is scored by its own
+    simulations on the evaluator, with ensemble the swarm is scored in one EnsembleSimulation
+    """
     # logging setup
-    global logger
+    logger.set_context(
+        optim_alg = 'pso',
+        run = logger.context['run'] + 1,
 
-    logger.optim_alg = 'pso'
-    logger.run = str(int(logger.run) + 1)
-    
-    logger.pso_steps = str(steps)
-    logger.pso_n_particles = "14"
-    logger.pso_iters = "20"
-
-    logger.gen_pop_size = ""
-    logger.gen_mutation_rate = ""
-    logger.gen_selection_rate = ""
-    logger.gen_selection_strategy = ""
-
-    logger.field_x = "100"
-    logger.field_y = "100"
-    logger.n_bots = "10"
-    logger.trail_decay = "100"
-
-    logger.p_resource = str(p)
-    logger.resource_dist_mean = "10"
-    logger.resource_dist_std = "3"
+        pso_steps = steps,
+        pso_n_particles = 14,
+        pso_iter_n = 20,
+
+        gen_pop_size = None,
+        gen_mutation_rate = None,
+        gen_selection_rate = None,
+        gen_selection_strategy = None,
+
+        field_x = 100,
+        field_y = 100,
+        n_bots = 10,
+        trail_decay = trail_lifetime,
+
+        p_resource = p,
+        resource_dist_mean = 10,
+        resource_dist_std = 3,
+        )
     
     options = {'c1': 0.5, 'c2': 0.5, 'w': 0.1}
     bounds = (np.zeros(2), np.ones(2))
-    optimizer = ps.single.GlobalBestPSO(n_particles = 14, dimensions = 2, options = options, bounds = bounds)
-    s = optimizer.optimize(call_psim, iters = 20, p = p, steps = steps)
+    if ensemble:
+        s = global_best_pso(call_psim_ensemble, n_particles = 14, iters = 20, options = options, bounds = bounds,
+            checkpoint_path = checkpoint_path, p = p, steps = steps)
+    else:
+        with ParallelEvaluator(n_workers = n_workers, seed = base_seed, common_random_numbers = common_random_numbers,
+            n_replications = n_replications, cache = fitness_cache, layout_cache = layout_cache) as evaluator:
+            s = global_best_pso(call_psim, n_particles = 14, iters = 20, options = options, bounds = bounds,
+                checkpoint_path = checkpoint_path, p = p, evaluator = evaluator, steps = steps)
     
     return s
 
 
 
 def main() -> None:
-    global logger
-
     #for i in [0.001, 0.002, 0.003, 0.004, 0.005, 0.006, 0.007, 0.008, 0.009, 0.01, 0.015, 0.02, 0.025, 0.03, 0.035, 0.04, 0.045, 0.05, 0.055, 0.06, 0.065, 0.07]:
     #    s = pso_optim(p = i, steps = 5_000)
 
-    genal_optim(0.04)
-    logger.close_io()
+    try:
+        genal_optim(0.04)
+    finally:
+        logger.close()
+        fitness_cache.close()
 
 if __name__ == '__main__':
     main()
@@ -1,212 +1,415 @@
 #!/usr/bin/env python3
 
+import copy
 import numpy as np
-from typing import Dict, Tuple, List, Set
-import random
+from pathlib import Path
+from typing import Dict, Tuple, List, Set, Optional, Union
+import json
 import math
 
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+if 'simulation' in str(Path().cwd()):
+    from Profiler import StepProfiler, Profiling
+    from LayoutCache import LayoutCache
+    from RandomStream import RandomStream
+else:
+    from simulation.Profiler import StepProfiler, Profiling
+    from simulation.LayoutCache import LayoutCache
+    from simulation.RandomStream import RandomStream
+
+# world grids are padded so sensing two cells away never leaves the array
+GRID_PAD = 2
+
+# directions as bits of a 4 bit mask
+DIR_U, DIR_D, DIR_L, DIR_R = 1, 2, 4, 8
+ALL_DIRS = DIR_U | DIR_D | DIR_L | DIR_R
+DIR_NAMES = {DIR_U: 'u', DIR_D: 'd', DIR_L: 'l', DIR_R: 'r'}
+
+# directions of every mask in the order bots choose from, sorted by name as with the direction names before
+DIR_CHOICES = tuple(tuple(bit for bit in (DIR_D, DIR_L, DIR_R, DIR_U) if mask & bit) for mask in range(16))
+
+# move of a bot by direction bit
+MOVE_X = tuple(-1 if bit == DIR_U else 1 if bit == DIR_D else 0 for bit in range(16))
+MOVE_Y = tuple(-1 if bit == DIR_L else 1 if bit == DIR_R else 0 for bit in range(16))
+
+
+def sample_resources(rng: np.random.Generator, field_size: Tuple[int, int], p_resource: float,
+    resource_dist: Tuple[float, float]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Coordinates and amounts of the resources of a field, every cell holds a resource
+    with p_resource except the cells close to the storage center
+
+    The gaps between resource cells are drawn as geometric variables, so time and
+    memory scale with the number of resources and not with the field size.
+    """
+    size_x, size_y = field_size
+    n_cells = size_x * size_y
+    if p_resource <= 0 or n_cells == 0:
+        return np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64)
+
+    expected = n_cells * min(p_resource, 1)
+    chunks, last = [], -1
+    while last < n_cells - 1:
+        gaps = rng.geometric(min(p_resource, 1), int(expected + 6 * math.sqrt(expected) + 16))
+        chunks.append(last + np.cumsum(gaps))
+        last = chunks[-1][-1]
+    cells = np.concatenate(chunks)
+    xs, ys = np.divmod(cells[cells < n_cells], size_y)
+
+    # resources should not be close to the storage center
+    no_res_lim_x, no_res_lim_y = size_x // 10, size_y // 10
+    center_x, center_y = size_x // 2, size_y // 2
+    keep = ~((xs >= center_x - no_res_lim_x) & (xs < center_x + no_res_lim_x)
+        & (ys >= center_y - no_res_lim_y) & (ys < center_y + no_res_lim_y))
+    xs, ys = xs[keep], ys[keep]
+
+    amounts = rng.normal(resource_dist[0], resource_dist[1], xs.size).astype(np.int64)
+    return xs, ys, amounts
+
+
+def spawn_cells(rng: np.random.Generator, field_size: Tuple[int, int], n_bots: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Distinct random cells of the spawn window around the storage center, one per bot
+    """
+    low, high = - field_size[0] // 5, field_size[1] // 5 + 1
+    side = high - low
+    if n_bots > side * side:
+        raise ValueError(f'{n_bots} bots do not fit in the {side}x{side} spawn window')
+
+    cells = rng.choice(side * side, n_bots, replace = False)
+    return field_size[0] // 2 + low + cells // side, field_size[1] // 2 + low + cells % side
+
+
+def cluster_centers(rng: np.random.Generator, points: np.ndarray, n_clusters: int,
+    method: str = 'kmeans') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cluster centers and the cluster of every point
+    kmeans is sklearn's KMeans, minibatch its MiniBatchKMeans and sample starts
+    from randomly sampled points and refines them with Lloyd iterations on a sample
+    """
+    if method == 'kmeans':
+        kmeans = KMeans(n_clusters = n_clusters, random_state = int(rng.integers(2 ** 31))).fit(points)
+        return kmeans.cluster_centers_, kmeans.predict(points)
+
+    if method == 'minibatch':
+        # fitted on at most 100k points, its cost grows with the points far beyond the batches
+        sample = points[rng.choice(len(points), min(len(points), 100_000), replace = False)]
+        kmeans = MiniBatchKMeans(n_clusters = n_clusters, random_state = int(rng.integers(2 ** 31)),
+            batch_size = 4096, n_init = 1, compute_labels = False).fit(sample)
+        return kmeans.cluster_centers_, nearest_center(points, kmeans.cluster_centers_)
+
+    if method == 'sample':
+        # refine on a sample of the points, only the final assignment sees all of them
+        sample = points[rng.choice(len(points), min(len(points), 20_000), replace = False)].astype(float)
+        centers = sample[rng.choice(len(sample), n_clusters, replace = False)]
+        for _ in range(10):
+            labels = nearest_center(sample, centers)
+            counts = np.bincount(labels, minlength = n_clusters)
+            sums = np.stack([np.bincount(labels, sample[:, i], n_clusters) for i in range(2)], axis = 1)
+            centers = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        return centers, nearest_center(points, centers)
+
+    raise ValueError(f'unknown clustering method {method}, use kmeans, minibatch or sample')
+
+
+def nearest_center(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """
+    Index of the closest center of every point, memory stays linear in the points
+    """
+    xs, ys = points[:, 0].astype(np.float32), points[:, 1].astype(np.float32)
+    labels = np.zeros(len(points), dtype = np.int64)
+    best = np.full(len(points), np.inf, dtype = np.float32)
+    for i, (center_x, center_y) in enumerate(centers):
+        distance = np.square(xs - np.float32(center_x))
+        distance += np.square(ys - np.float32(center_y))
+        closer = distance < best
+        labels[closer] = i
+        best = np.minimum(best, distance)
+    return labels
+
+
+def patch_points(rng: np.random.Generator, xs: np.ndarray, ys: np.ndarray, field_size: Tuple[int, int],
+    method: str = 'kmeans', n_clusters: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cells of the resources at xs, ys moved two thirds of the way to the center of their cluster
+    the resources are clustered in the order given, row-major as np.nonzero returns them
+    """
+    centers, labels = cluster_centers(rng, np.column_stack((xs, ys)).astype(np.int32),
+        min(n_clusters, xs.size), method)
+    centers = centers[labels]
+
+    new_xs = np.clip((xs - (xs - centers[:, 0]) // 1.5).astype(np.int64), 0, field_size[0] - 1)
+    new_ys = np.clip((ys - (ys - centers[:, 1]) // 1.5).astype(np.int64), 0, field_size[1] - 1)
+    return new_xs, new_ys
+
+
+def patch_layout(rng: np.random.Generator, resource_grid: np.ndarray, method: str = 'kmeans',
+    n_clusters: int = 10, cache: Optional[LayoutCache] = None) -> None:
+    """
+    Move every resource of the grid two thirds of the way to the center of its
+    cluster, resources moved onto the same cell add up
+    with a cache the layout and generator state of an identical earlier call are reused
+    """
+    if cache is not None:
+        key = cache.key(rng, resource_grid, method, n_clusters)
+        layout = cache.get(key)
+        if layout is not None:
+            xs, ys, amounts, rng.bit_generator.state = layout
+            resource_grid[:] = 0
+            resource_grid[xs, ys] = amounts
+            return
+
+    xs, ys = np.nonzero(resource_grid)
+    if xs.size:
+        amounts = resource_grid[xs, ys]
+        new_xs, new_ys = patch_points(rng, xs, ys, resource_grid.shape, method, n_clusters)
+        resource_grid[:] = 0
+        np.add.at(resource_grid, (new_xs, new_ys), amounts)
+
+    if cache is not None:
+        cache.put(key, resource_grid, rng)
+
+
+# cells a bot senses food in and the bits they set in its food mask, the
+# directions to food one away are the low 4 bits, to food two away the high 4 bits
+FOOD_PROBES = ((-1, 0, DIR_U), (1, 0, DIR_D), (0, 1, DIR_R), (0, -1, DIR_L),
+    (-2, 0, DIR_U << 4), (2, 0, DIR_D << 4), (0, 2, DIR_R << 4), (0, -2, DIR_L << 4),
+    (-1, -1, (DIR_U | DIR_L) << 4), (-1, 1, (DIR_U | DIR_R) << 4), (1, 1, (DIR_R | DIR_D) << 4),
+    (1, -1, (DIR_D | DIR_L) << 4))
+
+
+def food_field(resources: np.ndarray) -> np.ndarray:
+    """
+    Food mask of every cell of a padded resource grid, see FOOD_PROBES
+    """
+    food = resources != 0
+    width, height = resources.shape
+    field = np.zeros(resources.shape, dtype = np.uint8)
+    inner = field[GRID_PAD:-GRID_PAD, GRID_PAD:-GRID_PAD]
+    for dx, dy, bits in FOOD_PROBES:
+        inner[food[GRID_PAD + dx:width - GRID_PAD + dx, GRID_PAD + dy:height - GRID_PAD + dy]] |= bits
+    return field
+
+
+def update_food_field(field: np.ndarray, resources: np.ndarray, x: int, y: int) -> None:
+    """
+    Recompute the food masks of the cells that sense cell (x, y) of the padded grids
+    once it got or lost its food
+    """
+    width, height = field.shape
+    for sense_x, sense_y, _ in FOOD_PROBES:
+        cell_x, cell_y = x - sense_x, y - sense_y
+        if GRID_PAD <= cell_x < width - GRID_PAD and GRID_PAD <= cell_y < height - GRID_PAD:
+            mask = 0
+            for dx, dy, bits in FOOD_PROBES:
+                if resources[cell_x + dx, cell_y + dy]:
+                    mask |= bits
+            field[cell_x, cell_y] = mask
+
+
+# directions to the storage by the side of the storage a cell is on, row side then column side
+STORAGE_DIRS = tuple(tuple(row | column for column in (DIR_R, 0, DIR_L)) for row in (DIR_D, 0, DIR_U))
+
+
+class WorldView:
+    """
+    The world as the bots of a simulation sense it, built once per simulation
+    static data is precomputed, the grids are the padded grids of the simulation
+    so they always show its current state, the simulation keeps step current
+    cell (x, y) of the field is cell (x + offset_x, y + offset_y) of the grids
+    """
+    __slots__ = ('field_size', 'field_size_x', 'field_size_y', 'storage_x', 'storage_y', 'proximity_x', 'proximity_y',
+        'storage_dirs_x', 'storage_side_y', 'resource_grid', 'food_field', 'bot_grid', 'trail_expiry', 'offset_x',
+        'offset_y', 'step')
+
+    def __init__(self, field_size: Tuple[int, int], resource_grid: np.ndarray, food_field: np.ndarray,
+        bot_grid: np.ndarray, trail_expiry: Optional[np.ndarray] = None):
+
+        self.field_size = field_size
+        self.field_size_x, self.field_size_y = field_size
+        self.storage_x, self.storage_y = field_size[0] // 2, field_size[1] // 2
+
+        # a cell is in storage proximity when it is off the storage row and column
+        self.proximity_x = [x != self.storage_x for x in range(self.field_size_x)]
+        self.proximity_y = [y != self.storage_y for y in range(self.field_size_y)]
+
+        # directions to the storage of cell (x, y) are storage_dirs_x[x][storage_side_y[y]]
+        self.storage_dirs_x = [STORAGE_DIRS[(x > self.storage_x) - (x < self.storage_x) + 1]
+            for x in range(self.field_size_x)]
+        self.storage_side_y = [(y > self.storage_y) - (y < self.storage_y) + 1 for y in range(self.field_size_y)]
+
+        self.resource_grid = resource_grid
+        self.food_field = food_field
+        self.bot_grid = bot_grid
+        self.trail_expiry = trail_expiry
+        self.offset_x = self.offset_y = GRID_PAD
+        self.step = 0
+
+
+    def window(self, resource_grid: np.ndarray, food_field: np.ndarray, bot_grid: np.ndarray,
+        trail_expiry: Optional[np.ndarray], offset_x: int, offset_y: int) -> 'WorldView':
+        """
+        The same world seen through other grids, which hold part of the field
+        """
+        view = copy.copy(self)
+        view.resource_grid, view.food_field, view.bot_grid, view.trail_expiry = (resource_grid, food_field, bot_grid,
+            trail_expiry)
+        view.offset_x, view.offset_y = offset_x, offset_y
+        return view
+
+
+def dir_names(directions: int) -> Set[str]:
+    """
+    Names of the directions of a mask
+    """
+    return {name for bit, name in DIR_NAMES.items() if directions & bit}
+
 
 class BaseBot:
-    def __init__(self, pos_x: int, pos_y: int):
+
+    __slots__ = ('pos_x', 'pos_y', 'rng', 'options', 'food_dir', 'has_food', 'world', 'food_one_away')
+
+    def __init__(self, pos_x: int, pos_y: int, rng: Optional[Union[np.random.Generator, RandomStream]] = None):
         self.pos_x = pos_x
         self.pos_y = pos_y
+
+        # random decisions are drawn from the random stream of the simulation
+        self.rng = rng if rng is not None else np.random.default_rng()
         
-        self.options: Set = set()
-        self.food_dir: Set = set()
+        # direction masks
+        self.options: int = 0
+        self.food_dir: int = 0
         
         self.has_food = False
-        self.current_field_state: Dict = dict()
+        self.world: Optional[WorldView] = None
 
         self.food_one_away = False
-        
-        self.storage_x: int = -1
-        self.storage_y: int = -1
 
     
     def check_for_close_food(self) -> None:
         """
         Check if food is one away and adjust state accordingly
         """
-        
-        if (self.pos_x - 1, self.pos_y) in self.current_field_state['resource_coordinates']:
-            self.food_dir.add('u')
+        world = self.world
+        close = world.food_field.item(self.pos_x + world.offset_x, self.pos_y + world.offset_y) & ALL_DIRS
+        if close:
+            self.food_dir |= close
             self.food_one_away = True
-            
-            #print('food found up')
-
-        if (self.pos_x + 1, self.pos_y) in self.current_field_state['resource_coordinates']:
-            self.food_dir.add('d')
-            self.food_one_away = True
-            
-            #print('food found down')
-
-        if (self.pos_x, self.pos_y + 1) in self.current_field_state['resource_coordinates']:
-            self.food_dir.add('r')
-            self.food_one_away = True
-            
-            #print('food found right')
-
-        if (self.pos_x, self.pos_y - 1) in self.current_field_state['resource_coordinates']:
-            self.food_dir.add('l')
-            self.food_one_away = True
-            
-            #print('food found left')
 
     
     def check_for_food_two(self) -> None:
         """
         Check if food is two steps away and update state
         """
-        if (self.pos_x - 2, self.pos_y) in self.current_field_state['resource_coordinates']:
-            self.food_dir.add('u')
-
-        if (self.pos_x + 2, self.pos_y) in self.current_field_state['resource_coordinates']:
-            self.food_dir.add('d')
-        
-        if (self.pos_x, self.pos_y + 2) in self.current_field_state['resource_coordinates']:
-            self.food_dir.add('r')
-        
-        if (self.pos_x, self.pos_y - 2) in self.current_field_state['resource_coordinates']:
-            self.food_dir.add('l')
-        
-        # food two away but get 
-        if (self.pos_x - 1, self.pos_y - 1) in self.current_field_state['resource_coordinates']:
-            self.food_dir.update({'u', 'l'})
-        
-        if (self.pos_x - 1, self.pos_y + 1) in self.current_field_state['resource_coordinates']:
-            self.food_dir.update({'u', 'r'})
-        
-        if (self.pos_x + 1, self.pos_y + 1) in self.current_field_state['resource_coordinates']:
-            self.food_dir.update({'r', 'd'})
-        
-        if (self.pos_x + 1, self.pos_y - 1) in self.current_field_state['resource_coordinates']:
-            self.food_dir.update({'d', 'l'})
+        world = self.world
+        self.food_dir |= world.food_field.item(self.pos_x + world.offset_x, self.pos_y + world.offset_y) >> 4
 
     
     def is_in_storage_proximity(self) -> bool:
         """
         returns whether bot is in storage proximity or not
         """
-        return (abs(self.storage_x - self.pos_x) >= 1 and abs(self.storage_y - self.pos_y) >= 1)
+        return self.world.proximity_x[self.pos_x] and self.world.proximity_y[self.pos_y]
 
     
     def protect_from_collision(self) -> None:
         """
         Check for closeby bots and take out from options
         """
+        bots = self.world.bot_grid
+        x, y = self.pos_x + self.world.offset_x, self.pos_y + self.world.offset_y
+        blocked = 0
+
         if not self.has_food and self.is_in_storage_proximity():
             # remove option if collision could happen
-            if (self.pos_x - 1, self.pos_y) in self.current_field_state['bot_coordinates']:
-                self.food_dir.discard('u')
-                self.options.discard('u')
+            if bots[x - 1, y]:
+                blocked |= DIR_U
 
-            if (self.pos_x + 1, self.pos_y) in self.current_field_state['bot_coordinates']:
-                self.food_dir.discard('d')
-                self.options.discard('d')
+            if bots[x + 1, y]:
+                blocked |= DIR_D
 
-            if (self.pos_x, self.pos_y + 1) in self.current_field_state['bot_coordinates']:
-                self.food_dir.discard('r')
-                self.options.discard('r')
+            if bots[x, y + 1]:
+                blocked |= DIR_R
 
-            if (self.pos_x, self.pos_y - 1) in self.current_field_state['bot_coordinates']:
-                self.food_dir.discard('l')
-                self.options.discard('l')
+            if bots[x, y - 1]:
+                blocked |= DIR_L
         
             # same with two away just to be sure
-            if (self.pos_x - 2, self.pos_y) in self.current_field_state['bot_coordinates']:
-                self.food_dir.discard('u')
-                self.options.discard('u')
+            if bots[x - 2, y]:
+                blocked |= DIR_U
 
-            if (self.pos_x + 2, self.pos_y) in self.current_field_state['bot_coordinates']:
-                self.food_dir.discard('d')
-                self.options.discard('d')
+            if bots[x + 2, y]:
+                blocked |= DIR_D
 
-            if (self.pos_x, self.pos_y + 2) in self.current_field_state['bot_coordinates']:
-                self.food_dir.discard('r')
-                self.options.discard('r')
+            if bots[x, y + 2]:
+                blocked |= DIR_R
 
-            if (self.pos_x, self.pos_y - 2) in self.current_field_state['bot_coordinates']:
-                self.food_dir.discard('l')
-                self.options.discard('l')
+            if bots[x, y - 2]:
+                blocked |= DIR_L
         
         # diagonal keep right
-        if (self.pos_x - 1, self.pos_y - 1) in self.current_field_state['bot_coordinates']:
-            self.food_dir.discard('l')
-            self.options.discard('l')
+        if bots[x - 1, y - 1]:
+            blocked |= DIR_L
+
+        if bots[x - 1, y + 1]:
+            blocked |= DIR_U
 
-        if (self.pos_x - 1, self.pos_y + 1) in self.current_field_state['bot_coordinates']:
-            self.food_dir.discard('u')
-            self.options.discard('u')
+        if bots[x + 1, y + 1]:
+            blocked |= DIR_R
 
-        if (self.pos_x + 1, self.pos_y + 1) in self.current_field_state['bot_coordinates']:
-            self.food_dir.discard('r')
-            self.options.discard('r')
+        if bots[x + 1, y - 1]:
+            blocked |= DIR_D
 
-        if (self.pos_x + 1, self.pos_y - 1) in self.current_field_state['bot_coordinates']:
-            self.food_dir.discard('d')
-            self.options.discard('d')
+        self.food_dir &= ~blocked
+        self.options &= ~blocked
 
     
     def avoid_walls(self) -> None:
         """
         Can't leave environment
         """
+        blocked = 0
         if self.pos_x == 0:
-            #print('cant go up')
-            self.food_dir.discard('u')
-            self.options.discard('u')
-        elif self.pos_x >= (self.current_field_state['field_size'][0] - 1):
-            #print('cant go down')
-            self.food_dir.discard('d')
-            self.options.discard('d')
+            blocked |= DIR_U
+        elif self.pos_x >= self.world.field_size_x - 1:
+            blocked |= DIR_D
 
         if self.pos_y == 0:
-            #print('cant go left')
-            self.food_dir.discard('l')
-            self.options.discard('l')
-        elif self.pos_y >= (self.current_field_state['field_size'][1] - 1):
-            self.food_dir.discard('r')
-            self.options.discard('r')
+            blocked |= DIR_L
+        elif self.pos_y >= self.world.field_size_y - 1:
+            blocked |= DIR_R
+
+        self.food_dir &= ~blocked
+        self.options &= ~blocked
     
     def go_to_storage_unit(self) -> None:
         """
         Move back to storage unit
         """
-        self.options = self.get_dir_to_storage_unit() 
+        self.options = self.get_dir_to_storage_unit()
         
 
-    def get_dir_to_storage_unit(self) -> Set['str']:
+    def get_dir_to_storage_unit(self) -> int:
         """
         Get directions to storage unit
         """
-        directions = set()
-        
-        if self.pos_y > self.storage_y:
-            directions.add('l')
-        elif self.pos_y < self.storage_y:
-            directions.add('r')
-        
-        if self.pos_x > self.storage_x:
-            directions.add('u')
-        elif self.pos_x < self.storage_x:
-            directions.add('d')
-
-        return directions
+        return self.world.storage_dirs_x[self.pos_x][self.world.storage_side_y[self.pos_y]]
 
     
     def is_on_food(self) -> bool:
         """
         Check if bot stands currently on food
         """
-        return (self.pos_x, self.pos_y) in self.current_field_state['resource_coordinates']
+        world = self.world
+        return world.resource_grid[self.pos_x + world.offset_x, self.pos_y + world.offset_y] > 0
     
     
     def is_in_storage_unit(self) -> bool:
         """
         Check if bot stands currently on food
         """
-        return self.pos_x == self.storage_x and self.pos_y == self.storage_y
+        return self.pos_x == self.world.storage_x and self.pos_y == self.world.storage_y
 
     
     def store_food(self) -> None:
@@ -214,7 +417,7 @@ class BaseBot:
         Drop food and increase storage count
         """
         self.has_food = False
-        self.options = set()
+        self.options = 0
 
     def pick_up_food(self) -> None:
         """
@@ -222,22 +425,19 @@ class BaseBot:
         that is all you do in that round so empties options as well
         """
         self.has_food = True
-        self.options = set()
+        self.options = 0
     
     
-    def update_env(self, state: Dict) -> Tuple[int, bool]:
+    def update_env(self, world: WorldView) -> Tuple[int, bool]:
 
         food_stored = 0
         food_picked_up = False
 
         # set initial state
-        self.options = {'u', 'd', 'l', 'r'}
-        self.food_dir = set()
+        self.options = ALL_DIRS
+        self.food_dir = 0
 
-        self.current_field_state = state
-
-        self.storage_x = self.current_field_state['field_size'][0] // 2
-        self.storage_y = self.current_field_state['field_size'][1] // 2
+        self.world = world
 
         if not self.has_food:
             # if on food grab it and that is what you do for the step
@@ -270,26 +470,28 @@ class BaseBot:
     
     def step(self) -> Tuple[int, int]:
         
-        if len(self.food_dir) > 0:
-            self._move_according_to_direction(random.choice(list(self.food_dir)))
-        elif len(self.options) > 0:
-            self._move_according_to_direction(random.choice(list(self.options)))
+        if self.food_dir:
+            self._move_according_to_direction(self._choose_direction(self.food_dir))
+        elif self.options:
+            self._move_according_to_direction(self._choose_direction(self.options))
         # else stay in place
         return (self.pos_x, self.pos_y)
         
     
-    def _move_according_to_direction(self, dir: str) -> None:
+    def _choose_direction(self, directions: int) -> int:
+        """
+        Random direction of the mask
+        """
+        choices = DIR_CHOICES[directions]
+        return choices[self.rng.integers(len(choices))]
+
+    
+    def _move_according_to_direction(self, dir: int) -> None:
         """
         Make the move according to chosen direction
         """
-        if dir == 'u':
-            self.pos_x -= 1
-        elif  dir == 'd':
-            self.pos_x += 1
-        elif dir == 'r':
-            self.pos_y += 1
-        else:
-            self.pos_y -= 1
+        self.pos_x += MOVE_X[dir]
+        self.pos_y += MOVE_Y[dir]
 
     
     def print_bot(self) -> None:
@@ -297,126 +499,371 @@ class BaseBot:
         Print bot state
         """
         print(f'x: {self.pos_x}, y : {self.pos_y}')
-        print(f'options to go: {self.options}')
-        print(f'food seen: {self.food_dir}')
+        print(f'options to go: {dir_names(self.options)}')
+        print(f'food seen: {dir_names(self.food_dir)}')
+
+
+class Snapshots:
+    """
+    snapshot and restore of a simulation to a compressed .npz file
+
+    A simulation lists its state: counter_fields are ints, grid_fields arrays
+    loaded in place so views of them stay valid, the bots are saved by
+    _bot_state and loaded by _load_bot_state. It is restored by constructing it
+    from config() and loading the state into it.
+    """
+
+    counter_fields: Tuple[str, ...] = ()
+    grid_fields: Tuple[str, ...] = ()
+
+    def snapshot(self, path: Union[str, Path]) -> None:
+        """
+        Save the complete simulation state to a compressed .npz file
+        """
+        state = {
+            'config': json.dumps(self.config(), default = lambda value: value.item()),
+            'rng_state': json.dumps(self.rng.bit_generator.state),
+            'counters': np.array([getattr(self, field) for field in self.counter_fields]),
+        }
+        state.update(self._grid_state())
+        state.update(self._bot_state())
+
+        np.savez_compressed(path, **state)
+
+
+    @classmethod
+    def restore(cls, path: Union[str, Path], seed: Optional[int] = None):
+        """
+        Load a simulation saved with snapshot
+        with a seed the random stream is reseeded, to fork continuations of the same world
+        """
+        with np.load(path) as state:
+            sim = cls(**json.loads(str(state['config'])))
+            if seed is None:
+                sim.rng.bit_generator.state = json.loads(str(state['rng_state']))
+            else:
+                sim.seed = seed
+                sim.rng = np.random.default_rng(seed)
+            for field, value in zip(sim.counter_fields, state['counters'].tolist()):
+                setattr(sim, field, value)
+
+            sim._load_grid_state(state)
+            sim._load_bot_state(state)
 
-class DummySim:
-    def __init__(self, field_size: Tuple[int, int], n_bots: int, p_resource: float, resource_dist: Tuple[float, float]):
+        return sim
+
+
+    def _grid_state(self) -> Dict[str, np.ndarray]:
+        """
+        World grids saved in snapshots
+        """
+        return {field: getattr(self, field) for field in self.grid_fields}
+
+
+    def _load_grid_state(self, state) -> None:
+        """
+        Load the world grids of a snapshot
+        """
+        for field in self.grid_fields:
+            getattr(self, field)[:] = state[field]
+
+
+class GridViews:
+    """
+    Resources, bots and trails as dicts and sets, built from the field grids
+    resource_grid, bot_grid and trail_expiry, or from the cells _grid_cells returns
+    """
+
+    def _grid_cells(self, name: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Coordinates and values of the nonzero cells of field grid name
+        """
+        grid = getattr(self, name)
+        xs, ys = np.nonzero(grid)
+        return xs, ys, grid[xs, ys]
+
+    @property
+    def resource_dict(self) -> Dict[Tuple[int, int], int]:
+        """
+        Resource amounts keyed by coordinates
+        """
+        xs, ys, amounts = self._grid_cells('resource_grid')
+        return dict(zip(zip(xs.tolist(), ys.tolist()), amounts.tolist()))
+
+    @resource_dict.setter
+    def resource_dict(self, resources: Dict[Tuple[int, int], int]) -> None:
+        # a cell with amount <= 0 still yields exactly one pickup, same as amount 1
+        cells = np.array(list(resources.keys()), dtype = np.int64).reshape(-1, 2)
+        amounts = np.array(list(resources.values()), dtype = np.int64)
+        self._set_resources(cells[:, 0], cells[:, 1], np.maximum(amounts, 1))
+
+    @property
+    def bot_coordinates(self) -> Set[Tuple[int, int]]:
+        """
+        Occupied cells
+        """
+        xs, ys, _ = self._grid_cells('bot_grid')
+        return set(zip(xs.tolist(), ys.tolist()))
+
+    @property
+    def trails(self) -> Dict[Tuple[int, int], int]:
+        """
+        Remaining trail lifetimes keyed by coordinates
+        """
+        xs, ys, expiry = self._grid_cells('trail_expiry')
+        live = expiry > self.steps
+        return dict(zip(zip(xs[live].tolist(), ys[live].tolist()), (expiry[live] - self.steps).tolist()))
+
+
+class DummySim(Snapshots, GridViews, Profiling):
+
+    # counters, bot attributes and padded grids saved in snapshots
+    counter_fields: Tuple[str, ...] = ('stored_food', 'picked_food', 'steps')
+    bot_fields: Tuple[str, ...] = ('pos_x', 'pos_y', 'has_food', 'food_one_away')
+    grid_fields: Tuple[str, ...] = ('_resource_grid', '_bot_grid')
+
+    def __init__(self, field_size: Tuple[int, int], n_bots: int, p_resource: float, resource_dist: Tuple[float, float],
+        seed: Optional[int] = None):
         
+        # every random draw of the simulation comes from this generator, the bots draw
+        # through a stream of it, rng brings the generator up to the stream
+        self.seed = seed
+        self.stream = RandomStream(np.random.default_rng(seed))
+
         self.field_size_x = field_size[0]
         self.field_size_y = field_size[1]
         
         self.n_bots = n_bots
         self.bots: List = []
-        self.bot_coordinates: Set = set()
         
         self.p_resource = p_resource
-        self.resource_dict: Dict = dict()
 
         self.resource_dist_mean = resource_dist[0]
         self.resource_dist_std = resource_dist[1]
 
         self.stored_food = 0
+        self.picked_food = 0
+        self.steps = 0
+
+        self._init_world()
+
+        self.profiler: Optional[StepProfiler] = None
+
+
+    def _init_world(self) -> None:
+        """
+        Allocate the world state and the view of it the bots sense
+        """
+        # dense world state, bots read the padded grids
+        # resource_grid and bot_grid are views of the field itself
+        self._grid_shape = (self.field_size_x + 2 * GRID_PAD, self.field_size_y + 2 * GRID_PAD)
+        self._resource_grid = np.zeros(self._grid_shape, dtype = np.int16)
+        self._bot_grid = np.zeros(self._grid_shape, dtype = np.uint8)
+        self.resource_grid = self._resource_grid[GRID_PAD:-GRID_PAD, GRID_PAD:-GRID_PAD]
+        self.bot_grid = self._bot_grid[GRID_PAD:-GRID_PAD, GRID_PAD:-GRID_PAD]
+
+        # food masks sensed by the bots, kept up to date with the resource grid
+        self._food_field = np.zeros(self._grid_shape, dtype = np.uint8)
+
+        # what the bots sense, shared by all of them
+        self.world = WorldView((self.field_size_x, self.field_size_y), self._resource_grid, self._food_field,
+            self._bot_grid)
+
+
+    @property
+    def rng(self) -> np.random.Generator:
+        self.stream.sync()
+        return self.stream.rng
+
+    @rng.setter
+    def rng(self, rng: np.random.Generator) -> None:
+        self.stream.sync()
+        self.stream.rng = rng
+
+    def config(self) -> Dict:
+        """
+        Constructor arguments of the simulation
+        """
+        return {
+            'field_size': (self.field_size_x, self.field_size_y),
+            'n_bots': self.n_bots,
+            'p_resource': self.p_resource,
+            'resource_dist': (self.resource_dist_mean, self.resource_dist_std),
+            'seed': self.seed,
+        }
+
+
+    def new_bot(self, x: int, y: int) -> BaseBot:
+        return BaseBot(x, y, self.stream)
+
+
+    def _bot_state(self) -> Dict[str, np.ndarray]:
+        """
+        Bot attributes saved in snapshots, one array per attribute
+        """
+        return {'bot' + field: np.array([getattr(bot, field) for bot in self.bots]) for field in self.bot_fields}
+
+
+    def _load_bot_state(self, state) -> None:
+        bot_state = [state['bot' + field].tolist() for field in self.bot_fields]
+        for values in zip(*bot_state):
+            bot = self.new_bot(values[0], values[1])
+            for field, value in zip(self.bot_fields[2:], values[2:]):
+                setattr(bot, field, value)
+            self.bots.append(bot)
+
+
+    def _load_grid_state(self, state) -> None:
+        super()._load_grid_state(state)
+        self.refresh_food_field()
 
 
     def init_resources(self) -> None:
         """
         Initialize resources
         """
-        chances_field = np.random.rand(self.field_size_x, self.field_size_y)
-        self.resource_field = np.zeros((self.field_size_x, self.field_size_y))
-        self.resource_field[chances_field < self.p_resource] = 1
-
-        # resources should not be close to the storage center
-        no_res_lim_x, no_res_lim_y = self.field_size_x // 10, self.field_size_y // 10
-        center_x, center_y = self.field_size_x // 2, self.field_size_y // 2
-        no_res_x_range = [x for x in range(center_x - no_res_lim_x, center_x + no_res_lim_x)]
-        no_res_y_range = [y for y in range(center_y - no_res_lim_y, center_y + no_res_lim_y)]
-        no_res_field_set = set()
-        for x in no_res_x_range:
-            for y in no_res_y_range:
-                no_res_field_set.add((x, y))
-        #print(len(no_res_field_set))
-        
-        xs, ys = np.where(self.resource_field == 1)
-        self.resource_dict = {(x, y): int(np.random.normal(self.resource_dist_mean, self.resource_dist_std)) 
-            for x,y in zip(xs, ys) if (x, y) not in no_res_field_set}
-        #print(self.resource_dict)
-
-    def patch_resources(self):
-        resources = []
-        for k in self.resource_dict:
-            resources.append(list(k))
-        X = np.array(resources, dtype = np.int16)
-        kmeans = KMeans(n_clusters = 10).fit(X)
-        predictions = kmeans.predict(X)
-        for i in range(X.shape[0]):
-            current_vals = X[i]
-            current_cc = kmeans.cluster_centers_[predictions[i]]
-            x_diff, y_diff = self.calc_resource_move_vector(current_cc[0], current_cc[1], current_vals[0], current_vals[1])
-            resource_amount = self.resource_dict[int(current_vals[0]), int(current_vals[1])]
-            # update resource dict
-            self.resource_dict[int(current_vals[0]), int(current_vals[1])] -= resource_amount
-            self.resource_dict[int(current_vals[0] - x_diff), int(current_vals[1] - y_diff)] = self.resource_dict.get((int(current_vals[0] - x_diff), int(current_vals[1] - y_diff)), 0) + resource_amount
+        xs, ys, amounts = sample_resources(self.rng, (self.field_size_x, self.field_size_y), self.p_resource,
+            (self.resource_dist_mean, self.resource_dist_std))
+        # a cell with amount <= 0 still yields exactly one pickup, same as amount 1
+        self._set_resources(xs, ys, np.maximum(amounts, 1))
 
-        
-        self.resource_dict = {k:v for k, v in self.resource_dict.items() if v > 0}
-        
+    def _set_resources(self, xs: np.ndarray, ys: np.ndarray, amounts: np.ndarray) -> None:
+        """
+        Replace all resources by the given amounts at cells xs, ys
+        """
+        self.resource_grid[:] = 0
+        self.resource_grid[xs, ys] = amounts
+        self.refresh_food_field()
 
-    def calc_resource_move_vector(self, xc, yc, x1, y1):
-        delta_x = (x1 - xc) // 1.5
-        delta_y = (y1 - yc) // 1.5
-        return delta_x, delta_y
+    def patch_resources(self, method: str = 'kmeans', n_clusters: int = 10,
+        cache: Optional[LayoutCache] = None) -> None:
+        """
+        Move resources closer to the center of their cluster, see patch_layout
+        """
+        patch_layout(self.rng, self.resource_grid, method, n_clusters, cache)
+        self.refresh_food_field()
 
 
-    def init_bots(self) -> None:
+    def refresh_food_field(self) -> None:
+        """
+        Rebuild the food masks, needed after the resource grid is changed from outside
         """
-        Initialize bots 
+        self._food_field[:] = food_field(self._resource_grid)
+
+
+    def resources_left(self) -> int:
         """
-        center_x = self.field_size_x // 2
-        center_y = self.field_size_y // 2
+        Units of food left on the field
+        """
+        return int(self.resource_grid.sum())
+
+
+    def take_food(self, x: int, y: int) -> None:
+        """
+        Remove a unit of food picked up at (x, y) from the resource grid
+        """
+        self.resource_grid[x, y] -= 1
+        self.picked_food += 1
+        if not self.resource_grid[x, y]:
+            update_food_field(self._food_field, self._resource_grid, x + GRID_PAD, y + GRID_PAD)
         
-        for _ in range(self.n_bots):
-            rand_vals = np.random.randint(- self.field_size_x // 5, self.field_size_y // 5 + 1, 2)
-            x, y = center_x + rand_vals[0], center_y + rand_vals[1]
-            
-            while (x, y) in self.bot_coordinates:
-                rand_vals = np.random.randint(- self.field_size_x // 5, self.field_size_y // 5 + 1, 2)
-                x, y = center_x + rand_vals[0], center_y + rand_vals[1]
-            
-            self.bot_coordinates.add((x, y))
-            self.bots.append(BaseBot(x, y))
+
+    def init_bots(self) -> None:
+        """
+        Initialize bots on distinct cells around the storage
+        """
+        xs, ys = spawn_cells(self.rng, (self.field_size_x, self.field_size_y), self.n_bots)
+        self.bot_grid[xs, ys] = 1
+        self.bots = [self.new_bot(x, y) for x, y in zip(xs.tolist(), ys.tolist())]
+
+    def move_bots(self, old_coordinates: List[Tuple[int, int]], bots: Optional[List] = None) -> None:
+        """
+        Move bots on the bot grid once every bot made its step
+        bots are all bots of the simulation unless given
+        """
+        for (x, y), bot in zip(old_coordinates, self.bots if bots is None else bots):
+            self.bot_grid[x, y] -= 1
+            self.bot_grid[bot.pos_x, bot.pos_y] += 1
+
 
     def simulate_step(self) -> None:
         
-        new_bot_coordinates = set()
+        old_coordinates = []
+        world = self.world
+        world.step = self.steps
         
         for bot in self.bots:
-        
-            field_state = {
-                'field_size': (self.field_size_x, self.field_size_y),
-                'bot_coordinates' : self.bot_coordinates,
-                'resource_coordinates': self.resource_dict
-            }
             
-            stored_food, food_picked = bot.update_env(field_state)
+            old_coordinates.append((bot.pos_x, bot.pos_y))
+            
+            stored_food, food_picked = bot.update_env(world)
             # increase stored food count
             self.stored_food += stored_food
             # if food is picked remove a unit from resource field
             if food_picked:
-                self.resource_dict[(bot.pos_x, bot.pos_y)] -= 1
-                if self.resource_dict[bot.pos_x, bot.pos_y] <= 0:
-                    del self.resource_dict[bot.pos_x, bot.pos_y]
+                self.take_food(bot.pos_x, bot.pos_y)
             
-            x,y = bot.step()
-            new_bot_coordinates.add((x, y))
+            bot.step()
 
-        
+        # bots sense the positions of the previous step
+        self.move_bots(old_coordinates)
+        self.steps += 1
+
+
+    def fast_forward_home(self, steps_left: int) -> bool:
+        """
+        Deliver the food of every carrying bot that reaches the storage within
+        steps_left steps, only done when no other bot can get diagonally close
+        to a carrier on its way home, so the walk can not be blocked
+        returns whether the fast forward happened
+        """
+        storage_x, storage_y = self.field_size_x // 2, self.field_size_y // 2
+        carriers = [bot for bot in self.bots if bot.has_food]
+
+        for bot in carriers:
+            distance = abs(bot.pos_x - storage_x) + abs(bot.pos_y - storage_y)
+            low_x, high_x = min(bot.pos_x, storage_x), max(bot.pos_x, storage_x)
+            low_y, high_y = min(bot.pos_y, storage_y), max(bot.pos_y, storage_y)
+            for other in self.bots:
+                if other is bot:
+                    continue
+                gap = (max(low_x - other.pos_x, 0, other.pos_x - high_x)
+                    + max(low_y - other.pos_y, 0, other.pos_y - high_y))
+                if gap <= distance + 1:
+                    return False
+
+        # a carrier walks its distance and stores in the step after arriving
+        home = [bot for bot in carriers if abs(bot.pos_x - storage_x) + abs(bot.pos_y - storage_y) < steps_left]
+        old_coordinates = [(bot.pos_x, bot.pos_y) for bot in home]
+        for bot in home:
+            bot.pos_x, bot.pos_y = storage_x, storage_y
+            bot.store_food()
+            self.stored_food += 1
+        self.move_bots(old_coordinates, home)
+
+        return True
+
+
+    def run(self, max_steps: int) -> int:
+        """
+        Simulate up to max_steps steps and return the stored food
+        stops as soon as the stored food can not change anymore,
+        the final stored food is the same as after all max_steps steps
+        """
+        food_left = self.resources_left()
+        picked_before = self.picked_food
+
+        for step in range(max_steps):
+            if food_left == self.picked_food - picked_before:
+                # nothing left to pick up, only carriers still matter
+                if self.picked_food == self.stored_food or self.fast_forward_home(max_steps - step):
+                    break
+            self.simulate_step()
 
-        self.bot_coordinates = new_bot_coordinates
+        return self.stored_food
     
 def main():
-    my_sim = DummySim(field_size = (100, 100), n_bots = 10, p_resource = 0.01, resource_dist = (10, 2))
+    my_sim = DummySim(field_size = (100, 100), n_bots = 10, p_resource = 0.01, resource_dist = (10, 2), seed = 0)
     my_sim.init_resources()
     my_sim.patch_resources()
     my_sim.init_bots()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+if 'simulation' in str(Path().cwd()):
+    from BaseSimulation import GRID_PAD, DIR_U, DIR_D, DIR_L, DIR_R, ALL_DIRS, DIR_CHOICES, DummySim, spawn_cells, \
+        update_food_field
+    from PSimulation import ProbabilisticSimulation
+    from VectorSimulation import POPCOUNT, DELTA_X, DELTA_Y, BotView
+    from RandomStream import draw_words, release_words
+else:
+    from simulation.BaseSimulation import GRID_PAD, DIR_U, DIR_D, DIR_L, DIR_R, ALL_DIRS, DIR_CHOICES, DummySim, \
+        spawn_cells, update_food_field
+    from simulation.PSimulation import ProbabilisticSimulation
+    from simulation.VectorSimulation import POPCOUNT, DELTA_X, DELTA_Y, BotView
+    from simulation.RandomStream import draw_words, release_words
+
+# whether the kernel is compiled, without numba it runs as plain Python with the same results
+KERNEL_COMPILED = numba is not None
+
+# the n-th direction of a mask in the order the bot objects choose from
+CHOICE_BIT = np.zeros((16, 4), dtype = np.int64)
+for _mask, _bits in enumerate(DIR_CHOICES):
+    CHOICE_BIT[_mask, :len(_bits)] = _bits
+
+# words of the random stream a bot can use in one step, at most two unless
+# a bounded draw rejects a word, which happens with odds below 1e-9
+WORDS_PER_BOT = 2
+WORD_RESERVE = 4
+
+
+def jit(function):
+    """
+    Compile function with numba when it is installed
+    """
+    return numba.njit(cache = True)(function) if numba is not None else function
+
+
+@jit
+def _next_word(words: np.ndarray, stream: np.ndarray) -> np.uint64:
+    if stream[0] == words.size:
+        raise RuntimeError('random word block exhausted')
+    word = words[stream[0]]
+    stream[0] += 1
+    return word
+
+
+@jit
+def _next_uint32(words: np.ndarray, stream: np.ndarray) -> int:
+    """
+    Next 32 bits, the high half of a word is kept for the following call, as in PCG64
+    """
+    if stream[1]:
+        stream[1] = 0
+        return stream[2]
+    word = _next_word(words, stream)
+    stream[1] = 1
+    stream[2] = np.int64(word >> np.uint64(32))
+    return np.int64(word & np.uint64(0xFFFFFFFF))
+
+
+@jit
+def _random(words: np.ndarray, stream: np.ndarray) -> float:
+    """
+    Same value as Generator.random()
+    """
+    return np.float64(_next_word(words, stream) >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+
+
+@jit
+def _integers(words: np.ndarray, stream: np.ndarray, n: int) -> int:
+    """
+    Same value as Generator.integers(n) for n < 2^32, Lemire's bounded draw
+    """
+    if n == 1:
+        return 0
+    m = _next_uint32(words, stream) * n
+    leftover = m & 0xFFFFFFFF
+    if leftover < n:
+        threshold = (0xFFFFFFFF - (n - 1)) % n
+        while leftover < threshold:
+            m = _next_uint32(words, stream) * n
+            leftover = m & 0xFFFFFFFF
+    return m >> 32
+
+
+_update_food_field = jit(update_food_field)
+
+
+@jit
+def _dir_to_storage(x: int, y: int, storage_x: int, storage_y: int) -> int:
+    directions = 0
+    if y > storage_y:
+        directions |= DIR_L
+    elif y < storage_y:
+        directions |= DIR_R
+    if x > storage_x:
+        directions |= DIR_U
+    elif x < storage_x:
+        directions |= DIR_D
+    return directions
+
+
+@jit
+def step_bots(start: int, pos_x: np.ndarray, pos_y: np.ndarray, has_food: np.ndarray, food_one_away: np.ndarray,
+    leave_mark: np.ndarray, tracking_on: np.ndarray, resources: np.ndarray, food_field: np.ndarray,
+    bots: np.ndarray, expiry: np.ndarray, step: int, field_size_x: int, field_size_y: int, probabilistic: bool, p_leave_trail: float,
+    p_follow_trail: float, words: np.ndarray, stream: np.ndarray) -> Tuple[int, int, int]:
+    """
+    update_env and step of the bots from start on, in order, the same decisions and
+    draws as BaseBot or ProbabilisticBot, stops early when the random words run low
+    returns the next bot, the stored and the picked food
+    """
+    storage_x, storage_y = field_size_x // 2, field_size_y // 2
+    stored, picked = 0, 0
+
+    for i in range(start, pos_x.size):
+        if words.size - stream[0] < WORD_RESERVE:
+            return i, stored, picked
+
+        x, y = pos_x[i], pos_y[i]
+        px, py = x + GRID_PAD, y + GRID_PAD
+        options, food, trail = ALL_DIRS, 0, 0
+
+        if not has_food[i]:
+            if resources[px, py] > 0:
+                # pick_up_food
+                has_food[i] = True
+                options = 0
+                if probabilistic:
+                    if _random(words, stream) < p_leave_trail:
+                        leave_mark[i] = True
+                    tracking_on[i] = False
+                resources[px, py] -= 1
+                if resources[px, py] == 0:
+                    _update_food_field(food_field, resources, px, py)
+                picked += 1
+            else:
+                # check_for_close_food and check_for_food_two
+                sensed = np.int64(food_field[px, py])
+                food = sensed & ALL_DIRS
+                if food:
+                    food_one_away[i] = True
+                if not food_one_away[i]:
+                    food |= sensed >> 4
+
+                if probabilistic:
+                    # check_for_trail and decide_to_track
+                    if expiry[px - 1, py] > step:
+                        trail |= DIR_U
+                    if expiry[px + 1, py] > step:
+                        trail |= DIR_D
+                    if expiry[px, py + 1] > step:
+                        trail |= DIR_R
+                    if expiry[px, py - 1] > step:
+                        trail |= DIR_L
+                    trail &= ~_dir_to_storage(x, y, storage_x, storage_y)
+
+                    if not tracking_on[i] and trail:
+                        if _random(words, stream) < p_follow_trail:
+                            tracking_on[i] = True
+                        if not tracking_on[i]:
+                            trail = 0
+        else:
+            if x == storage_x and y == storage_y:
+                # store_food
+                has_food[i] = False
+                options = 0
+                leave_mark[i] = False
+                stored += 1
+            else:
+                options = _dir_to_storage(x, y, storage_x, storage_y)
+
+        # protect_from_collision, trails are followed regardless
+        blocked = 0
+        if not has_food[i] and abs(storage_x - x) >= 1 and abs(storage_y - y) >= 1:
+            if bots[px - 1, py] or bots[px - 2, py]:
+                blocked |= DIR_U
+            if bots[px + 1, py] or bots[px + 2, py]:
+                blocked |= DIR_D
+            if bots[px, py + 1] or bots[px, py + 2]:
+                blocked |= DIR_R
+            if bots[px, py - 1] or bots[px, py - 2]:
+                blocked |= DIR_L
+        if bots[px - 1, py - 1]:
+            blocked |= DIR_L
+        if bots[px - 1, py + 1]:
+            blocked |= DIR_U
+        if bots[px + 1, py + 1]:
+            blocked |= DIR_R
+        if bots[px + 1, py - 1]:
+            blocked |= DIR_D
+
+        # avoid_walls
+        if x == 0:
+            blocked |= DIR_U
+        elif x >= field_size_x - 1:
+            blocked |= DIR_D
+        if y == 0:
+            blocked |= DIR_L
+        elif y >= field_size_y - 1:
+            blocked |= DIR_R
+
+        food &= ~blocked
+        options &= ~blocked
+
+        # step
+        directions = food if food else trail if trail else options
+        if directions:
+            direction = CHOICE_BIT[directions, _integers(words, stream, POPCOUNT[directions])]
+            pos_x[i] = x + DELTA_X[direction]
+            pos_y[i] = y + DELTA_Y[direction]
+
+    return pos_x.size, stored, picked
+
+
+class KernelDummySim(DummySim):
+    """
+    DummySim with the bots as arrays, stepped by one compiled loop over the bots
+
+    The loop keeps the sequential semantics of the bot objects: bots move in
+    order, see the resources the bots before them left and the bot grid of the
+    previous step, and draw the same random numbers from the generator of the
+    simulation. A seed gives the same run as with the bot objects, snapshots
+    of both can be restored by either.
+    """
+
+    # whether the bots are ProbabilisticBots
+    probabilistic = False
+
+    @property
+    def bots(self) -> List[BotView]:
+        return [BotView(self, i) for i in range(self.pos_x.size)]
+
+    @bots.setter
+    def bots(self, bots: List) -> None:
+        self.pos_x = np.array([bot.pos_x for bot in bots], dtype = np.int64)
+        self.pos_y = np.array([bot.pos_y for bot in bots], dtype = np.int64)
+        self.has_food = np.array([bot.has_food for bot in bots], dtype = bool)
+        self.food_one_away = np.array([bot.food_one_away for bot in bots], dtype = bool)
+        self.leave_mark = np.array([getattr(bot, 'leave_mark', False) for bot in bots], dtype = bool)
+        self.tracking_on = np.array([getattr(bot, 'tracking_on', False) for bot in bots], dtype = bool)
+
+
+    def _new_bots(self, n: int) -> None:
+        """
+        State arrays of n bots at the origin with nothing sensed
+        """
+        self.pos_x = np.zeros(n, dtype = np.int64)
+        self.pos_y = np.zeros(n, dtype = np.int64)
+        self.has_food = np.zeros(n, dtype = bool)
+        self.food_one_away = np.zeros(n, dtype = bool)
+        self.leave_mark = np.zeros(n, dtype = bool)
+        self.tracking_on = np.zeros(n, dtype = bool)
+
+
+    def _bot_state(self) -> Dict[str, np.ndarray]:
+        """
+        Bot arrays saved in snapshots, same layout as DummySim
+        """
+        return {'bot' + field: getattr(self, field) for field in self.bot_fields}
+
+
+    def _load_bot_state(self, state) -> None:
+        self._new_bots(state['botpos_x'].size)
+        for field in self.bot_fields:
+            getattr(self, field)[:] = state['bot' + field]
+
+
+    def init_bots(self) -> None:
+        """
+        Initialize bots on distinct cells around the storage
+        """
+        xs, ys = spawn_cells(self.rng, (self.field_size_x, self.field_size_y), self.n_bots)
+        self.bot_grid[xs, ys] = 1
+        self._new_bots(self.n_bots)
+        self.pos_x[:], self.pos_y[:] = xs, ys
+
+
+    def _trail_state(self) -> Tuple[np.ndarray, float, float]:
+        return np.zeros((1, 1), dtype = np.int32), 0.0, 0.0
+
+
+    def simulate_step(self) -> None:
+        old_x, old_y = self.pos_x + GRID_PAD, self.pos_y + GRID_PAD
+        expiry, p_leave_trail, p_follow_trail = self._trail_state()
+
+        i = 0
+        while i < self.pos_x.size:
+            words, stream, rng_state = draw_words(self.rng, WORDS_PER_BOT * (self.pos_x.size - i) + WORD_RESERVE)
+            i, stored, picked = step_bots(i, self.pos_x, self.pos_y, self.has_food, self.food_one_away,
+                self.leave_mark, self.tracking_on, self._resource_grid, self._food_field, self._bot_grid, expiry,
+                self.steps, self.field_size_x, self.field_size_y, self.probabilistic, p_leave_trail, p_follow_trail,
+                words, stream)
+            release_words(self.rng, rng_state, stream)
+            self.stored_food += stored
+            self.picked_food += picked
+
+        # bots sense the positions of the previous step
+        np.subtract.at(self._bot_grid, (old_x, old_y), 1)
+        np.add.at(self._bot_grid, (self.pos_x + GRID_PAD, self.pos_y + GRID_PAD), 1)
+        self.steps += 1
+
+
+    def fast_forward_home(self, steps_left: int) -> bool:
+        """
+        Deliver the food of every carrying bot that reaches the storage within
+        steps_left steps, same conditions as DummySim.fast_forward_home
+        """
+        storage_x, storage_y = self.field_size_x // 2, self.field_size_y // 2
+        carriers = np.nonzero(self.has_food)[0]
+        distances = np.abs(self.pos_x - storage_x) + np.abs(self.pos_y - storage_y)
+
+        for i in carriers:
+            low_x, high_x = min(self.pos_x[i], storage_x), max(self.pos_x[i], storage_x)
+            low_y, high_y = min(self.pos_y[i], storage_y), max(self.pos_y[i], storage_y)
+            gaps = (np.maximum(np.maximum(low_x - self.pos_x, self.pos_x - high_x), 0)
+                + np.maximum(np.maximum(low_y - self.pos_y, self.pos_y - high_y), 0))
+            gaps[i] = distances[i] + 2
+            if np.any(gaps <= distances[i] + 1):
+                return False
+
+        home = carriers[distances[carriers] < steps_left]
+        np.subtract.at(self.bot_grid, (self.pos_x[home], self.pos_y[home]), 1)
+        self.pos_x[home], self.pos_y[home] = storage_x, storage_y
+        self.bot_grid[storage_x, storage_y] += home.size
+        self.has_food[home] = False
+        self.leave_mark[home] = False
+        self.stored_food += home.size
+        return True
+
+
+class KernelSimulation(KernelDummySim, ProbabilisticSimulation):
+    """
+    ProbabilisticSimulation with the bots as arrays, stepped by the compiled loop
+    """
+
+    probabilistic = True
+
+    def _trail_state(self) -> Tuple[np.ndarray, float, float]:
+        return self._trail_expiry, float(self.p_leave_trail), float(self.p_follow_trail)
+
+
+    def simulate_step(self) -> None:
+        super().simulate_step()
+        # trails of the previous step are sensed, they are left after the move
+        self.leave_trails(self.pos_x[self.leave_mark], self.pos_y[self.leave_mark])
+
+
+def main():
+    my_sim = KernelSimulation(field_size = (1000, 1000), n_bots = 10_000, p_resource = 0.05, resource_dist = (10, 2),
+        p_leave_trail = 0.2, p_follow_trail = 0.1, seed = 0)
+    my_sim.init_resources()
+    my_sim.init_bots()
+    for _ in range(1000):
+        my_sim.simulate_step()
+
+    print(f'{my_sim.stored_food}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import numpy as np
+
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+# part of every key, bump it whenever the clustering of a layout changes
+LAYOUT_VERSION = 1
+
+
+class LayoutCache:
+    """
+    On-disk store of patched resource layouts, one compressed .npz per layout
+
+    A layout is keyed on everything it depends on: the resources before
+    patching, the generator state, the clustering method and the cluster count.
+    With a fresh seeded simulation that is the seed, field size, p_resource and
+    resource_dist. The generator state after patching is stored as well, so
+    a simulation continues exactly as if it had clustered the layout itself.
+    Only seeded simulations hit a layout again, unseeded ones should not use a cache.
+    keeps at most max_entries layouts and evicts the least recently used
+    """
+
+    def __init__(self, path: Union[str, Path], max_entries: int = 1_000):
+        self.path = Path(path)
+        self.path.mkdir(parents = True, exist_ok = True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+
+    def key(self, rng: np.random.Generator, resource_grid: np.ndarray, method: str, n_clusters: int) -> str:
+        digest = hashlib.sha256()
+        digest.update(json.dumps({'version': LAYOUT_VERSION, 'rng': rng.bit_generator.state, 'method': method,
+            'n_clusters': n_clusters, 'shape': resource_grid.shape}, sort_keys = True).encode())
+        digest.update(np.ascontiguousarray(resource_grid).tobytes())
+        return digest.hexdigest()
+
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, Dict]]:
+        """
+        Resource coordinates, amounts and generator state of a stored layout or None
+        """
+        path = self.path.joinpath(key + '.npz')
+        try:
+            # the modification time is the last use
+            os.utime(path)
+            with np.load(path) as layout:
+                stored = layout['xs'], layout['ys'], layout['amounts'], json.loads(str(layout['rng_state']))
+        except (FileNotFoundError, OSError, ValueError):
+            # not stored, or evicted by another process while reading
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return stored
+
+
+    def put(self, key: str, resource_grid: np.ndarray, rng: np.random.Generator) -> None:
+        """
+        Store a patched layout, written under a temporary name so readers never see a partial file
+        evicts the least recently used layouts over max_entries
+        """
+        xs, ys = np.nonzero(resource_grid)
+        tmp_path = self.path.joinpath(f'.{key}.{os.getpid()}.npz')
+        np.savez_compressed(tmp_path, xs = xs.astype(np.int32), ys = ys.astype(np.int32),
+            amounts = resource_grid[xs, ys], rng_state = json.dumps(rng.bit_generator.state))
+        os.replace(tmp_path, self.path.joinpath(key + '.npz'))
+        self._evict()
+
+
+    def _evict(self) -> None:
+        last_used = {}
+        for path in self.path.glob('*.npz'):
+            if path.name.startswith('.'):
+                continue
+            try:
+                last_used[path] = path.stat().st_mtime_ns
+            except OSError:
+                # evicted by another process
+                continue
+
+        excess = len(last_used) - self.max_entries
+        for path in sorted(last_used, key = last_used.get)[:max(excess, 0)]:
+            try:
+                path.unlink()
+            except OSError:
+                continue
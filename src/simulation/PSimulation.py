@@ -1,10 +1,8 @@
 #!/usr/bin/env python3
 
-import random
-
 import numpy as np
 from pathlib import Path
-from typing import Tuple
+from typing import Sequence, Tuple
 
 if 'simulation' in str(Path().cwd()):
     from BaseSimulation import *
@@ -13,15 +11,19 @@ else:
 
 
 class ProbabilisticBot(BaseBot):
+
+    __slots__ = ('p_leave_trail', 'p_follow_trail', 'leave_mark', 'tracking_on', 'trails_sensed')
     
-    def __init__(self, pos_x: int, pos_y: int, *, p_leave_trail: float, p_follow_trail: float):
-        super().__init__(pos_x, pos_y)
+    def __init__(self, pos_x: int, pos_y: int, *, p_leave_trail: float, p_follow_trail: float,
+        rng: Optional[Union[np.random.Generator, RandomStream]] = None):
+        super().__init__(pos_x, pos_y, rng)
 
         self.p_leave_trail: float = p_leave_trail
         self.p_follow_trail: float = p_follow_trail
 
         self.leave_mark: bool = False
         self.tracking_on: bool = False
+        self.trails_sensed: int = 0
 
     
     def pick_up_food(self) -> None:
@@ -30,7 +32,7 @@ class ProbabilisticBot(BaseBot):
         Has to make decision whether to leave mark or not
         """
         super().pick_up_food()
-        if random.random() < self.p_leave_trail:
+        if self.rng.random() < self.p_leave_trail:
             self.leave_mark = True
 
         self.tracking_on = False
@@ -49,53 +51,55 @@ class ProbabilisticBot(BaseBot):
         """
         Return if bot is on trail
         """
-        return (self.pos_x, self.pos_y) in self.current_field_state['trails']
+        world = self.world
+        return world.trail_expiry[self.pos_x + world.offset_x, self.pos_y + world.offset_y] > world.step
 
     
     def check_for_trail(self) -> None:
         """
         Check for pheromone trail in proximity
         """
-        if (self.pos_x - 1, self.pos_y) in self.current_field_state['trails']:
-            self.trails_sensed.add('u')
+        world = self.world
+        expiry = world.trail_expiry
+        now = world.step
+        x, y = self.pos_x + world.offset_x, self.pos_y + world.offset_y
+
+        if expiry[x - 1, y] > now:
+            self.trails_sensed |= DIR_U
 
-        if (self.pos_x + 1, self.pos_y) in self.current_field_state['trails']:
-            self.trails_sensed.add('d')
+        if expiry[x + 1, y] > now:
+            self.trails_sensed |= DIR_D
 
-        if (self.pos_x, self.pos_y + 1) in self.current_field_state['trails']:
-            self.trails_sensed.add('r')
+        if expiry[x, y + 1] > now:
+            self.trails_sensed |= DIR_R
 
-        if (self.pos_x, self.pos_y - 1) in self.current_field_state['trails']:
-            self.trails_sensed.add('l')
+        if expiry[x, y - 1] > now:
+            self.trails_sensed |= DIR_L
 
         # only keep directions to food and not to center
-        for el in self.get_dir_to_storage_unit():
-            self.trails_sensed.discard(el) 
+        self.trails_sensed &= ~self.get_dir_to_storage_unit()
 
     
     def decide_to_track(self) -> None:
         """
         Make decision whether to track trail or not
         """
-        if random.random() < self.p_follow_trail:
+        if self.rng.random() < self.p_follow_trail:
             self.tracking_on = True
 
     
     
-    def update_env(self, state: Dict) -> Tuple[int, bool]:
+    def update_env(self, world: WorldView) -> Tuple[int, bool]:
 
         food_stored = 0
         food_picked_up = False
 
         # set initial state
-        self.options = {'u', 'd', 'l', 'r'}
-        self.food_dir = set()
-        self.trails_sensed = set()
+        self.options = ALL_DIRS
+        self.food_dir = 0
+        self.trails_sensed = 0
 
-        self.current_field_state = state
-
-        self.storage_x = self.current_field_state['field_size'][0] // 2
-        self.storage_y = self.current_field_state['field_size'][1] // 2
+        self.world = world
 
         if not self.has_food:
             # if on food grab it and that is what you do for the step
@@ -116,10 +120,10 @@ class ProbabilisticBot(BaseBot):
                     self.check_for_trail()
                 else:
                     self.check_for_trail()
-                    if len(self.trails_sensed) >= 1:
+                    if self.trails_sensed:
                         self.decide_to_track()
                         if not self.tracking_on:
-                            self.trails_sensed = set() 
+                            self.trails_sensed = 0
         else:
             if self.is_in_storage_unit():
                 self.store_food()
@@ -136,92 +140,103 @@ class ProbabilisticBot(BaseBot):
     
     def step(self) -> Tuple[int, int, bool]:
         
-        if len(self.food_dir) > 0:
-            self._move_according_to_direction(random.choice(list(self.food_dir)))
-        elif len(self.trails_sensed) > 0:
-            self._move_according_to_direction(random.choice(list(self.trails_sensed)))
-        elif len(self.options) > 0:
-            self._move_according_to_direction(random.choice(list(self.options)))
+        if self.food_dir:
+            self._move_according_to_direction(self._choose_direction(self.food_dir))
+        elif self.trails_sensed:
+            self._move_according_to_direction(self._choose_direction(self.trails_sensed))
+        elif self.options:
+            self._move_according_to_direction(self._choose_direction(self.options))
         # else stay in place
         return self.pos_x, self.pos_y, self.leave_mark
 
 
 class ProbabilisticSimulation(DummySim):
+
+    bot_fields = DummySim.bot_fields + ('leave_mark', 'tracking_on')
+    grid_fields = DummySim.grid_fields + ('_trail_expiry',)
     
     def __init__(self, field_size: Tuple[int, int], n_bots: int, p_resource: float, resource_dist: Tuple[float, float],
-        *, p_leave_trail: float, p_follow_trail: float):
+        *, p_leave_trail: float, p_follow_trail: float, trail_lifetime: int = 100, seed: Optional[int] = None):
         
-        super().__init__(field_size, n_bots, p_resource, resource_dist)
+        super().__init__(field_size, n_bots, p_resource, resource_dist, seed)
 
         self.p_leave_trail = p_leave_trail
         self.p_follow_trail = p_follow_trail
 
-        self.trails: Dict[Tuple[int, int]: int] = dict()
-    
-    
-    def init_bots(self) -> None:
+        # a trail is sensed for trail_lifetime steps after the step it was left in
+        self.trail_lifetime = trail_lifetime
+
+
+    def _init_world(self) -> None:
+        super()._init_world()
+        # trails decay implicitly, a cell is on trail while its expiry step is ahead
+        self._trail_expiry = np.zeros(self._grid_shape, dtype = np.int32)
+        self.trail_expiry = self._trail_expiry[GRID_PAD:-GRID_PAD, GRID_PAD:-GRID_PAD]
+        self.world.trail_expiry = self._trail_expiry
+
+
+    @property
+    def trail_grid(self) -> np.ndarray:
         """
-        Initialize bots for sim
+        Remaining trail lifetime of every cell, 0 where there is no trail
         """
-        center_x = self.field_size_x // 2
-        center_y = self.field_size_y // 2
-        
-        for _ in range(self.n_bots):
-            rand_vals = np.random.randint(- self.field_size_x // 5, self.field_size_y // 5 + 1, 2)
-            x, y = center_x + rand_vals[0], center_y + rand_vals[1]
-            
-            while (x, y) in self.bot_coordinates:
-                rand_vals = np.random.randint(- self.field_size_x // 5, self.field_size_y // 5 + 1, 2)
-                x, y = center_x + rand_vals[0], center_y + rand_vals[1]
-            
-            self.bot_coordinates.add((x, y))
-            self.bots.append(ProbabilisticBot(x, y, p_leave_trail = self.p_leave_trail, p_follow_trail = self.p_follow_trail))
+        return np.maximum(self.trail_expiry - self.steps, 0)
 
 
-    
-    def trail_decay(self):
+    def config(self) -> Dict:
         """
-        Make trails decay over time
+        Constructor arguments of the simulation
         """
-        self.trails = {key: value - 1 for (key, value) in self.trails.items() if value > 1}
+        config = super().config()
+        config.update(p_leave_trail = self.p_leave_trail, p_follow_trail = self.p_follow_trail,
+            trail_lifetime = self.trail_lifetime)
+        return config
+
+
+    def new_bot(self, x: int, y: int) -> ProbabilisticBot:
+        return ProbabilisticBot(x, y, p_leave_trail = self.p_leave_trail, p_follow_trail = self.p_follow_trail,
+            rng = self.stream)
+
 
-    
     def simulate_step(self) -> None:      
         
-        new_bot_coordinates = set()
-        new_trails = set()
+        old_coordinates = []
+        trail_xs, trail_ys = [], []
+        world = self.world
+        world.step = self.steps
         
         for bot in self.bots:
             
-            field_state = {
-                'field_size': (self.field_size_x, self.field_size_y),
-                'bot_coordinates' : self.bot_coordinates,
-                'resource_coordinates': self.resource_dict,
-                'trails': self.trails,
-            }
-
-            stored_food, food_picked = bot.update_env(field_state)
+            old_coordinates.append((bot.pos_x, bot.pos_y))
+
+            stored_food, food_picked = bot.update_env(world)
             # increase stored food count
             self.stored_food += stored_food
             # if food is picked remove a unit from resource field
             if food_picked:
-                self.resource_dict[(bot.pos_x, bot.pos_y)] -= 1
-                if self.resource_dict[bot.pos_x, bot.pos_y] <= 0:
-                    del self.resource_dict[bot.pos_x, bot.pos_y]
+                self.take_food(bot.pos_x, bot.pos_y)
             
             x,y, mark_left = bot.step()
-            new_bot_coordinates.add((x, y))
             if mark_left:
-                new_trails.add((x, y))
+                trail_xs.append(x)
+                trail_ys.append(y)
+
+        # bots sense the positions and trails of the previous step
+        self.move_bots(old_coordinates)
+        self.steps += 1
+        self.leave_trails(trail_xs, trail_ys)
 
-        self.bot_coordinates = new_bot_coordinates
-        self.trail_decay()
-        for val in new_trails:
-            self.trails[val] = 100
+
+    def leave_trails(self, xs: Sequence[int], ys: Sequence[int]) -> None:
+        """
+        Leave trails on cells xs, ys after a step, they are sensed for trail_lifetime steps
+        """
+        self.trail_expiry[xs, ys] = self.steps + self.trail_lifetime
 
 
 def main():
-    my_sim = ProbabilisticSimulation(field_size = (100, 100), n_bots = 10, p_resource = 0.05, resource_dist = (10, 2), p_leave_trail = 0.2, p_follow_trail = 0.1)
+    my_sim = ProbabilisticSimulation(field_size = (100, 100), n_bots = 10, p_resource = 0.05, resource_dist = (10, 2), p_leave_trail = 0.2, p_follow_trail = 0.1,
+        seed = 0)
     my_sim.init_resources()
     my_sim.init_bots()
     for _ in range(100000):
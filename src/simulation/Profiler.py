@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+import time
+from collections import defaultdict
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+# counters of a phase, a fixed count per call or a function of the object and the result
+Counters = Tuple[Tuple[str, Union[int, Callable]], ...]
+
+
+def _guarded(bot) -> bool:
+    return not bot.has_food and bot.is_in_storage_proximity()
+
+
+def _collisions_avoided(bot, result) -> int:
+    """
+    Occupied cells that took a direction away from the bot
+    """
+    bots = bot.world.bot_grid
+    x, y = bot.pos_x + bot.world.offset_x, bot.pos_y + bot.world.offset_y
+    cells = [(x - 1, y - 1), (x - 1, y + 1), (x + 1, y + 1), (x + 1, y - 1)]
+    if _guarded(bot):
+        cells += [(x - 1, y), (x + 1, y), (x, y + 1), (x, y - 1), (x - 2, y), (x + 2, y), (x, y + 2), (x, y - 2)]
+    return sum(1 for cell in cells if bots[cell])
+
+
+# instrumented methods of the bots, methods a bot class does not have are skipped
+BOT_PHASES: Dict[str, Counters] = {
+    'update_env': (),
+    'is_on_food': (('sensor_lookups', 1),),
+    'check_for_close_food': (('sensor_lookups', 1),),
+    'check_for_food_two': (('sensor_lookups', 1),),
+    'check_for_trail': (('sensor_lookups', 4),),
+    'decide_to_track': (('trail_follows', lambda bot, result: int(bot.tracking_on)),),
+    'protect_from_collision': (('sensor_lookups', lambda bot, result: 12 if _guarded(bot) else 4),
+        ('collisions_avoided', _collisions_avoided)),
+    'avoid_walls': (),
+    'pick_up_food': (('pickups', 1),),
+    'store_food': (('stores', 1),),
+    'step': (),
+    '_choose_direction': (('random_draws', 1),),
+}
+
+# instrumented methods of the simulations
+SIM_PHASES: Dict[str, Counters] = {
+    'take_food': (),
+    'move_bots': (),
+    'leave_trails': (),
+    '_sense': (('sensor_lookups', lambda sim, result: 4 * result.size),),
+    '_sense_diagonal': (('sensor_lookups', lambda sim, result: 4 * result.size),),
+    '_pick_up_food': (('pickups', lambda sim, result: result.size),),
+}
+
+# rows written by StepProfiler.dump, for ResultsSink(..., schema = PROFILE_SCHEMA)
+PROFILE_SCHEMA: Dict[str, type] = {
+    'run': int,
+    'sim_class': str,
+    'steps': int,
+    'kind': str,
+    'name': str,
+    'calls': int,
+    'total_s': float,
+    'per_step_s': float,
+    'value': int,
+}
+
+
+# attribute not set on the instance
+_MISSING = object()
+
+
+class MethodHooks:
+    """
+    Wrappers set on the methods of object instances, removable in any order
+
+    Every wrapper calls the method it replaced, so wrappers of several owners
+    stack. remove restores the attribute seen at install time where the
+    wrapper is still the attribute, skipping wrappers below it that were
+    removed already. A wrapper something else was installed over stays in
+    place and calls straight through, the one above keeps working.
+    """
+
+    def __init__(self):
+        self._installed: List[Tuple[object, str, Callable]] = []
+
+
+    def install(self, obj, name: str, wrap: Callable[[Callable], Callable]) -> None:
+        """
+        Replace method name of obj by wrap(method)
+        """
+        method = getattr(obj, name)
+        wrapped = wrap(method)
+
+        def hook(*args, **kwargs):
+            return (wrapped if hook.active else method)(*args, **kwargs)
+
+        hook.active = True
+        hook.previous = vars(obj).get(name, _MISSING)
+        self._installed.append((obj, name, hook))
+        setattr(obj, name, hook)
+
+
+    def remove(self) -> None:
+        """
+        Undo every install, the last one first
+        """
+        for obj, name, hook in reversed(self._installed):
+            hook.active = False
+            if vars(obj).get(name) is not hook:
+                continue
+            previous = hook.previous
+            while getattr(previous, 'active', None) is False:
+                previous = previous.previous
+            if previous is _MISSING:
+                del vars(obj)[name]
+            else:
+                setattr(obj, name, previous)
+        self._installed = []
+
+
+class StepProfiler:
+    """
+    Wall time per named phase and event counters, aggregated over steps
+
+    Profiling replaces the instrumented methods of the simulation by timing
+    wrappers on the instance itself. Slotted objects like the bots can not hold
+    them, they are switched to a subclass with the wrappers and switched back on
+    remove, the classes themselves are never touched. Without a profiler nothing
+    is wrapped, so it costs nothing. Phase times are inclusive, update_env
+    contains the sensing phases.
+    """
+
+    def __init__(self):
+        self.times: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.steps = 0
+        self._hooks = MethodHooks()
+        self._instrumented: Dict[int, object] = {}
+        # profiled subclasses of slotted classes and the objects switched to them
+        self._subclasses: Dict[type, type] = {}
+        self._switched: Dict[int, Tuple[object, type]] = {}
+
+
+    def _wrap(self, name: str, method: Callable, counters: Counters, owner = None) -> Callable:
+        """
+        Timing wrapper of a bound method of owner, without owner of a function taking the object first
+        """
+        times, calls, totals = self.times, self.calls, self.counters
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            result = method(*args, **kwargs)
+            times[name] += perf_counter() - start
+            calls[name] += 1
+            for counter, count in counters:
+                totals[counter] += count if isinstance(count, int) else count(
+                    owner if owner is not None else args[0], result)
+            return result
+
+        return timed
+
+
+    def _subclass(self, cls: type, phases: Dict[str, Counters]) -> type:
+        """
+        Subclass of a slotted class with the methods named in phases wrapped
+        """
+        if cls not in self._subclasses:
+            methods = {name: self._wrap(name, getattr(cls, name), phases[name]) for name in phases if hasattr(cls, name)}
+            self._subclasses[cls] = type(cls.__name__, (cls,), {'__slots__': (), **methods})
+        return self._subclasses[cls]
+
+
+    def instrument(self, obj, phases: Dict[str, Counters]) -> None:
+        """
+        Time the methods of obj named in phases
+        """
+        if id(obj) in self._instrumented or id(obj) in self._switched:
+            return
+        if not hasattr(obj, '__dict__'):
+            self._switched[id(obj)] = (obj, type(obj))
+            obj.__class__ = self._subclass(type(obj), phases)
+            return
+        for name in phases:
+            if hasattr(obj, name):
+                self._hooks.install(obj, name, partial(self._wrap, name, counters = phases[name], owner = obj))
+        self._instrumented[id(obj)] = obj
+
+
+    def instrument_simulation(self, sim) -> None:
+        """
+        Time the phases of sim, bots created later are instrumented on their first step
+        """
+        self.instrument(sim, SIM_PHASES)
+
+        def profiled(simulate_step: Callable) -> Callable:
+            simulate_step = self._wrap('simulate_step', simulate_step, (), sim)
+
+            def profiled_step():
+                # only bot objects, not the views of the vectorized simulations
+                for bot in vars(sim).get('bots', ()):
+                    self.instrument(bot, BOT_PHASES)
+                simulate_step()
+                self.steps += 1
+
+            return profiled_step
+
+        self._hooks.install(sim, 'simulate_step', profiled)
+
+
+    def remove(self) -> None:
+        """
+        Restore the plain methods of every instrumented object
+        """
+        self._hooks.remove()
+        for obj, cls in self._switched.values():
+            obj.__class__ = cls
+        self._instrumented = {}
+        self._switched = {}
+
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Phases and counters, phases with total, per step and share of the simulate_step time
+        """
+        step_time = self.times.get('simulate_step', 0) or sum(self.times.values()) or 1
+        steps = max(self.steps, 1)
+        phases = {name: {'calls': self.calls[name], 'total_s': total, 'per_step_s': total / steps,
+            'share': total / step_time} for name, total in sorted(self.times.items(), key = lambda item: -item[1])}
+        return {'steps': self.steps, 'phases': phases, 'counters': dict(self.counters)}
+
+
+    def print_summary(self) -> None:
+        summary = self.summary()
+        print(f'{summary["steps"]} steps')
+        for name, phase in summary['phases'].items():
+            print(f'{name:>24} {phase["total_s"]:10.4f} s {1e6 * phase["per_step_s"]:10.1f} us/step '
+                f'{phase["share"]:7.1%} {phase["calls"]:>10} calls')
+        for name, value in summary['counters'].items():
+            print(f'{name:>24} {value:>10} {value / max(summary["steps"], 1):12.1f} /step')
+
+
+    def dump(self, sink, **columns) -> None:
+        """
+        Write one row per phase and counter to a sink with PROFILE_SCHEMA
+        columns are added to every row
+        """
+        summary = self.summary()
+        for name, phase in summary['phases'].items():
+            sink.write(steps = summary['steps'], kind = 'phase', name = name, calls = phase['calls'],
+                total_s = phase['total_s'], per_step_s = phase['per_step_s'], **columns)
+        for name, value in summary['counters'].items():
+            sink.write(steps = summary['steps'], kind = 'counter', name = name, value = value, **columns)
+
+
+class Profiling:
+    """
+    Profiling switched on and off for a simulation, its profiler is None while off
+    """
+
+    profiler: Optional[StepProfiler] = None
+
+    def enable_profiling(self) -> StepProfiler:
+        """
+        Time the phases of every following step and count sensing, collisions and pickups
+        """
+        if self.profiler is None:
+            self.profiler = StepProfiler()
+            self.profiler.instrument_simulation(self)
+        return self.profiler
+
+
+    def disable_profiling(self) -> Optional[StepProfiler]:
+        """
+        Remove the instrumentation and return the profiler with its results
+        """
+        profiler, self.profiler = self.profiler, None
+        if profiler is not None:
+            profiler.remove()
+        return profiler
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# raw words drawn per block, a word gives one random() or two integers(n)
+BLOCK_SIZE = 4096
+
+
+def draw_words(rng: np.random.Generator, n: int) -> Tuple[np.ndarray, np.ndarray, Dict]:
+    """
+    n raw 64 bit words of the generator, with the state of the stream (words used,
+    half word buffer) and the generator state to rewind to once it is known how many were used
+    """
+    if not isinstance(rng.bit_generator, np.random.PCG64):
+        raise TypeError('random streams reproduce the draws of a PCG64 generator only')
+    state = rng.bit_generator.state
+    stream = np.array([0, state['has_uint32'], state['uinteger']], dtype = np.int64)
+    return rng.bit_generator.random_raw(n), stream, state
+
+
+def release_words(rng: np.random.Generator, state: Dict, stream: Sequence[int]) -> None:
+    """
+    Put the generator where it would be had the used words been drawn one by one
+    """
+    rng.bit_generator.state = state
+    rng.bit_generator.advance(int(stream[0]))
+    state = rng.bit_generator.state
+    state['has_uint32'], state['uinteger'] = int(stream[1]), int(stream[2])
+    rng.bit_generator.state = state
+
+
+class RandomStream:
+    """
+    random() and integers(n) of a generator served from blocks of raw words
+
+    The words are drawn from the generator in blocks and turned into the same
+    values the generator itself would return, so a stream can stand in for the
+    generator without changing a seeded run. The generator runs ahead of the
+    stream by the unused rest of the block, sync puts it back to the point the
+    stream reached before anything else draws from it.
+    """
+
+    def __init__(self, rng: np.random.Generator, block_size: int = BLOCK_SIZE):
+        self.rng = rng
+        self.block_size = block_size
+
+        self._words: List[int] = []
+        self._cursor = 0
+        # generator state before the current block, None while the generator is in sync
+        self._state: Optional[Dict] = None
+        # the high half of a word kept for the next 32 bit draw, as in PCG64
+        self._has_uint32 = 0
+        self._uinteger = 0
+
+
+    def _refill(self) -> None:
+        words, stream, state = draw_words(self.rng, self.block_size)
+        if self._state is None:
+            self._has_uint32, self._uinteger = int(stream[1]), int(stream[2])
+        self._state = state
+        self._words = words.tolist()
+        self._cursor = 0
+
+
+    def _next_word(self) -> int:
+        if self._cursor == len(self._words):
+            self._refill()
+        word = self._words[self._cursor]
+        self._cursor += 1
+        return word
+
+
+    def _next_uint32(self) -> int:
+        if self._state is None:
+            # the half word buffer is the generator's until a block is drawn
+            self._refill()
+        if self._has_uint32:
+            self._has_uint32 = 0
+            return self._uinteger
+        word = self._next_word()
+        self._has_uint32 = 1
+        self._uinteger = word >> 32
+        return word & 0xFFFFFFFF
+
+
+    def random(self) -> float:
+        """
+        Same value as Generator.random()
+        """
+        return (self._next_word() >> 11) * (1.0 / 9007199254740992.0)
+
+
+    def integers(self, n: int) -> int:
+        """
+        Same value as Generator.integers(n) for n < 2^32, Lemire's bounded draw
+        """
+        if n == 1:
+            return 0
+        m = self._next_uint32() * n
+        leftover = m & 0xFFFFFFFF
+        if leftover < n:
+            threshold = (0xFFFFFFFF - (n - 1)) % n
+            while leftover < threshold:
+                m = self._next_uint32() * n
+                leftover = m & 0xFFFFFFFF
+        return m >> 32
+
+
+    def sync(self) -> None:
+        """
+        Rewind the generator to the point the stream reached, the rest of the block is dropped
+        """
+        if self._state is None:
+            return
+        release_words(self.rng, self._state, (self._cursor, self._has_uint32, self._uinteger))
+        self._state = None
+        self._words = []
+        self._cursor = 0
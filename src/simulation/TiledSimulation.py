@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+if 'simulation' in str(Path().cwd()):
+    from BaseSimulation import GRID_PAD, DummySim, WorldView, LayoutCache, spawn_cells, patch_points, food_field, \
+        update_food_field
+    from PSimulation import ProbabilisticSimulation
+else:
+    from simulation.BaseSimulation import GRID_PAD, DummySim, WorldView, LayoutCache, spawn_cells, patch_points, \
+        food_field, update_food_field
+    from simulation.PSimulation import ProbabilisticSimulation
+
+# side of a tile in cells
+TILE_SIZE = 64
+
+# steps between two sweeps releasing the tiles that became empty
+RELEASE_INTERVAL = 64
+
+
+def pad_slices(side: int, size: int) -> Tuple[slice, slice]:
+    """
+    Along one axis the cells of a tile of side size that mirror its neighbour
+    before (side -1), beside (0) or after (1) it, and the cells of the neighbour they mirror
+    """
+    if side < 0:
+        return slice(0, GRID_PAD), slice(size, size + GRID_PAD)
+    if side > 0:
+        return slice(GRID_PAD + size, size + 2 * GRID_PAD), slice(GRID_PAD, 2 * GRID_PAD)
+    return slice(GRID_PAD, GRID_PAD + size), slice(GRID_PAD, GRID_PAD + size)
+
+
+class TiledDummySim(DummySim):
+    """
+    DummySim on a sparse world of tiles, for huge fields that are mostly empty
+
+    The field is cut into tile_size x tile_size tiles and only the tiles that
+    hold resources, bots or trails are allocated, tiles maps tile coordinates to
+    them. A tile is a WorldView with padded grids like the dense ones, the pad
+    mirrors the border cells of the neighbouring tiles, so a bot senses
+    everything from the grids of its own tile. Every write goes to the tiles
+    holding the cell, its own and the pads of its neighbours. Tiles without
+    resources, bots and live trails are released every release_interval steps,
+    memory follows the part of the field that is in use. A seed gives the same
+    run as with the dense grids.
+    """
+
+    # grids of a tile and their types, the food masks are derived from the resources
+    tile_grids: Dict[str, type] = {'resource_grid': np.int16, 'bot_grid': np.uint8}
+    release_interval = RELEASE_INTERVAL
+
+    def __init__(self, *args, tile_size: int = TILE_SIZE, **kwargs):
+        if tile_size < 2 * GRID_PAD:
+            raise ValueError(f'tiles need a side of at least {2 * GRID_PAD} cells, got {tile_size}')
+        self.tile_size = tile_size
+        super().__init__(*args, **kwargs)
+
+
+    def _init_world(self) -> None:
+        """
+        No grids up front, tiles are allocated as the field gets used
+        """
+        self.tiles: Dict[Tuple[int, int], WorldView] = {}
+        # the static part of the world, shared by the views of all tiles
+        self.world = WorldView((self.field_size_x, self.field_size_y), None, None, None)
+
+
+    def config(self) -> Dict:
+        """
+        Constructor arguments of the simulation
+        """
+        config = super().config()
+        config.update(tile_size = self.tile_size)
+        return config
+
+
+    def _tile(self, tx: int, ty: int) -> WorldView:
+        """
+        Tile (tx, ty), allocated with its pad taken from the neighbours if it does not exist
+        """
+        view = self.tiles.get((tx, ty))
+        if view is None:
+            shape = (self.tile_size + 2 * GRID_PAD, self.tile_size + 2 * GRID_PAD)
+            grids = {name: np.zeros(shape, dtype = dtype) for name, dtype in self.tile_grids.items()}
+            view = self.world.window(grids['resource_grid'], np.zeros(shape, dtype = np.uint8), grids['bot_grid'],
+                grids.get('trail_expiry'), GRID_PAD - tx * self.tile_size, GRID_PAD - ty * self.tile_size)
+            view.step = self.steps
+            self.tiles[tx, ty] = view
+            self._fill_pad(tx, ty, self.tile_grids)
+            if view.resource_grid.any():
+                view.food_field[:] = food_field(view.resource_grid)
+        return view
+
+
+    def _fill_pad(self, tx: int, ty: int, names) -> None:
+        """
+        Copy the border cells of the neighbours of tile (tx, ty) into its pad, zeros for missing neighbours
+        """
+        view = self.tiles[tx, ty]
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if dx == dy == 0:
+                    continue
+                (own_x, other_x), (own_y, other_y) = pad_slices(dx, self.tile_size), pad_slices(dy, self.tile_size)
+                other = self.tiles.get((tx + dx, ty + dy))
+                for name in names:
+                    getattr(view, name)[own_x, own_y] = 0 if other is None else getattr(other, name)[other_x, other_y]
+
+
+    def _views(self, x: int, y: int) -> List[Tuple[WorldView, int, int]]:
+        """
+        Tiles whose grids hold cell (x, y) and where they hold it, its own tile first
+        """
+        size = self.tile_size
+        tx, local_x = divmod(x, size)
+        ty, local_y = divmod(y, size)
+        if GRID_PAD <= local_x < size - GRID_PAD and GRID_PAD <= local_y < size - GRID_PAD:
+            # most cells are in no pad
+            view = self.tiles.get((tx, ty))
+            return [] if view is None else [(view, x + view.offset_x, y + view.offset_y)]
+
+        txs = (tx, tx - 1) if local_x < GRID_PAD else (tx, tx + 1) if local_x >= size - GRID_PAD else (tx,)
+        tys = (ty, ty - 1) if local_y < GRID_PAD else (ty, ty + 1) if local_y >= size - GRID_PAD else (ty,)
+
+        views = []
+        for kx in txs:
+            for ky in tys:
+                view = self.tiles.get((kx, ky))
+                if view is not None:
+                    views.append((view, x + view.offset_x, y + view.offset_y))
+        return views
+
+
+    def _grid_cells(self, name: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Field coordinates and values of the nonzero cells of grid name of all tiles
+        """
+        inner = slice(GRID_PAD, GRID_PAD + self.tile_size)
+        xs, ys, values = [np.zeros(0, dtype = np.int64)], [np.zeros(0, dtype = np.int64)], [np.zeros(0, dtype = np.int64)]
+        for view in self.tiles.values():
+            grid = getattr(view, name)[inner, inner]
+            cell_x, cell_y = np.nonzero(grid)
+            xs.append(cell_x + GRID_PAD - view.offset_x)
+            ys.append(cell_y + GRID_PAD - view.offset_y)
+            values.append(grid[cell_x, cell_y].astype(np.int64))
+        return np.concatenate(xs), np.concatenate(ys), np.concatenate(values)
+
+
+    def cell_values(self, name: str, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        Values of grid name at the field cells xs, ys, 0 on cells without a tile
+        """
+        size = self.tile_size
+        values = np.zeros(len(xs), dtype = np.int64)
+        for i, (x, y) in enumerate(zip(np.asarray(xs).tolist(), np.asarray(ys).tolist())):
+            view = self.tiles.get((x // size, y // size))
+            if view is not None:
+                values[i] = getattr(view, name)[x + view.offset_x, y + view.offset_y]
+        return values
+
+
+    def _load_cells(self, name: str, xs: np.ndarray, ys: np.ndarray, values: np.ndarray) -> None:
+        """
+        Write values to cells xs, ys of grid name, allocating their tiles, and bring every pad up to date
+        """
+        size = self.tile_size
+        keys, inverse = np.unique(np.stack((xs // size, ys // size), axis = 1).reshape(-1, 2), axis = 0,
+            return_inverse = True)
+        order = np.argsort(inverse.ravel(), kind = 'stable')
+        groups = np.split(order, np.cumsum(np.bincount(inverse.ravel(), minlength = len(keys)))[:-1])
+        for (tx, ty), cells in zip(keys.tolist(), groups):
+            view = self._tile(tx, ty)
+            getattr(view, name)[xs[cells] + view.offset_x, ys[cells] + view.offset_y] = values[cells]
+
+        for tx, ty in self.tiles:
+            self._fill_pad(tx, ty, (name,))
+
+
+    def _grid_state(self) -> Dict[str, np.ndarray]:
+        """
+        Nonzero cells of the tiles as rows of x, y and value, saved in snapshots
+        """
+        return {'tile' + name: np.stack(self._grid_cells(name)) for name in self.tile_grids}
+
+
+    def _load_grid_state(self, state) -> None:
+        for name in self.tile_grids:
+            xs, ys, values = state['tile' + name]
+            self._load_cells(name, xs, ys, values)
+        self.refresh_food_field()
+
+
+    def _set_resources(self, xs: np.ndarray, ys: np.ndarray, amounts: np.ndarray) -> None:
+        for view in self.tiles.values():
+            view.resource_grid[:] = 0
+        self._load_cells('resource_grid', xs, ys, amounts)
+        self.refresh_food_field()
+        # tiles of the old resources that got no new ones
+        self.release_tiles()
+
+
+    def patch_resources(self, method: str = 'kmeans', n_clusters: int = 10,
+        cache: Optional[LayoutCache] = None) -> None:
+        """
+        Move resources closer to the center of their cluster, see patch_layout
+        layout caches key dense resource grids and can not be used
+        """
+        if cache is not None:
+            raise ValueError('layout caches store dense resource grids, tiled simulations patch without one')
+
+        xs, ys, amounts = self._grid_cells('resource_grid')
+        if xs.size:
+            # clustered in the row-major order of the dense grid for the same random draws
+            order = np.lexsort((ys, xs))
+            xs, ys = patch_points(self.rng, xs[order], ys[order], (self.field_size_x, self.field_size_y), method,
+                n_clusters)
+            # resources moved onto the same cell add up
+            cells, inverse = np.unique(xs * self.field_size_y + ys, return_inverse = True)
+            amounts = np.bincount(inverse.ravel(), amounts[order], cells.size).astype(np.int64)
+            xs, ys = np.divmod(cells, self.field_size_y)
+        self._set_resources(xs, ys, amounts)
+
+
+    def refresh_food_field(self) -> None:
+        """
+        Rebuild the food masks of every tile
+        """
+        for view in self.tiles.values():
+            view.food_field[:] = food_field(view.resource_grid)
+
+
+    def resources_left(self) -> int:
+        """
+        Units of food left on the field
+        """
+        inner = slice(GRID_PAD, GRID_PAD + self.tile_size)
+        return sum(int(view.resource_grid[inner, inner].sum()) for view in self.tiles.values())
+
+
+    def take_food(self, x: int, y: int) -> None:
+        """
+        Remove a unit of food picked up at (x, y) from the tiles holding it
+        """
+        views = self._views(x, y)
+        for view, cell_x, cell_y in views:
+            view.resource_grid[cell_x, cell_y] -= 1
+        self.picked_food += 1
+
+        view, cell_x, cell_y = views[0]
+        if not view.resource_grid[cell_x, cell_y]:
+            for view, cell_x, cell_y in views:
+                update_food_field(view.food_field, view.resource_grid, cell_x, cell_y)
+
+
+    def init_bots(self) -> None:
+        """
+        Initialize bots on distinct cells around the storage
+        """
+        xs, ys = spawn_cells(self.rng, (self.field_size_x, self.field_size_y), self.n_bots)
+        self._load_cells('bot_grid', xs, ys, np.ones(xs.size, dtype = np.int64))
+        self.bots = [self.new_bot(x, y) for x, y in zip(xs.tolist(), ys.tolist())]
+
+
+    def move_bots(self, old_coordinates: List[Tuple[int, int]], bots: Optional[List] = None) -> None:
+        """
+        Move bots on the tiles once every bot made its step, allocating the tiles they enter
+        bots are all bots of the simulation unless given
+        """
+        tiles, size = self.tiles, self.tile_size
+        for (x, y), bot in zip(old_coordinates, self.bots if bots is None else bots):
+            if x == bot.pos_x and y == bot.pos_y:
+                continue
+            for view, cell_x, cell_y in self._views(x, y):
+                view.bot_grid[cell_x, cell_y] -= 1
+            if (bot.pos_x // size, bot.pos_y // size) not in tiles:
+                self._tile(bot.pos_x // size, bot.pos_y // size)
+            for view, cell_x, cell_y in self._views(bot.pos_x, bot.pos_y):
+                view.bot_grid[cell_x, cell_y] += 1
+
+
+    def release_tiles(self) -> int:
+        """
+        Release the tiles without resources, bots and live trails, returns how many
+        """
+        inner = slice(GRID_PAD, GRID_PAD + self.tile_size)
+        empty = [key for key, view in self.tiles.items() if not (view.resource_grid[inner, inner].any()
+            or view.bot_grid[inner, inner].any()
+            or view.trail_expiry is not None and (view.trail_expiry[inner, inner] > self.steps).any())]
+        for key in empty:
+            del self.tiles[key]
+        return len(empty)
+
+
+    def simulate_step(self) -> None:
+        if self.steps and self.steps % self.release_interval == 0:
+            self.release_tiles()
+
+        old_coordinates = []
+        tiles, size = self.tiles, self.tile_size
+        for view in tiles.values():
+            view.step = self.steps
+
+        for bot in self.bots:
+
+            old_coordinates.append((bot.pos_x, bot.pos_y))
+
+            # a bot senses through the grids of the tile it stands on
+            stored_food, food_picked = bot.update_env(tiles[bot.pos_x // size, bot.pos_y // size])
+            # increase stored food count
+            self.stored_food += stored_food
+            # if food is picked remove a unit from resource field
+            if food_picked:
+                self.take_food(bot.pos_x, bot.pos_y)
+
+            bot.step()
+
+        # bots sense the positions of the previous step
+        self.move_bots(old_coordinates)
+        self.steps += 1
+
+
+class TiledSimulation(TiledDummySim, ProbabilisticSimulation):
+    """
+    ProbabilisticSimulation on a sparse world of tiles, trails keep their tiles until they expire
+    """
+
+    tile_grids = {**TiledDummySim.tile_grids, 'trail_expiry': np.int32}
+
+
+    def simulate_step(self) -> None:
+        super().simulate_step()
+        # trails of the previous step are sensed, they are left after the move
+        marking = [bot for bot in self.bots if bot.leave_mark]
+        self.leave_trails([bot.pos_x for bot in marking], [bot.pos_y for bot in marking])
+
+
+    def leave_trails(self, xs: Sequence[int], ys: Sequence[int]) -> None:
+        """
+        Leave trails on cells xs, ys after a step, allocating the tiles they are on
+        """
+        size, expiry = self.tile_size, self.steps + self.trail_lifetime
+        for x, y in zip(xs, ys):
+            self._tile(x // size, y // size)
+            for view, cell_x, cell_y in self._views(x, y):
+                view.trail_expiry[cell_x, cell_y] = expiry
+
+
+def main():
+    my_sim = TiledSimulation(field_size = (50_000, 50_000), n_bots = 1000, p_resource = 1e-6, resource_dist = (10, 2),
+        p_leave_trail = 0.2, p_follow_trail = 0.1, seed = 0)
+    my_sim.init_resources()
+    my_sim.patch_resources(method = 'minibatch')
+    my_sim.init_bots()
+    for _ in range(1000):
+        my_sim.simulate_step()
+
+    print(f'{my_sim.stored_food} stored, {len(my_sim.tiles)} tiles')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from pathlib import Path
+from typing import Dict, Tuple, List, Optional
+
+if 'simulation' in str(Path().cwd()):
+    from BaseSimulation import GRID_PAD, DIR_U, DIR_D, DIR_L, DIR_R, ALL_DIRS, DIR_NAMES, sample_resources, \
+        patch_layout, spawn_cells, Snapshots, GridViews
+    from LayoutCache import LayoutCache
+    from Profiler import StepProfiler, Profiling
+else:
+    from simulation.BaseSimulation import GRID_PAD, DIR_U, DIR_D, DIR_L, DIR_R, ALL_DIRS, DIR_NAMES, sample_resources, \
+        patch_layout, spawn_cells, Snapshots, GridViews
+    from simulation.LayoutCache import LayoutCache
+    from simulation.Profiler import StepProfiler, Profiling
+
+# number of set bits and the n-th set bit of every direction mask
+POPCOUNT = np.zeros(16, dtype = np.int64)
+NTH_BIT = np.zeros((16, 4), dtype = np.int64)
+for _mask in range(16):
+    _bits = [bit for bit in DIR_NAMES if _mask & bit]
+    POPCOUNT[_mask] = len(_bits)
+    NTH_BIT[_mask, :len(_bits)] = _bits
+
+# move deltas indexed by direction bit, 0 means stay in place
+DELTA_X = np.zeros(16, dtype = np.int64)
+DELTA_Y = np.zeros(16, dtype = np.int64)
+DELTA_X[DIR_U], DELTA_X[DIR_D] = -1, 1
+DELTA_Y[DIR_L], DELTA_Y[DIR_R] = -1, 1
+
+
+class BotView:
+    """
+    Read only view of one bot of a vectorized simulation
+    so code written for the bot objects (GUI, notebooks) keeps working
+    """
+    __slots__ = ('_sim', '_i')
+
+    def __init__(self, sim: 'EnsembleSimulation', i: int):
+        self._sim = sim
+        self._i = i
+
+    @property
+    def pos_x(self) -> int:
+        return int(self._sim.pos_x[self._i])
+
+    @property
+    def pos_y(self) -> int:
+        return int(self._sim.pos_y[self._i])
+
+    @property
+    def has_food(self) -> bool:
+        return bool(self._sim.has_food[self._i])
+
+    @property
+    def food_one_away(self) -> bool:
+        return bool(self._sim.food_one_away[self._i])
+
+    @property
+    def leave_mark(self) -> bool:
+        return bool(self._sim.leave_mark[self._i])
+
+    @property
+    def tracking_on(self) -> bool:
+        return bool(self._sim.tracking_on[self._i])
+
+    def print_bot(self) -> None:
+        """
+        Print bot state
+        """
+        print(f'x: {self.pos_x}, y : {self.pos_y}')
+        print(f'has food: {self.has_food}, leave mark: {self.leave_mark}, tracking: {self.tracking_on}')
+
+
+class EnsembleSimulation(Snapshots, Profiling):
+    """
+    N independent ProbabilisticSimulation worlds advanced together
+    world w uses params[w] = (p_leave_trail, p_follow_trail)
+    with common_layout every world starts from the same resources and bot placement
+    a trail is sensed for trail_lifetime steps after the step it was left in
+
+    All bot state is kept in arrays and every phase of a step is evaluated
+    for the bots of all worlds at once on stacked padded grids. Bots see the
+    bot positions and trails of the previous step just like in
+    ProbabilisticSimulation, only concurrent pickups on the same cell are
+    resolved in bot order up front instead of interleaved with sensing.
+    """
+
+    # counters, padded grids and bot arrays saved in snapshots
+    counter_fields: Tuple[str, ...] = ('steps',)
+    grid_fields: Tuple[str, ...] = ('_resources', '_occupancy', '_trail_expiry')
+    array_fields: Tuple[str, ...] = ('pos_x', 'pos_y', 'has_food', 'leave_mark', 'tracking_on', 'food_one_away',
+        'world_stored_food', 'world_picked_food')
+
+    def __init__(self, field_size: Tuple[int, int], n_bots: int, p_resource: float, resource_dist: Tuple[float, float],
+        params: np.ndarray, *, trail_lifetime: int = 100, seed: Optional[int] = None, common_layout: bool = False):
+
+        # every random draw of the simulation comes from this generator
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.common_layout = common_layout
+
+        self.field_size_x = field_size[0]
+        self.field_size_y = field_size[1]
+
+        self.n_bots = n_bots
+        self.p_resource = p_resource
+
+        self.resource_dist_mean = resource_dist[0]
+        self.resource_dist_std = resource_dist[1]
+
+        self.params = np.atleast_2d(np.asarray(params, dtype = float))
+        self.n_worlds = self.params.shape[0]
+
+        self.storage_x = self.field_size_x // 2
+        self.storage_y = self.field_size_y // 2
+
+        self.world_stored_food = np.zeros(self.n_worlds, dtype = np.int64)
+        self.world_picked_food = np.zeros(self.n_worlds, dtype = np.int64)
+        self.steps = 0
+        self.trail_lifetime = trail_lifetime
+
+        # stacked padded grids, the public *_grid attributes are views of the fields themselves
+        shape = (self.n_worlds, self.field_size_x + 2 * GRID_PAD, self.field_size_y + 2 * GRID_PAD)
+        self._width = shape[2]
+        self._world_cells = shape[1] * shape[2]
+        self._resources = np.zeros(shape, dtype = np.int16)
+        self._occupancy = np.zeros(shape, dtype = np.uint8)
+        # trails decay implicitly, a cell is on trail while its expiry step is ahead
+        self._trail_expiry = np.zeros(shape, dtype = np.int32)
+
+        self._resource_fields = self._resources[:, GRID_PAD:-GRID_PAD, GRID_PAD:-GRID_PAD]
+        self._bot_fields = self._occupancy[:, GRID_PAD:-GRID_PAD, GRID_PAD:-GRID_PAD]
+        self._trail_fields = self._trail_expiry[:, GRID_PAD:-GRID_PAD, GRID_PAD:-GRID_PAD]
+        self.resource_grid = self._resource_fields
+        self.bot_grid = self._bot_fields
+        self.trail_expiry = self._trail_fields
+
+        # neighbour offsets in the flattened padded grids
+        self._orthogonal = ((DIR_U, -self._width), (DIR_D, self._width), (DIR_L, -1), (DIR_R, 1))
+
+        # bot state, the bots of world w are the n_bots consecutive entries from w * n_bots
+        self.world = np.repeat(np.arange(self.n_worlds), self.n_bots)
+        self.pos_x = np.zeros(0, dtype = np.int64)
+        self.pos_y = np.zeros(0, dtype = np.int64)
+        self.has_food = np.zeros(0, dtype = bool)
+        self.leave_mark = np.zeros(0, dtype = bool)
+        self.tracking_on = np.zeros(0, dtype = bool)
+        self.food_one_away = np.zeros(0, dtype = bool)
+
+        self.profiler: Optional[StepProfiler] = None
+
+
+    @property
+    def stored_food(self) -> np.ndarray:
+        return self.world_stored_food
+
+    @property
+    def trail_grid(self) -> np.ndarray:
+        """
+        Remaining trail lifetime of every cell, 0 where there is no trail
+        """
+        return np.maximum(self.trail_expiry - self.steps, 0)
+
+
+    def config(self) -> Dict:
+        """
+        Constructor arguments of the simulation
+        """
+        return {
+            'field_size': (self.field_size_x, self.field_size_y),
+            'n_bots': self.n_bots,
+            'p_resource': self.p_resource,
+            'resource_dist': (self.resource_dist_mean, self.resource_dist_std),
+            'params': self.params.tolist(),
+            'trail_lifetime': self.trail_lifetime,
+            'seed': self.seed,
+            'common_layout': self.common_layout,
+        }
+
+
+    def _bot_state(self) -> Dict[str, np.ndarray]:
+        return {field: getattr(self, field) for field in self.array_fields}
+
+
+    def _load_bot_state(self, state) -> None:
+        for field in self.array_fields:
+            setattr(self, field, state[field].copy())
+
+
+    def init_resources(self) -> None:
+        """
+        Initialize resources of every world
+        """
+        n_layouts = 1 if self.common_layout else self.n_worlds
+        self._resource_fields[:] = 0
+        for resource_grid in self._resource_fields[:n_layouts]:
+            xs, ys, amounts = sample_resources(self.rng, (self.field_size_x, self.field_size_y), self.p_resource,
+                (self.resource_dist_mean, self.resource_dist_std))
+            # a cell with amount <= 0 still yields exactly one pickup in the dict based sims
+            resource_grid[xs, ys] = np.maximum(amounts, 1)
+        if self.common_layout:
+            self._resource_fields[1:] = self._resource_fields[0]
+
+
+    def patch_resources(self, method: str = 'kmeans', n_clusters: int = 10,
+        cache: Optional[LayoutCache] = None) -> None:
+        """
+        Move resources closer to the center of their cluster, see patch_layout
+        """
+        for resource_grid in self._resource_fields[:1] if self.common_layout else self._resource_fields:
+            patch_layout(self.rng, resource_grid, method, n_clusters, cache)
+
+        if self.common_layout:
+            self._resource_fields[1:] = self._resource_fields[0]
+
+
+    def init_bots(self) -> None:
+        """
+        Initialize bots on distinct cells around the storage of every world
+        """
+        n_layouts = 1 if self.common_layout else self.n_worlds
+        cells = [spawn_cells(self.rng, (self.field_size_x, self.field_size_y), self.n_bots) for _ in range(n_layouts)]
+        self.pos_x = np.tile(np.concatenate([xs for xs, _ in cells]), self.n_worlds // n_layouts)
+        self.pos_y = np.tile(np.concatenate([ys for _, ys in cells]), self.n_worlds // n_layouts)
+
+        n = self.world.size
+        self.has_food = np.zeros(n, dtype = bool)
+        self.leave_mark = np.zeros(n, dtype = bool)
+        self.tracking_on = np.zeros(n, dtype = bool)
+        self.food_one_away = np.zeros(n, dtype = bool)
+
+        self._bot_fields[:] = 0
+        np.add.at(self._bot_fields, (self.world, self.pos_x, self.pos_y), 1)
+
+
+    def _cells(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Flat indices into the stacked padded grids
+        """
+        return self.world * self._world_cells + (x + GRID_PAD) * self._width + (y + GRID_PAD)
+
+
+    def _sense(self, grid: np.ndarray, cells: np.ndarray, distance: int = 1, above: int = 0) -> np.ndarray:
+        """
+        Direction mask of orthogonal neighbours at distance with a grid value above the threshold
+        """
+        mask = np.zeros(cells.size, dtype = np.int64)
+        for bit, offset in self._orthogonal:
+            mask |= np.where(grid[cells + distance * offset] > above, bit, 0)
+        return mask
+
+
+    def _sense_diagonal(self, grid: np.ndarray, cells: np.ndarray,
+        bits: Tuple[int, int, int, int]) -> np.ndarray:
+        """
+        Direction mask from the up-left, up-right, down-right, down-left neighbours
+        """
+        w = self._width
+        mask = np.zeros(cells.size, dtype = np.int64)
+        for bit, offset in zip(bits, (-w - 1, -w + 1, w + 1, w - 1)):
+            mask |= np.where(grid[cells + offset] > 0, bit, 0)
+        return mask
+
+
+    def _pick_up_food(self, candidates: np.ndarray, cells: np.ndarray, resources: np.ndarray) -> np.ndarray:
+        """
+        Let candidate bots pick up food, while a cell lasts the lower bot index wins
+        returns the bots that picked up food
+        """
+        if candidates.size == 0:
+            return candidates
+
+        order = np.argsort(cells[candidates], kind = 'stable')
+        sorted_cells = cells[candidates][order]
+
+        group_start = np.ones(sorted_cells.size, dtype = bool)
+        group_start[1:] = sorted_cells[1:] != sorted_cells[:-1]
+        position = np.arange(sorted_cells.size)
+        rank = position - np.maximum.accumulate(np.where(group_start, position, 0))
+
+        got_food = rank < resources[sorted_cells]
+        np.subtract.at(resources, sorted_cells[got_food], 1)
+        return candidates[order[got_food]]
+
+
+    def simulate_step(self) -> None:
+
+        resources = self._resources.ravel()
+        occupancy = self._occupancy.ravel()
+        trail_expiry = self._trail_expiry.ravel()
+
+        n = self.world.size
+        p_leave_trail = self.params[self.world, 0]
+        p_follow_trail = self.params[self.world, 1]
+
+        x, y = self.pos_x, self.pos_y
+        cells = self._cells(x, y)
+
+        options = np.full(n, ALL_DIRS, dtype = np.int64)
+        food_dir = np.zeros(n, dtype = np.int64)
+        trails_sensed = np.zeros(n, dtype = np.int64)
+
+        to_storage = (np.where(y > self.storage_y, DIR_L, 0) | np.where(y < self.storage_y, DIR_R, 0)
+            | np.where(x > self.storage_x, DIR_U, 0) | np.where(x < self.storage_x, DIR_D, 0))
+
+        carrying = self.has_food.copy()
+
+        # searching bots on food grab it and that is what they do for the step
+        picked = self._pick_up_food(np.flatnonzero(~carrying & (resources[cells] > 0)), cells, resources)
+        self.has_food[picked] = True
+        self.world_picked_food += np.bincount(self.world[picked], minlength = self.n_worlds)
+        self.leave_mark[picked] = self.rng.random(picked.size) < p_leave_trail[picked]
+        self.tracking_on[picked] = False
+        options[picked] = 0
+
+        # the other searching bots check for food and trails in proximity
+        searching = ~carrying
+        searching[picked] = False
+        s = np.flatnonzero(searching)
+        s_cells = cells[s]
+
+        close = self._sense(resources, s_cells)
+        self.food_one_away[s[close != 0]] = True
+        two = (self._sense(resources, s_cells, 2)
+            | self._sense_diagonal(resources, s_cells, (DIR_U | DIR_L, DIR_U | DIR_R, DIR_R | DIR_D, DIR_D | DIR_L)))
+        food_dir[s] = close | np.where(self.food_one_away[s], 0, two)
+
+        # only keep trails leading away from the storage
+        sensed = self._sense(trail_expiry, s_cells, above = self.steps) & ~to_storage[s]
+        deciding = ~self.tracking_on[s] & (sensed != 0)
+        follows = np.zeros(s.size, dtype = bool)
+        follows[deciding] = self.rng.random(np.count_nonzero(deciding)) < p_follow_trail[s[deciding]]
+        self.tracking_on[s[follows]] = True
+        sensed[deciding & ~follows] = 0
+        trails_sensed[s] = sensed
+
+        # carrying bots store food or head back to the storage
+        at_storage = carrying & (x == self.storage_x) & (y == self.storage_y)
+        self.has_food[at_storage] = False
+        self.leave_mark[at_storage] = False
+        options[at_storage] = 0
+        self.world_stored_food += np.bincount(self.world[at_storage], minlength = self.n_worlds)
+
+        homing = carrying & ~at_storage
+        options[homing] = to_storage[homing]
+
+        # protect from collision, orthogonal only for searching bots off the storage axes
+        blocked = self._sense_diagonal(occupancy, cells, (DIR_L, DIR_U, DIR_R, DIR_D))
+        guarded = np.flatnonzero(~self.has_food & (x != self.storage_x) & (y != self.storage_y))
+        blocked[guarded] |= self._sense(occupancy, cells[guarded]) | self._sense(occupancy, cells[guarded], 2)
+
+        # avoid walls
+        blocked |= np.where(x == 0, DIR_U, np.where(x >= self.field_size_x - 1, DIR_D, 0))
+        blocked |= np.where(y == 0, DIR_L, np.where(y >= self.field_size_y - 1, DIR_R, 0))
+
+        food_dir &= ~blocked
+        options &= ~blocked
+
+        # move in a random allowed direction, food first, then trails, then anything
+        choice = np.where(food_dir != 0, food_dir, np.where(trails_sensed != 0, trails_sensed, options))
+        nth = (self.rng.random(n) * POPCOUNT[choice]).astype(np.int64)
+        direction = NTH_BIT[choice, nth]
+        self.pos_x = x + DELTA_X[direction]
+        self.pos_y = y + DELTA_Y[direction]
+
+        new_cells = self._cells(self.pos_x, self.pos_y)
+        np.subtract.at(occupancy, cells, 1)
+        np.add.at(occupancy, new_cells, 1)
+
+        # leave new marks
+        self.steps += 1
+        self.leave_trails(new_cells[self.leave_mark])
+
+
+    def leave_trails(self, cells: np.ndarray) -> None:
+        """
+        Leave trails on the flat cells of the stacked grids after a step
+        """
+        self._trail_expiry.ravel()[cells] = self.steps + self.trail_lifetime
+
+
+    def run(self, max_steps: int) -> np.ndarray:
+        """
+        Simulate up to max_steps steps and return the stored food
+        stops as soon as the stored food of no world can change anymore
+        """
+        food_left = self._resource_fields.sum(axis = (1, 2), dtype = np.int64)
+        picked_before = self.world_picked_food.copy()
+
+        for _ in range(max_steps):
+            exhausted = food_left == self.world_picked_food - picked_before
+            if np.all(exhausted & (self.world_picked_food == self.world_stored_food)):
+                break
+            self.simulate_step()
+
+        return self.stored_food
+
+
+class VectorSimulation(EnsembleSimulation, GridViews):
+    """
+    Single world vectorized drop-in for ProbabilisticSimulation
+    """
+
+    def __init__(self, field_size: Tuple[int, int], n_bots: int, p_resource: float, resource_dist: Tuple[float, float],
+        *, p_leave_trail: float, p_follow_trail: float, trail_lifetime: int = 100, seed: Optional[int] = None):
+
+        super().__init__(field_size, n_bots, p_resource, resource_dist, [[p_leave_trail, p_follow_trail]],
+            trail_lifetime = trail_lifetime, seed = seed)
+
+        self.p_leave_trail = p_leave_trail
+        self.p_follow_trail = p_follow_trail
+
+        self.resource_grid = self._resource_fields[0]
+        self.bot_grid = self._bot_fields[0]
+        self.trail_expiry = self._trail_fields[0]
+
+
+    def config(self) -> Dict:
+        """
+        Constructor arguments of the simulation
+        """
+        config = super().config()
+        del config['params'], config['common_layout']
+        config.update(p_leave_trail = self.p_leave_trail, p_follow_trail = self.p_follow_trail)
+        return config
+
+
+    @property
+    def stored_food(self) -> int:
+        return int(self.world_stored_food[0])
+
+    @property
+    def bots(self) -> List[BotView]:
+        return [BotView(self, i) for i in range(self.pos_x.size)]
+
+
+
+def main():
+    my_sim = VectorSimulation(field_size = (1000, 1000), n_bots = 10_000, p_resource = 0.05, resource_dist = (10, 2),
+        p_leave_trail = 0.2, p_follow_trail = 0.1, seed = 0)
+    my_sim.init_resources()
+    my_sim.init_bots()
+    for _ in range(1000):
+        my_sim.simulate_step()
+
+    print(f'{my_sim.stored_food}')
+
+    my_ensemble = EnsembleSimulation(field_size = (100, 100), n_bots = 10, p_resource = 0.05, resource_dist = (10, 2),
+        params = np.random.default_rng(0).random((14, 2)), seed = 0, common_layout = True)
+    my_ensemble.init_resources()
+    my_ensemble.init_bots()
+    for _ in range(1000):
+        my_ensemble.simulate_step()
+
+    print(f'{my_ensemble.stored_food}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+
+import json
+import zlib
+import numpy as np
+
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from simulation.VectorSimulation import BotView, VectorSimulation
+
+# bot flags packed into one byte per bot and step
+FLAG_HAS_FOOD, FLAG_LEAVE_MARK, FLAG_TRACKING_ON = 1, 2, 4
+
+# positions are stored in 16 bits while the field fits, the header records the choice
+POSITION_DTYPES = ('<i2', '<i4')
+
+
+def position_dtype(field_size: Tuple[int, int]) -> str:
+    """
+    Smallest dtype of POSITION_DTYPES that holds every coordinate of the field
+    """
+    for dtype in POSITION_DTYPES:
+        if max(field_size) - 1 <= np.iinfo(np.dtype(dtype)).max:
+            return dtype
+    raise ValueError(f'field of size {field_size} is too large to record')
+
+
+def bot_dtype(position: str) -> np.dtype:
+    """
+    Record of one bot in bots.bin
+    """
+    return np.dtype([('x', position), ('y', position), ('flags', 'u1')])
+
+STATS_DTYPE = np.dtype([('step', '<i8'), ('stored_food', '<i8'), ('picked_food', '<i8')])
+# byte offset and length of every compressed delta chunk
+CHUNK_DTYPE = np.dtype([('offset', '<i8'), ('length', '<i8')])
+
+
+def bot_state(sim) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Positions and packed flags of the bots of a simulation
+    the vectorized engines are read from their arrays, of an ensemble only world 0
+    """
+    if isinstance(getattr(sim, 'pos_x', None), np.ndarray):
+        n = sim.n_bots
+        flags = (sim.has_food[:n] * FLAG_HAS_FOOD | sim.leave_mark[:n] * FLAG_LEAVE_MARK
+            | sim.tracking_on[:n] * FLAG_TRACKING_ON)
+        return sim.pos_x[:n], sim.pos_y[:n], flags
+
+    pos_x = np.array([bot.pos_x for bot in sim.bots], dtype = np.int64)
+    pos_y = np.array([bot.pos_y for bot in sim.bots], dtype = np.int64)
+    flags = np.array([bot.has_food * FLAG_HAS_FOOD | getattr(bot, 'leave_mark', False) * FLAG_LEAVE_MARK
+        | getattr(bot, 'tracking_on', False) * FLAG_TRACKING_ON for bot in sim.bots], dtype = np.int64)
+    return pos_x, pos_y, flags
+
+
+def food_counters(sim) -> Tuple[int, int]:
+    """
+    Stored and picked food of a simulation, of an ensemble world 0
+    """
+    if hasattr(sim, 'world_picked_food'):
+        return int(sim.world_stored_food[0]), int(sim.world_picked_food[0])
+    return sim.stored_food, sim.picked_food
+
+
+class TrajectoryRecorder:
+    """
+    Streams the state of a simulation after every step into the directory path
+
+    bots.bin and stats.bin hold one fixed size record per frame, keyframes.bin
+    the full resource and trail grids every keyframe_interval frames. The cells
+    of the grids that changed in between are appended to deltas.bin as one zlib
+    compressed chunk per keyframe interval, indexed by chunks.bin. Every file is
+    only ever appended to and can be read with np.memmap, see TrajectoryReader.
+    """
+
+    def __init__(self, path: Union[str, Path], sim, keyframe_interval: int = 100):
+        if not hasattr(sim, 'resource_grid'):
+            raise TypeError(f'{type(sim).__name__} keeps its field in tiles, only full grids can be recorded')
+
+        self.path = Path(path)
+        self.path.mkdir(parents = True, exist_ok = True)
+        self.sim = sim
+        self.keyframe_interval = keyframe_interval
+        self.has_trails = hasattr(sim, 'trail_expiry')
+        self.bot_dtype = bot_dtype(position_dtype((sim.field_size_x, sim.field_size_y)))
+
+        self.header = {
+            'field_size': [sim.field_size_x, sim.field_size_y],
+            'n_bots': sim.n_bots,
+            'keyframe_interval': keyframe_interval,
+            'has_trails': self.has_trails,
+            'position_dtype': self.bot_dtype['x'].str,
+        }
+        with open(self.path.joinpath('header.json'), 'w') as file:
+            json.dump(self.header, file)
+
+        self._files = {name: open(self.path.joinpath(name + '.bin'), 'wb')
+            for name in ('bots', 'stats', 'keyframes', 'deltas', 'chunks')}
+        self._deltas_offset = 0
+        self.n_frames = 0
+
+        self._resources = np.array(sim.resource_grid)
+        self._trails = np.array(sim.trail_expiry) if self.has_trails else None
+        # cells and new values of the grids per frame of the current chunk
+        self._chunk: List[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = []
+
+
+    def _grid_delta(self, old: np.ndarray, new: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        cells = np.flatnonzero(old != new)
+        values = new.ravel()[cells]
+        old.ravel()[cells] = values
+        return cells.astype(np.uint32), values.astype(np.int32)
+
+
+    def record(self) -> None:
+        """
+        Append the current state of the simulation as the next frame
+        """
+        sim = self.sim
+        bots = np.zeros(sim.n_bots, dtype = self.bot_dtype)
+        bots['x'], bots['y'], bots['flags'] = bot_state(sim)
+        self._files['bots'].write(bots.tobytes())
+
+        stats = np.array([(sim.steps, *food_counters(sim))], dtype = STATS_DTYPE)
+        self._files['stats'].write(stats.tobytes())
+
+        res_cells, res_values = self._grid_delta(self._resources, np.asarray(sim.resource_grid))
+        trail_cells, trail_values = (self._grid_delta(self._trails, np.asarray(sim.trail_expiry))
+            if self.has_trails else (np.zeros(0, np.uint32), np.zeros(0, np.int32)))
+
+        if self.n_frames % self.keyframe_interval == 0:
+            self._flush_chunk()
+            self._files['keyframes'].write(self._resources.astype('<i2').tobytes())
+            if self.has_trails:
+                self._files['keyframes'].write(self._trails.astype('<i4').tobytes())
+        else:
+            self._chunk.append((res_cells, res_values, trail_cells, trail_values))
+
+        self.n_frames += 1
+
+
+    def _flush_chunk(self) -> None:
+        """
+        Compress and append the deltas of the frames since the last keyframe
+        """
+        if self.n_frames == 0:
+            return
+
+        columns = list(zip(*self._chunk)) if self._chunk else [[]] * 4
+        counts = np.array([[len(cells) for cells in columns[0]], [len(cells) for cells in columns[2]]],
+            dtype = '<i4').reshape(2, -1)
+        parts = [np.array([counts.shape[1]], dtype = '<i4'), counts]
+        parts += [np.concatenate(column).astype(dtype) if len(column) else np.zeros(0, dtype)
+            for column, dtype in zip(columns, ('<u4', '<i4', '<u4', '<i4'))]
+        payload = zlib.compress(b''.join(part.tobytes() for part in parts))
+
+        self._files['deltas'].write(payload)
+        self._files['chunks'].write(np.array([(self._deltas_offset, len(payload))], dtype = CHUNK_DTYPE).tobytes())
+        self._deltas_offset += len(payload)
+        self._chunk = []
+
+        for file in self._files.values():
+            file.flush()
+
+
+    def close(self) -> None:
+        # the frames after the last keyframe form the last chunk
+        self._flush_chunk()
+        for file in self._files.values():
+            file.close()
+
+    def __enter__(self) -> 'TrajectoryRecorder':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class TrajectoryReader:
+    """
+    Random access to a trajectory written by TrajectoryRecorder
+
+    seek rebuilds the grids of any frame from the nearest keyframe before it,
+    stepping forward only applies the deltas of the next frame. The attributes
+    mirror those of the simulations, so the GUI can draw a replay like a live run.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path.joinpath('header.json')) as file:
+            self.header = json.load(file)
+
+        self.field_size_x, self.field_size_y = self.header['field_size']
+        self.storage_x, self.storage_y = self.field_size_x // 2, self.field_size_y // 2
+        self.n_bots = self.header['n_bots']
+        self.keyframe_interval = self.header['keyframe_interval']
+        self.has_trails = self.header['has_trails']
+
+        shape = (self.field_size_x, self.field_size_y)
+        keyframe_fields = [('resources', '<i2', shape)]
+        if self.has_trails:
+            keyframe_fields.append(('trail_expiry', '<i4', shape))
+
+        # recordings from before the header named it used 16 bit positions
+        position = self.header.get('position_dtype', '<i2')
+        self._bots = self._memmap('bots', np.dtype((bot_dtype(position), self.n_bots)))
+        self._stats = self._memmap('stats', STATS_DTYPE)
+        self._keyframes = self._memmap('keyframes', np.dtype(keyframe_fields))
+        self._chunks = self._memmap('chunks', CHUNK_DTYPE)
+        self._deltas = self._memmap('deltas', np.dtype(np.uint8))
+
+        # only frames whose deltas are complete can be replayed
+        self.n_frames = min(len(self._stats), len(self._chunks) * self.keyframe_interval)
+
+        self.frame = -1
+        self._chunk_index = -1
+        self._chunk_deltas: Optional[List[List[np.ndarray]]] = None
+        self.resource_grid = np.zeros(shape, dtype = np.int16)
+        self.trail_expiry = np.zeros(shape, dtype = np.int32)
+        if self.n_frames:
+            self.seek(0)
+
+
+    def _memmap(self, name: str, dtype: np.dtype) -> np.ndarray:
+        path = self.path.joinpath(name + '.bin')
+        n = path.stat().st_size // dtype.itemsize
+        if n == 0:
+            return np.zeros(0, dtype = dtype)
+        return np.memmap(path, dtype = dtype, mode = 'r', shape = (n,))
+
+
+    def _load_chunk(self, chunk: int) -> List[List[np.ndarray]]:
+        """
+        Per frame resource and trail deltas of the frames after keyframe chunk
+        """
+        if chunk != self._chunk_index:
+            offset, length = self._chunks[chunk]
+            data = zlib.decompress(self._deltas[offset:offset + length].tobytes())
+            n = int(np.frombuffer(data, '<i4', 1)[0])
+            counts = np.frombuffer(data, '<i4', 2 * n, 4).reshape(2, n)
+
+            position = 4 + 8 * n
+            columns = []
+            for total, dtype in zip((counts[0].sum(), counts[0].sum(), counts[1].sum(), counts[1].sum()),
+                ('<u4', '<i4', '<u4', '<i4')):
+                columns.append(np.frombuffer(data, dtype, total, position))
+                position += 4 * total
+
+            res_splits = np.cumsum(counts[0])[:-1]
+            trail_splits = np.cumsum(counts[1])[:-1]
+            self._chunk_deltas = [np.split(columns[0], res_splits), np.split(columns[1], res_splits),
+                np.split(columns[2], trail_splits), np.split(columns[3], trail_splits)]
+            self._chunk_index = chunk
+
+        return self._chunk_deltas
+
+
+    def _apply(self, frame: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Apply the deltas of frame onto the grids of the frame before
+        returns the flat resource and trail cells that changed
+        """
+        chunk, i = divmod(frame, self.keyframe_interval)
+        res_cells, res_values, trail_cells, trail_values = (column[i - 1] for column in self._load_chunk(chunk))
+        self.resource_grid.ravel()[res_cells] = res_values
+        self.trail_expiry.ravel()[trail_cells] = trail_values
+        return res_cells, trail_cells
+
+
+    def _load_keyframe(self, keyframe: int) -> None:
+        """
+        Replace the grids by those of keyframe
+        """
+        self.resource_grid[:] = self._keyframes[keyframe // self.keyframe_interval]['resources']
+        if self.has_trails:
+            self.trail_expiry[:] = self._keyframes[keyframe // self.keyframe_interval]['trail_expiry']
+
+
+    def seek(self, frame: int) -> None:
+        """
+        Rebuild the state of frame
+        """
+        frame = int(np.clip(frame, 0, self.n_frames - 1))
+        keyframe = frame // self.keyframe_interval * self.keyframe_interval
+
+        start = self.frame + 1
+        if not keyframe <= self.frame <= frame:
+            self._load_keyframe(keyframe)
+            start = keyframe + 1
+
+        for i in range(start, frame + 1):
+            self._apply(i)
+        self.frame = frame
+
+        bots = self._bots[frame]
+        self.pos_x = bots['x'].astype(np.int64)
+        self.pos_y = bots['y'].astype(np.int64)
+        self.has_food = (bots['flags'] & FLAG_HAS_FOOD) != 0
+        self.leave_mark = (bots['flags'] & FLAG_LEAVE_MARK) != 0
+        self.tracking_on = (bots['flags'] & FLAG_TRACKING_ON) != 0
+        self.steps, self.stored_food, self.picked_food = (int(value) for value in self._stats[frame])
+
+
+    def simulate_step(self) -> None:
+        """
+        Advance the replay by one frame
+        """
+        if self.frame + 1 < self.n_frames:
+            self.seek(self.frame + 1)
+
+
+    @property
+    def trail_grid(self) -> np.ndarray:
+        return np.maximum(self.trail_expiry - self.steps, 0)
+
+    @property
+    def bots(self) -> List[BotView]:
+        return [BotView(self, i) for i in range(self.n_bots)]
+
+    @property
+    def bot_coordinates(self) -> Set[Tuple[int, int]]:
+        return set(zip(self.pos_x.tolist(), self.pos_y.tolist()))
+
+    @property
+    def resource_dict(self) -> Dict[Tuple[int, int], int]:
+        xs, ys = np.nonzero(self.resource_grid)
+        return dict(zip(zip(xs.tolist(), ys.tolist()), self.resource_grid[xs, ys].tolist()))
+
+    @property
+    def trails(self) -> Dict[Tuple[int, int], int]:
+        xs, ys = np.nonzero(self.trail_expiry > self.steps)
+        return dict(zip(zip(xs.tolist(), ys.tolist()), (self.trail_expiry[xs, ys] - self.steps).tolist()))
+
+
+def record(sim, path: Union[str, Path], steps: int, keyframe_interval: int = 100) -> None:
+    """
+    Simulate steps steps headless and record every frame
+    """
+    with TrajectoryRecorder(path, sim, keyframe_interval) as recorder:
+        recorder.record()
+        for _ in range(steps):
+            sim.simulate_step()
+            recorder.record()
+
+
+def main():
+    my_sim = VectorSimulation(field_size = (100, 100), n_bots = 10, p_resource = 0.1, resource_dist = (1, 0),
+        p_leave_trail = 1, p_follow_trail = 1, seed = 0)
+    my_sim.init_resources()
+    my_sim.patch_resources()
+    my_sim.init_bots()
+    record(my_sim, Path.cwd().parent.joinpath('results').joinpath('trajectory'), steps = 5_000)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import pytest
+
+from simulation.BaseSimulation import DummySim
+from simulation.PSimulation import ProbabilisticSimulation
+from simulation.KernelSimulation import KernelDummySim, KernelSimulation
+from simulation.TiledSimulation import TiledDummySim, TiledSimulation
+
+TRAILS = dict(p_leave_trail = 0.6, p_follow_trail = 0.5, trail_lifetime = 30)
+
+# engines that give the same run from a seed, the reference first
+ENGINES = [
+    ((DummySim, KernelDummySim, TiledDummySim), {}),
+    ((ProbabilisticSimulation, KernelSimulation, TiledSimulation), TRAILS),
+]
+
+# field size, bots, resource probability, tile size of the tiled engines
+WORLDS = [((40, 40), 60, 0.3, 8), ((90, 60), 80, 0.05, 16), ((30, 50), 80, 0.5, 64)]
+
+
+def state(sim):
+    """
+    Everything a seeded run has to agree on, read through the public views
+    """
+    bots = [(bot.pos_x, bot.pos_y, bool(bot.has_food), bool(bot.food_one_away)) for bot in sim.bots]
+    trails = sim.trails if hasattr(sim, 'trail_lifetime') else None
+    return (bots, sim.resource_dict, sim.bot_coordinates, trails, sim.stored_food, sim.picked_food, sim.steps,
+        sim.rng.bit_generator.state)
+
+
+def build(cls, world, seed, **kwargs):
+    field_size, n_bots, p_resource, tile_size = world
+    if issubclass(cls, TiledDummySim):
+        kwargs['tile_size'] = tile_size
+    sim = cls(field_size = field_size, n_bots = n_bots, p_resource = p_resource, resource_dist = (3, 2), seed = seed,
+        **kwargs)
+    sim.init_resources()
+    sim.init_bots()
+    return sim
+
+
+def assert_lockstep(sims, steps):
+    for step in range(steps):
+        reference = state(sims[0])
+        for sim in sims[1:]:
+            assert state(sim) == reference, f'{type(sim).__name__} diverged at step {step}'
+        for sim in sims:
+            sim.simulate_step()
+
+
+@pytest.mark.parametrize('seed, world', list(enumerate(WORLDS)))
+@pytest.mark.parametrize('engines, kwargs', ENGINES)
+def test_engines_step_in_lockstep(engines, kwargs, seed, world):
+    sims = [build(cls, world, seed, **kwargs) for cls in engines]
+
+    assert_lockstep(sims, 300)
+    assert sims[0].picked_food > 0
+
+
+@pytest.mark.parametrize('engines, kwargs', ENGINES)
+def test_engines_run_to_the_same_end(engines, kwargs):
+    sims = [build(cls, WORLDS[0], 3, **kwargs) for cls in engines]
+
+    stored = [sim.run(2000) for sim in sims]
+
+    assert len(set(stored)) == 1
+    for sim in sims[1:]:
+        assert state(sim) == state(sims[0])
+
+
+@pytest.mark.parametrize('cls, kwargs', [(KernelDummySim, {}), (KernelSimulation, TRAILS)])
+def test_compiled_kernel_matches_the_fallback(cls, kwargs, monkeypatch):
+    pytest.importorskip('numba')
+    import simulation.KernelSimulation as kernel
+
+    compiled = build(cls, WORLDS[0], 0, **kwargs)
+    states = []
+    for _ in range(200):
+        states.append(state(compiled))
+        compiled.simulate_step()
+
+    # the plain Python loop the kernel was compiled from
+    monkeypatch.setattr(kernel, 'step_bots', kernel.step_bots.py_func)
+    fallback = build(cls, WORLDS[0], 0, **kwargs)
+    for step in range(200):
+        assert state(fallback) == states[step], f'diverged at step {step}'
+        fallback.simulate_step()
+
+
+@pytest.mark.parametrize('seed, world', list(enumerate(WORLDS)))
+def test_tiles_mirror_their_neighbours(seed, world):
+    sim = build(TiledSimulation, world, seed, **TRAILS)
+    for _ in range(200):
+        sim.simulate_step()
+
+    for (tx, ty), view in sim.tiles.items():
+        for name in ('resource_grid', 'bot_grid'):
+            grid = getattr(view, name).copy()
+            sim._fill_pad(tx, ty, (name,))
+            assert (getattr(view, name) == grid).all(), f'{name} pad of tile {tx, ty}'
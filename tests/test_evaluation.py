@@ -0,0 +1,49 @@
+import numpy as np
+
+from evaluation import ParallelEvaluator, run_simulation
+from fitness_cache import FitnessCache
+
+SCENARIO = dict(field_size = (30, 30), n_bots = 5, p_resource = 0.1, resource_dist = (2, 1), steps = 300)
+X = np.array([[0.2, 0.8], [0.9, 0.1], [0.5, 0.5]])
+
+
+def test_pool_gives_the_results_of_the_plain_runs():
+    with ParallelEvaluator(n_workers = 2, seed = 1) as evaluator:
+        seeds = evaluator._spawn_seeds(len(X))
+    with ParallelEvaluator(n_workers = 2, seed = 1) as evaluator:
+        stored_food = evaluator.evaluate(X, **SCENARIO)
+
+    assert stored_food.tolist() == [run_simulation(x, seed, **SCENARIO) for x, seed in zip(X, seeds)]
+
+
+def test_defaults_given_explicitly_hit_the_same_cache_entries(tmp_path):
+    cache = FitnessCache(tmp_path.joinpath('cache.sqlite'))
+    scenario = {name: value for name, value in SCENARIO.items() if name != 'steps'}
+    with ParallelEvaluator(n_workers = 1, seed = 1, common_random_numbers = True, cache = cache) as evaluator:
+        first = evaluator.evaluate(X, **scenario)
+        again = evaluator.evaluate(X, steps = 5_000, patch = False, **scenario)
+
+    assert again.tolist() == first.tolist()
+    assert (cache.hits, cache.misses) == (len(X), len(X))
+    cache.close()
+
+
+def test_common_random_numbers_score_every_candidate_on_the_same_worlds():
+    candidates = np.repeat(X[:1], 4, axis = 0)
+    with ParallelEvaluator(n_workers = 1, seed = 1, common_random_numbers = True, n_replications = 3) as evaluator:
+        seeds = evaluator.common_seeds
+        stored_food = evaluator.evaluate(candidates, **SCENARIO)
+        again = evaluator.evaluate(candidates[:2], **SCENARIO)
+
+    expected = np.mean([run_simulation(X[0], seed, **SCENARIO) for seed in seeds])
+    assert len(set(seeds)) == 3
+    assert stored_food.tolist() == [expected] * 4
+    assert again.tolist() == [expected] * 2
+
+
+def test_independent_seeds_differ_across_candidates():
+    candidates = np.repeat(X[:1], 8, axis = 0)
+    with ParallelEvaluator(n_workers = 1, seed = 1) as evaluator:
+        stored_food = evaluator.evaluate(candidates, **SCENARIO)
+
+    assert len(set(stored_food.tolist())) > 1
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+import fitness_cache
+from fitness_cache import FitnessCache, config_key
+from simulation.PSimulation import ProbabilisticSimulation
+
+CONFIG = {'x': np.array([0.25, 0.75]), 'seed': np.int64(7), 'sim_class': ProbabilisticSimulation, 'steps': 100}
+
+
+def test_config_key_is_canonical():
+    same = {'steps': 100, 'sim_class': 'ProbabilisticSimulation', 'seed': 7, 'x': [0.25, 0.75]}
+
+    assert config_key(CONFIG) == config_key(same)
+    assert config_key(CONFIG) != config_key({**CONFIG, 'seed': 8})
+    with pytest.raises(TypeError):
+        config_key({**CONFIG, 'cache': object()})
+
+
+def test_hit_and_miss(tmp_path):
+    cache = FitnessCache(tmp_path.joinpath('fitness.sqlite'))
+
+    assert cache.get(CONFIG) is None
+    cache.put(CONFIG, 12)
+    assert cache.get(CONFIG) == 12
+    assert cache.get({**CONFIG, 'steps': 200}) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.close()
+
+    reopened = FitnessCache(tmp_path.joinpath('fitness.sqlite'))
+    assert reopened.get(CONFIG) == 12
+    reopened.close()
+
+
+def test_key_version_bump_misses(tmp_path, monkeypatch):
+    cache = FitnessCache(tmp_path.joinpath('fitness.sqlite'))
+    cache.put(CONFIG, 12)
+
+    monkeypatch.setattr(fitness_cache, 'KEY_VERSION', fitness_cache.KEY_VERSION + 1)
+    assert cache.get(CONFIG) is None
+    cache.put(CONFIG, 13)
+    assert cache.get(CONFIG) == 13
+
+    monkeypatch.undo()
+    assert cache.get(CONFIG) == 12
+    cache.close()
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = FitnessCache(tmp_path.joinpath('fitness.sqlite'), max_entries = 2)
+    configs = [{**CONFIG, 'seed': seed} for seed in range(3)]
+
+    cache.put(configs[0], 0)
+    cache.put(configs[1], 1)
+    cache.get(configs[0])
+    cache.put(configs[2], 2)
+
+    assert len(cache) == 2
+    assert cache.get(configs[1]) is None
+    assert cache.get(configs[0]) == 0
+    assert cache.get(configs[2]) == 2
+    cache.close()
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from simulation.BaseSimulation import DummySim, food_field
+from simulation.PSimulation import ProbabilisticSimulation
+from simulation.KernelSimulation import KernelDummySim, KernelSimulation
+from simulation.TiledSimulation import TiledDummySim, TiledSimulation
+
+TRAILS = dict(p_leave_trail = 0.6, p_follow_trail = 0.5, trail_lifetime = 30)
+
+
+def food_fields(sim):
+    """
+    Pairs of the maintained food field and one rebuilt from the resources
+    """
+    if isinstance(sim, TiledDummySim):
+        return [(view.food_field, food_field(view.resource_grid)) for view in sim.tiles.values()]
+    return [(sim._food_field, food_field(sim._resource_grid))]
+
+
+@pytest.mark.parametrize('cls, kwargs', [(DummySim, {}), (KernelDummySim, {}), (TiledDummySim, {'tile_size': 8}),
+    (ProbabilisticSimulation, TRAILS), (KernelSimulation, TRAILS), (TiledSimulation, {**TRAILS, 'tile_size': 8})])
+def test_food_field_follows_the_resources(cls, kwargs):
+    sim = cls(field_size = (40, 40), n_bots = 60, p_resource = 0.3, resource_dist = (1, 1), seed = 0, **kwargs)
+    sim.init_resources()
+    sim.init_bots()
+    food = sim.resources_left()
+
+    for step in range(400):
+        sim.simulate_step()
+        if step % 20 == 0:
+            for maintained, rebuilt in food_fields(sim):
+                assert np.array_equal(maintained, rebuilt), f'step {step}'
+
+    assert sim.resources_left() < food - 50
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from simulation.PSimulation import ProbabilisticSimulation
+from simulation.KernelSimulation import KernelSimulation
+from simulation.TiledSimulation import TiledSimulation
+from simulation.VectorSimulation import VectorSimulation
+from heatmap import CellRecorder, DensityPyramid
+from trajectory import TrajectoryReader, record
+
+FIELD = (61, 45)
+
+
+def build(cls, **kwargs):
+    sim = cls(field_size = FIELD, n_bots = 30, p_resource = 0.1, resource_dist = (3, 1), p_leave_trail = 0.5,
+        p_follow_trail = 0.5, trail_lifetime = 20, seed = 3, **kwargs)
+    sim.init_resources()
+    sim.init_bots()
+    return sim
+
+
+def assert_rebuilt(pyramid, sim):
+    """
+    Every level of pyramid equals that of a pyramid built from scratch
+    """
+    scratch = DensityPyramid(*FIELD)
+    scratch.update(sim)
+    for name in ('bots', 'resources', 'trails'):
+        for k, (level, expected) in enumerate(zip(getattr(pyramid, name), getattr(scratch, name))):
+            assert (level == expected).all(), f'{name} level {k}'
+
+
+@pytest.mark.parametrize('cls, kwargs', [
+    (ProbabilisticSimulation, {}),
+    (KernelSimulation, {}),
+    (VectorSimulation, {}),
+    (TiledSimulation, dict(tile_size = 16)),
+])
+@pytest.mark.parametrize('recorded', [True, False])
+def test_incremental_pyramid_equals_a_rebuild(cls, kwargs, recorded):
+    sim = build(cls, **kwargs)
+    pyramid = DensityPyramid(*FIELD)
+    recorder = CellRecorder(sim) if recorded else None
+    if recorded:
+        # the recorded cells alone have to be enough
+        pyramid._changed = None
+
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        for _ in range(rng.integers(1, 15)):
+            sim.simulate_step()
+        pyramid.update(sim, recorder)
+        assert_rebuilt(pyramid, sim)
+    assert sim.steps > 200
+
+
+def test_replay_pyramid_follows_seeks(tmp_path):
+    record(build(ProbabilisticSimulation), tmp_path, 400, keyframe_interval = 50)
+    reader = TrajectoryReader(tmp_path)
+    pyramid = DensityPyramid(*FIELD)
+    recorder = CellRecorder(reader)
+
+    for frame in list(range(0, 300, 7)) + [120, 40, 390, 391, 392, 10]:
+        reader.seek(frame)
+        pyramid.update(reader, recorder)
+        assert_rebuilt(pyramid, reader)
+    for _ in range(30):
+        reader.simulate_step()
+        pyramid.update(reader, recorder)
+        assert_rebuilt(pyramid, reader)
+
+
+def test_removed_recorder_leaves_the_plain_methods():
+    sim = build(ProbabilisticSimulation)
+    recorder = CellRecorder(sim)
+    recorder.remove()
+
+    assert 'take_food' not in vars(sim) and 'leave_trails' not in vars(sim)
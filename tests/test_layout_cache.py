@@ -0,0 +1,54 @@
+import os
+import numpy as np
+
+from simulation.LayoutCache import LayoutCache
+
+
+def layout(seed):
+    rng = np.random.default_rng(seed)
+    grid = rng.integers(0, 3, size = (20, 20))
+    return rng, grid
+
+
+def test_stored_layout_is_found_again(tmp_path):
+    cache = LayoutCache(tmp_path)
+    rng, grid = layout(0)
+    key = cache.key(rng, grid, 'kmeans', 10)
+
+    assert cache.get(key) is None
+    cache.put(key, grid, rng)
+    xs, ys, amounts, rng_state = cache.get(key)
+
+    restored = np.zeros_like(grid)
+    restored[xs, ys] = amounts
+    assert (restored == grid).all()
+    assert rng_state == rng.bit_generator.state
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_layouts_are_evicted(tmp_path):
+    cache = LayoutCache(tmp_path, max_entries = 2)
+    keys = []
+    for seed in range(3):
+        rng, grid = layout(seed)
+        keys.append(cache.key(rng, grid, 'kmeans', 10))
+        cache.put(keys[-1], grid, rng)
+        # files written in the same clock tick would tie, the older ones are backdated
+        os.utime(tmp_path.joinpath(keys[-1] + '.npz'), ns = (seed, seed))
+
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) is not None
+
+
+def test_layout_removed_by_another_process_is_a_miss(tmp_path):
+    cache = LayoutCache(tmp_path)
+    rng, grid = layout(0)
+    key = cache.key(rng, grid, 'kmeans', 10)
+    cache.put(key, grid, rng)
+
+    tmp_path.joinpath(key + '.npz').unlink()
+    assert cache.get(key) is None
+
+    tmp_path.joinpath(key + '.npz').write_bytes(b'not a layout')
+    assert cache.get(key) is None
+    assert cache.misses == 2
@@ -0,0 +1,79 @@
+import pytest
+
+from simulation.PSimulation import ProbabilisticSimulation
+from simulation.KernelSimulation import KernelSimulation
+from simulation.VectorSimulation import VectorSimulation
+from simulation.Profiler import PROFILE_SCHEMA
+from heatmap import CellRecorder
+from results_sink import ResultsSink, read_results
+
+
+def build(cls):
+    sim = cls(field_size = (40, 40), n_bots = 20, p_resource = 0.2, resource_dist = (3, 1), p_leave_trail = 0.6,
+        p_follow_trail = 0.5, trail_lifetime = 30, seed = 0)
+    sim.init_resources()
+    sim.init_bots()
+    return sim
+
+
+@pytest.mark.parametrize('cls', [ProbabilisticSimulation, KernelSimulation, VectorSimulation])
+def test_profiled_run_equals_the_plain_run(cls):
+    plain, profiled = build(cls), build(cls)
+    profiler = profiled.enable_profiling()
+    for _ in range(100):
+        plain.simulate_step()
+        profiled.simulate_step()
+
+    assert profiled.disable_profiling() is profiler
+    assert profiled.bot_coordinates == plain.bot_coordinates and profiled.stored_food == plain.stored_food
+    summary = profiler.summary()
+    assert summary['steps'] == 100 and 'simulate_step' in summary['phases']
+    assert not {'simulate_step', 'take_food', 'leave_trails'} & set(vars(profiled))
+
+
+def test_profiler_rows_follow_the_schema(tmp_path):
+    sim = build(ProbabilisticSimulation)
+    profiler = sim.enable_profiling()
+    for _ in range(20):
+        sim.simulate_step()
+    sim.disable_profiling()
+
+    sink = ResultsSink(tmp_path.joinpath('profile'), format = 'csv', schema = PROFILE_SCHEMA)
+    profiler.dump(sink, run = 1, sim_class = 'ProbabilisticSimulation')
+    sink.close()
+
+    rows = read_results(sink.path, schema = PROFILE_SCHEMA)
+    assert list(rows) == list(PROFILE_SCHEMA)
+    assert set(rows['kind']) == {'phase', 'counter'}
+    assert set(rows['name'][rows['kind'] == 'phase']) >= {'simulate_step', 'take_food', 'update_env'}
+
+
+@pytest.mark.parametrize('profiler_first', [True, False])
+@pytest.mark.parametrize('remove_profiler_first', [True, False])
+def test_profiler_and_recorder_remove_in_any_order(profiler_first, remove_profiler_first):
+    sim = build(ProbabilisticSimulation)
+    if profiler_first:
+        profiler = sim.enable_profiling()
+        recorder = CellRecorder(sim)
+    else:
+        recorder = CellRecorder(sim)
+        profiler = sim.enable_profiling()
+
+    if remove_profiler_first:
+        sim.disable_profiling()
+    else:
+        recorder.remove()
+    calls = profiler.calls['take_food']
+    for _ in range(100):
+        sim.simulate_step()
+
+    # the one still attached keeps working
+    if remove_profiler_first:
+        assert profiler.calls['take_food'] == calls
+        assert recorder.drain()[0].size > 0
+        recorder.remove()
+    else:
+        assert profiler.calls['take_food'] > calls
+        assert recorder.drain()[0].size == 0
+        sim.disable_profiling()
+    assert not {'simulate_step', 'take_food', 'leave_trails'} & set(vars(sim))
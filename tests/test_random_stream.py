@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from simulation.RandomStream import RandomStream
+
+
+def draws(source, kinds):
+    return [source.random() if n is None else int(source.integers(n)) for n in kinds]
+
+
+@pytest.mark.parametrize('block_size', [1, 3, 64, 4096])
+def test_stream_matches_generator(block_size):
+    kinds = np.random.default_rng(0).choice([None, 1, 2, 3, 4, 7, 1000, 2**31 + 5, 2**32 - 1], 2000).tolist()
+    stream = RandomStream(np.random.default_rng(42), block_size)
+    rng = np.random.default_rng(42)
+
+    assert draws(stream, kinds) == draws(rng, kinds)
+
+
+@pytest.mark.parametrize('block_size', [1, 5, 4096])
+def test_sync_hands_back_the_generator(block_size):
+    stream = RandomStream(np.random.default_rng(7), block_size)
+    rng = np.random.default_rng(7)
+
+    for i in range(50):
+        # odd counts of 32 bit draws leave half a word buffered across the sync
+        kinds = [3] * (i % 4) + [None] * (i % 3) + [5] * (i % 5)
+        assert draws(stream, kinds) == draws(rng, kinds)
+        stream.sync()
+        assert stream.rng.bit_generator.state == rng.bit_generator.state
+        assert stream.rng.integers(9, size = i % 3).tolist() == rng.integers(9, size = i % 3).tolist()
+        assert stream.rng.random() == rng.random()
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from simulation.BaseSimulation import DummySim, sample_resources
+from simulation.PSimulation import ProbabilisticSimulation
+from simulation.KernelSimulation import KernelSimulation
+from simulation.TiledSimulation import TiledSimulation
+from simulation.VectorSimulation import EnsembleSimulation
+
+TRAILS = dict(p_leave_trail = 0.5, p_follow_trail = 0.5)
+
+
+def in_center_zone(xs, ys, field_size):
+    size_x, size_y = field_size
+    return ((abs(xs - size_x // 2 + 0.5) < size_x // 10) & (abs(ys - size_y // 2 + 0.5) < size_y // 10))
+
+
+@pytest.mark.parametrize('field_size, p_resource', [((200, 300), 0.02), ((50, 50), 0.5), ((7, 400), 0.1)])
+def test_sampled_cells_follow_p_resource(field_size, p_resource):
+    xs, ys, amounts = sample_resources(np.random.default_rng(0), field_size, p_resource, (4, 0))
+
+    cells = xs * field_size[1] + ys
+    assert (np.diff(cells) > 0).all()
+    assert ((xs >= 0) & (xs < field_size[0]) & (ys >= 0) & (ys < field_size[1])).all()
+    assert not in_center_zone(xs, ys, field_size).any()
+
+    all_x, all_y = np.divmod(np.arange(field_size[0] * field_size[1]), field_size[1])
+    n_free = (~in_center_zone(all_x, all_y, field_size)).sum()
+    assert abs(xs.size - n_free * p_resource) < 5 * np.sqrt(n_free * p_resource * (1 - p_resource))
+    assert (amounts == 4).all()
+
+
+def test_sampling_edge_probabilities():
+    rng = np.random.default_rng(0)
+    assert sample_resources(rng, (20, 20), 0, (1, 0))[0].size == 0
+
+    xs, ys, _ = sample_resources(rng, (20, 20), 1, (1, 0))
+    assert xs.size == 400 - 4 * 4
+    assert (xs * 20 + ys == np.sort(xs * 20 + ys)).all()
+
+
+def test_seeded_layout_is_reproducible():
+    layouts = [sample_resources(np.random.default_rng(3), (300, 300), 0.01, (10, 3)) for _ in range(2)]
+    assert all((a == b).all() for a, b in zip(*layouts))
+
+
+def test_engines_lay_out_the_same_resources():
+    layouts = []
+    for cls, kwargs in [(DummySim, {}), (ProbabilisticSimulation, TRAILS), (KernelSimulation, TRAILS),
+        (TiledSimulation, {**TRAILS, 'tile_size': 16})]:
+        sim = cls(field_size = (60, 40), n_bots = 5, p_resource = 0.1, resource_dist = (2, 3), seed = 5, **kwargs)
+        sim.init_resources()
+        layouts.append(sim.resource_dict)
+    ensemble = EnsembleSimulation((60, 40), 5, 0.1, (2, 3), [[0.5, 0.5], [0.1, 0.9]], seed = 5)
+    ensemble.init_resources()
+    xs, ys = np.nonzero(ensemble.resource_grid[0])
+    layouts.append(dict(zip(zip(xs.tolist(), ys.tolist()), ensemble.resource_grid[0][xs, ys].tolist())))
+
+    assert all(layout == layouts[0] for layout in layouts)
+    assert min(layouts[0].values()) >= 1
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from results_sink import RESULTS_SCHEMA, ResultsSink, read_results
+
+
+def test_rows_are_read_back_with_the_context(tmp_path):
+    sink = ResultsSink(tmp_path.joinpath('results'), format = 'csv', buffer_size = 2)
+    sink.set_context(run = 3, optim_alg = 'pso')
+    for i in range(5):
+        sink.write(p_leave = i / 10, p_follow = 0.5, cost = 10 * i)
+    sink.close()
+
+    results = read_results(sink.path)
+    assert list(results) == list(RESULTS_SCHEMA)
+    assert results['cost'].tolist() == [0, 10, 20, 30, 40]
+    assert set(results['optim_alg']) == {'pso'} and set(results['run']) == {3}
+    assert np.isnan(results['pso_steps']).all()
+
+
+def test_unknown_columns_are_rejected(tmp_path):
+    sink = ResultsSink(tmp_path.joinpath('results'), format = 'csv')
+    with pytest.raises(KeyError):
+        sink.write(unknown = 1)
+
+
+@pytest.mark.parametrize('content', ['', ','.join(RESULTS_SCHEMA) + '\n'])
+def test_empty_results_read_as_empty_columns(tmp_path, content):
+    path = tmp_path.joinpath('results.csv')
+    path.write_text(content)
+
+    results = read_results(path)
+    assert list(results) == list(RESULTS_SCHEMA)
+    assert all(len(column) == 0 for column in results.values())
@@ -0,0 +1,67 @@
+import pytest
+
+from simulation.BaseSimulation import DummySim
+from simulation.PSimulation import ProbabilisticSimulation
+from simulation.KernelSimulation import KernelDummySim, KernelSimulation
+from simulation.VectorSimulation import EnsembleSimulation
+
+TRAILS = dict(p_leave_trail = 0.5, p_follow_trail = 0.5)
+ENGINES = [(DummySim, {}), (KernelDummySim, {}), (ProbabilisticSimulation, TRAILS), (KernelSimulation, TRAILS)]
+
+
+def build(cls, seed, n_bots, field_size = (15, 15), **kwargs):
+    sim = cls(field_size = field_size, n_bots = n_bots, p_resource = 0.05, resource_dist = (1, 0), seed = seed,
+        **kwargs)
+    sim.init_resources()
+    sim.init_bots()
+    return sim
+
+
+@pytest.mark.parametrize('cls, kwargs', ENGINES)
+def test_run_stores_what_every_step_would(cls, kwargs):
+    for seed in range(8):
+        stepped = build(cls, seed, 4, (21, 21), **kwargs)
+        for _ in range(2000):
+            stepped.simulate_step()
+        run = build(cls, seed, 4, (21, 21), **kwargs)
+
+        assert run.run(2000) == stepped.stored_food
+        assert run.steps <= 2000
+
+
+def test_ensemble_run_stores_what_every_step_would():
+    params = [[0.5, 0.5], [0.0, 1.0], [1.0, 0.0]]
+    stepped = EnsembleSimulation((21, 21), 4, 0.05, (1, 0), params, seed = 0)
+    run = EnsembleSimulation((21, 21), 4, 0.05, (1, 0), params, seed = 0)
+    for sim in (stepped, run):
+        sim.init_resources()
+        sim.init_bots()
+    for _ in range(2000):
+        stepped.simulate_step()
+
+    assert run.run(2000).tolist() == stepped.stored_food.tolist()
+    assert run.steps < 2000
+
+
+@pytest.mark.parametrize('cls, kwargs', ENGINES)
+@pytest.mark.parametrize('steps_left', [3, 10, 400])
+def test_fast_forward_home_matches_stepping(cls, kwargs, steps_left, tmp_path):
+    fast_forwards = 0
+    for seed in range(30):
+        sim = build(cls, seed, 1, **kwargs)
+        food = sim.resources_left()
+        # step until the last unit is picked up and on its way home
+        while sim.steps < 3000 and not sim.stored_food < sim.picked_food == food:
+            sim.simulate_step()
+        if sim.steps == 3000:
+            continue
+
+        sim.snapshot(tmp_path.joinpath('exhausted.npz'))
+        forwarded = cls.restore(tmp_path.joinpath('exhausted.npz'))
+        assert forwarded.fast_forward_home(steps_left)
+        fast_forwards += 1
+        for _ in range(steps_left):
+            sim.simulate_step()
+        assert forwarded.stored_food == sim.stored_food, f'seed {seed}'
+
+    assert fast_forwards > 20
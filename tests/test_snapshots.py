@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from simulation.BaseSimulation import DummySim
+from simulation.PSimulation import ProbabilisticSimulation
+from simulation.KernelSimulation import KernelDummySim, KernelSimulation
+from simulation.TiledSimulation import TiledDummySim, TiledSimulation
+from simulation.VectorSimulation import EnsembleSimulation, VectorSimulation
+
+TRAILS = dict(p_leave_trail = 0.6, p_follow_trail = 0.5, trail_lifetime = 30)
+
+SIMULATIONS = {
+    DummySim: {},
+    KernelDummySim: {},
+    TiledDummySim: dict(tile_size = 16),
+    ProbabilisticSimulation: TRAILS,
+    KernelSimulation: TRAILS,
+    TiledSimulation: dict(TRAILS, tile_size = 16),
+    VectorSimulation: TRAILS,
+}
+
+
+def build(cls, seed = 1):
+    if cls is EnsembleSimulation:
+        sim = cls(field_size = (50, 40), n_bots = 30, p_resource = 0.2, resource_dist = (3, 2),
+            params = [[0.6, 0.5], [0.2, 0.9], [1.0, 0.0]], trail_lifetime = 30, seed = seed)
+    else:
+        sim = cls(field_size = (50, 40), n_bots = 30, p_resource = 0.2, resource_dist = (3, 2), seed = seed,
+            **SIMULATIONS[cls])
+    sim.init_resources()
+    sim.init_bots()
+    return sim
+
+
+def saved(sim, path):
+    """
+    Arrays of a snapshot of sim
+    """
+    sim.snapshot(path)
+    with np.load(path) as state:
+        return {name: state[name] for name in state.files}
+
+
+def assert_same(a, b):
+    assert a.keys() == b.keys()
+    for name in a:
+        np.testing.assert_array_equal(a[name], b[name], err_msg = name)
+
+
+@pytest.mark.parametrize('cls', list(SIMULATIONS) + [EnsembleSimulation])
+def test_restored_run_continues_the_original(cls, tmp_path):
+    sim = build(cls)
+    for _ in range(150):
+        sim.simulate_step()
+
+    before = saved(sim, tmp_path.joinpath('before.npz'))
+    restored = cls.restore(tmp_path.joinpath('before.npz'))
+    assert_same(saved(restored, tmp_path.joinpath('restored.npz')), before)
+
+    for _ in range(150):
+        sim.simulate_step()
+        restored.simulate_step()
+    assert_same(saved(restored, tmp_path.joinpath('restored.npz')), saved(sim, tmp_path.joinpath('after.npz')))
+
+
+@pytest.mark.parametrize('source, target', [
+    (DummySim, KernelDummySim),
+    (KernelDummySim, DummySim),
+    (ProbabilisticSimulation, KernelSimulation),
+    (KernelSimulation, ProbabilisticSimulation),
+])
+def test_dense_and_kernel_restore_each_other(source, target, tmp_path):
+    sim = build(source)
+    for _ in range(150):
+        sim.simulate_step()
+    sim.snapshot(tmp_path.joinpath('source.npz'))
+
+    restored = target.restore(tmp_path.joinpath('source.npz'))
+    for _ in range(150):
+        sim.simulate_step()
+        restored.simulate_step()
+    assert_same(saved(restored, tmp_path.joinpath('target.npz')), saved(sim, tmp_path.joinpath('source.npz')))
+
+
+def test_reseeded_restore_forks_the_world(tmp_path):
+    sim = build(ProbabilisticSimulation)
+    for _ in range(20):
+        sim.simulate_step()
+    sim.snapshot(tmp_path.joinpath('fork.npz'))
+
+    forks = [ProbabilisticSimulation.restore(tmp_path.joinpath('fork.npz'), seed = seed) for seed in (5, 5, 6)]
+    assert forks[0].resource_dict == sim.resource_dict
+    for fork in forks:
+        for _ in range(30):
+            fork.simulate_step()
+    paths = [[(bot.pos_x, bot.pos_y) for bot in fork.bots] for fork in forks]
+    assert paths[0] == paths[1]
+    assert paths[0] != paths[2]
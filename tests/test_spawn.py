@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from simulation.BaseSimulation import DummySim, spawn_cells
+from simulation.PSimulation import ProbabilisticSimulation
+
+
+@pytest.mark.parametrize('field_size, n_bots', [((100, 100), 10), ((50, 50), 300), ((20, 20), 81)])
+def test_bots_spawn_on_distinct_cells_of_the_window(field_size, n_bots):
+    xs, ys = spawn_cells(np.random.default_rng(0), field_size, n_bots)
+
+    assert len(set(zip(xs.tolist(), ys.tolist()))) == n_bots
+    for cells, size in ((xs, field_size[0]), (ys, field_size[1])):
+        assert (abs(cells - size // 2) <= size // 5).all()
+
+
+def test_a_full_window_takes_every_cell():
+    xs, ys = spawn_cells(np.random.default_rng(0), (20, 20), 81)
+
+    assert sorted(zip(xs.tolist(), ys.tolist())) == [(x, y) for x in range(6, 15) for y in range(6, 15)]
+    with pytest.raises(ValueError):
+        spawn_cells(np.random.default_rng(0), (20, 20), 82)
+
+
+def test_seeded_spawn_is_reproducible():
+    first, again = (spawn_cells(np.random.default_rng(4), (300, 300), 1000) for _ in range(2))
+
+    assert (first[0] == again[0]).all() and (first[1] == again[1]).all()
+
+
+@pytest.mark.parametrize('cls, kwargs', [(DummySim, {}),
+    (ProbabilisticSimulation, dict(p_leave_trail = 0.5, p_follow_trail = 0.5))])
+def test_init_bots_marks_every_bot(cls, kwargs):
+    sim = cls(field_size = (40, 40), n_bots = 50, p_resource = 0.1, resource_dist = (1, 0), seed = 2, **kwargs)
+    sim.init_resources()
+    sim.init_bots()
+
+    cells = {(bot.pos_x, bot.pos_y) for bot in sim.bots}
+    assert len(cells) == 50
+    xs, ys = np.nonzero(sim.bot_grid)
+    assert set(zip(xs.tolist(), ys.tolist())) == cells
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from simulation.PSimulation import ProbabilisticSimulation
+from simulation.TiledSimulation import TiledSimulation
+from trajectory import TrajectoryReader, TrajectoryRecorder, bot_dtype, bot_state, position_dtype, record
+
+TRAILS = dict(p_leave_trail = 0.6, p_follow_trail = 0.5, trail_lifetime = 30)
+
+
+def build(field_size, n_bots, cls = ProbabilisticSimulation, **kwargs):
+    sim = cls(field_size = field_size, n_bots = n_bots, p_resource = 0.1, resource_dist = (3, 2), seed = 0,
+        **TRAILS, **kwargs)
+    sim.init_resources()
+    sim.init_bots()
+    return sim
+
+
+def frames(sim, steps):
+    states = []
+    for _ in range(steps + 1):
+        states.append((*(np.array(values) for values in bot_state(sim)), np.array(sim.resource_grid),
+            np.array(sim.trail_expiry), sim.stored_food))
+        sim.simulate_step()
+    return states
+
+
+def assert_frame(reader, expected):
+    pos_x, pos_y, flags, resources, trails, stored_food = expected
+    assert (bot_state(reader)[0] == pos_x).all() and (bot_state(reader)[1] == pos_y).all()
+    assert (bot_state(reader)[2] == flags).all()
+    assert (reader.resource_grid == resources).all() and (reader.trail_expiry == trails).all()
+    assert reader.stored_food == stored_food
+
+
+def test_replay_seeks_to_every_recorded_frame(tmp_path):
+    record(build((40, 30), 20), tmp_path, 120, keyframe_interval = 16)
+    expected = frames(build((40, 30), 20), 120)
+
+    reader = TrajectoryReader(tmp_path)
+    assert reader.n_frames == 121
+    for frame in list(range(121)) + [100, 3, 64, 65, 17, 120, 0]:
+        reader.seek(frame)
+        assert_frame(reader, expected[frame])
+
+
+def test_positions_past_16_bits_are_kept():
+    assert position_dtype((32768, 10)) == '<i2'
+    assert position_dtype((10, 32769)) == '<i4'
+
+    bots = np.zeros(2, dtype = bot_dtype(position_dtype((70_000, 70_000))))
+    bots['x'], bots['y'] = [69_999, 40_000], [32_768, 0]
+    assert bots['x'].tolist() == [69_999, 40_000] and bots['y'].tolist() == [32_768, 0]
+
+
+def test_header_names_the_position_dtype(tmp_path):
+    record(build((40, 30), 5), tmp_path, 3)
+
+    assert TrajectoryReader(tmp_path).header['position_dtype'] == '<i2'
+
+
+def test_tiled_simulations_are_rejected(tmp_path):
+    with pytest.raises(TypeError):
+        TrajectoryRecorder(tmp_path, build((40, 30), 5, TiledSimulation))
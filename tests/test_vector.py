@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from simulation.PSimulation import ProbabilisticSimulation
+from simulation.VectorSimulation import VectorSimulation
+
+
+def build(cls, seed, p_leave_trail, p_follow_trail):
+    sim = cls(field_size = (30, 30), n_bots = 8, p_resource = 0.1, resource_dist = (2, 1),
+        p_leave_trail = p_leave_trail, p_follow_trail = p_follow_trail, trail_lifetime = 30, seed = seed)
+    sim.init_resources()
+    sim.init_bots()
+    return sim
+
+
+def test_same_seed_gives_the_same_world():
+    a, b = build(ProbabilisticSimulation, 3, 0.5, 0.5), build(VectorSimulation, 3, 0.5, 0.5)
+
+    assert a.resource_dict == b.resource_dict
+    assert a.bot_coordinates == b.bot_coordinates
+
+
+@pytest.mark.parametrize('p_leave_trail, p_follow_trail', [(0.0, 0.0), (0.5, 0.5), (1.0, 1.0)])
+def test_stored_food_matches_the_bot_objects(p_leave_trail, p_follow_trail):
+    # the engines draw their random numbers in a different order, only the statistics agree
+    stored = {cls: np.array([build(cls, seed, p_leave_trail, p_follow_trail).run(400) for seed in range(30)])
+        for cls in (ProbabilisticSimulation, VectorSimulation)}
+
+    a, b = stored[ProbabilisticSimulation], stored[VectorSimulation]
+    standard_error = np.sqrt(a.var() / a.size + b.var() / b.size)
+    assert a.mean() > 0
+    assert abs(a.mean() - b.mean()) < 4 * standard_error